@@ -0,0 +1,226 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from estado_local import TravaExecucao
+from configuracao import env_float, env_int
+from log import configurar_logger
+
+log = configurar_logger()
+
+# =================================================================
+# ACERVO LOCAL DOS ÚLTIMOS BACKUPS
+# =================================================================
+# Depois do upload, o arquivo compactado (já validado pelo restore e conferido
+# no FTP) é movido para o acervo em vez de ser apagado. Assim um restore urgente
+# ou um reenvio para o FTP usa a cópia de horas atrás, sem rodar outro backup:
+#
+#   Backup_Mercosistem.exe --acervo                  -> lista as cópias guardadas
+#   Backup_Mercosistem.exe --reenviar LOJA01         -> sobe de novo a última cópia
+#   Backup_Mercosistem.exe --restaurar LOJA01 --destino D:\RESTAURADO
+#
+# O índice (acervo/indice.json) guarda base, arquivo, tamanho, SHA-256 e o
+# manifesto enviado ao FTP. A retenção roda a cada execução e a cada cópia nova:
+#
+#   ACERVO_PASTA=backup_Acervo     -> fora da backup_Restore (não entra na conta dos temporários)
+#   ACERVO_LIMITE_GB=0        -> espaço máximo do acervo (0 = desligado, apaga após o upload)
+#   ACERVO_COPIAS_POR_BASE=2  -> cópias mais recentes mantidas de cada base
+#   ACERVO_DIAS=7             -> cópias mais antigas que isso são apagadas
+#
+# Acima do limite, sai primeiro a cópia usada há mais tempo (a última cópia de
+# cada base só sai se não houver outra opção).
+# No mesmo disco da backup_Restore, a parte do limite ainda não usada é
+# descontada do espaço livre no planejamento (planejamento.py): as cópias
+# guardadas durante a execução não tomam o espaço prometido às bases seguintes.
+
+PASTA_ACERVO = os.getenv("ACERVO_PASTA", "backup_Acervo")
+LIMITE_BYTES = env_float("ACERVO_LIMITE_GB", 0) * 1024 ** 3
+COPIAS_POR_BASE = max(1, env_int("ACERVO_COPIAS_POR_BASE", 2))
+DIAS_RETENCAO = env_float("ACERVO_DIAS", 7)
+ARQUIVO_INDICE = "indice.json"
+ESPERA_TRAVA = 30
+
+_trava = threading.Lock()
+
+def ativo():
+    return LIMITE_BYTES > 0
+
+def _caminho_indice():
+    return os.path.join(PASTA_ACERVO, ARQUIVO_INDICE)
+
+def _ler_indice():
+    try:
+        with open(_caminho_indice(), "r", encoding="utf-8") as arq:
+            return json.load(arq)
+    except FileNotFoundError:
+        return []
+    except (OSError, ValueError):
+        log.warning("Índice do acervo ilegível; as cópias sem registro serão descartadas na retenção.")
+        return []
+
+def _gravar_indice(copias):
+    caminho = _caminho_indice()
+    with open(caminho + ".tmp", "w", encoding="utf-8") as arq:
+        json.dump(copias, arq, ensure_ascii=False, indent=2)
+    os.replace(caminho + ".tmp", caminho)
+
+@contextmanager
+def _indice():
+    """
+    Lê o índice, entrega a lista para alteração e grava de volta. A trava de arquivo
+    evita que o backup e um --reenviar/--restaurar em outra janela se atropelem.
+    """
+    os.makedirs(PASTA_ACERVO, exist_ok=True)
+    with _trava:
+        trava = TravaExecucao("acervo")
+        limite = time.monotonic() + ESPERA_TRAVA
+        while not trava.adquirir():
+            if time.monotonic() > limite:
+                raise Exception("Acervo em uso por outro processo (trava acervo.lock)")
+            time.sleep(0.1)
+        try:
+            copias = _ler_indice()
+            yield copias
+            _gravar_indice(copias)
+        finally:
+            trava.liberar()
+
+def _apagar(copia):
+    try:
+        os.remove(copia["caminho"])
+    except FileNotFoundError:
+        pass
+
+def _reter(copias):
+    """ Aplica idade, cópias por base e limite de espaço na lista (alterada no lugar). Retorna bytes liberados. """
+    removidas = []
+    # Registros cujo arquivo sumiu (apagado à mão, disco trocado)
+    for copia in list(copias):
+        if not os.path.exists(copia["caminho"]):
+            copias.remove(copia)
+
+    corte = (datetime.now() - timedelta(days=DIAS_RETENCAO)).isoformat(timespec="seconds")
+    por_base = {}
+    for copia in sorted(copias, key=lambda c: c["criado_em"], reverse=True):
+        por_base.setdefault(copia["dsn"], []).append(copia)
+    for lista in por_base.values():
+        for posicao, copia in enumerate(lista):
+            if posicao >= COPIAS_POR_BASE or copia["criado_em"] < corte:
+                removidas.append(copia)
+    for copia in removidas:
+        copias.remove(copia)
+
+    # Limite de espaço: menos usada primeiro, preservando a última cópia de cada base enquanto der
+    total = sum(c["bytes"] for c in copias)
+    while copias and total > LIMITE_BYTES:
+        contagem = {}
+        for copia in copias:
+            contagem[copia["dsn"]] = contagem.get(copia["dsn"], 0) + 1
+        copia = min(copias, key=lambda c: (contagem[c["dsn"]] == 1, c["ultimo_uso"]))
+        copias.remove(copia)
+        removidas.append(copia)
+        total -= copia["bytes"]
+
+    for copia in removidas:
+        _apagar(copia)
+    liberados = sum(c["bytes"] for c in removidas)
+
+    # Arquivos na pasta que o índice não conhece (sobras de uma queda no meio da cópia)
+    conhecidos = {os.path.abspath(c["caminho"]) for c in copias}
+    for nome in os.listdir(PASTA_ACERVO):
+        caminho = os.path.join(PASTA_ACERVO, nome)
+        if nome.startswith(ARQUIVO_INDICE) or not os.path.isfile(caminho) or os.path.abspath(caminho) in conhecidos:
+            continue
+        try:
+            liberados += os.path.getsize(caminho)
+            os.remove(caminho)
+        except OSError:
+            pass
+    return liberados
+
+def aplicar_retencao():
+    """ Roda a retenção do acervo (início de cada execução). """
+    if not ativo():
+        return 0
+    with _indice() as copias:
+        liberados = _reter(copias)
+        total = sum(c["bytes"] for c in copias)
+    if liberados:
+        log.info(f"Acervo: {liberados / (1024 * 1024):.2f} MB liberados pela retenção")
+    log.info(f"Acervo: {len(copias)} cópia(s), {total / 1024 ** 3:.2f} GB de {LIMITE_BYTES / 1024 ** 3:.2f} GB")
+    return liberados
+
+def espaco_reservado(pasta):
+    """ Quanto o acervo ainda pode crescer no disco de 'pasta' (0 se desligado ou em outro disco). """
+    if not ativo():
+        return 0
+    os.makedirs(PASTA_ACERVO, exist_ok=True)
+    if os.stat(PASTA_ACERVO).st_dev != os.stat(pasta).st_dev:
+        return 0
+    ocupado = sum(c["bytes"] for c in _ler_indice())
+    return max(0, LIMITE_BYTES - ocupado)
+
+def guardar_no_acervo(ctx, manifesto):
+    """
+    Move o arquivo já enviado para o acervo e registra no índice.
+    Com o acervo desligado (ou arquivo maior que o limite), apenas apaga o arquivo.
+    """
+    arquivo = ctx["arquivo"]
+    tamanho = os.path.getsize(arquivo)
+    if not ativo() or tamanho > LIMITE_BYTES:
+        os.remove(arquivo)
+        return None
+
+    with _indice() as copias:
+        destino = os.path.join(PASTA_ACERVO, os.path.basename(arquivo))
+        # Mesmo nome (duas execuções no mesmo segundo): a cópia nova substitui o registro antigo
+        copias[:] = [c for c in copias if os.path.abspath(c["caminho"]) != os.path.abspath(destino)]
+        shutil.move(arquivo, destino)
+        agora = datetime.now().isoformat(timespec="seconds")
+        copia = {
+            "dsn": ctx["dsn"],
+            "nome_base": ctx["nome_base"],
+            "cod_empresa": ctx["cod_empresa"],
+            "caminho": destino,
+            "bytes": tamanho,
+            "sha256": ctx.get("sha256"),
+            "codec": ctx["compressao"]["codec"],
+            "conteudo": manifesto.get("conteudo", "fbk" if ctx.get("streaming") else "fdb"),
+            "manifesto": manifesto,
+            "criado_em": agora,
+            "ultimo_uso": agora,
+        }
+        copias.append(copia)
+        _reter(copias)
+    log.info(f"Cópia guardada no acervo: {os.path.basename(destino)}")
+    return copia
+
+def listar_acervo():
+    """ Cópias do acervo, mais recentes primeiro. """
+    return sorted(_ler_indice(), key=lambda c: c["criado_em"], reverse=True)
+
+def copia_mais_recente(base):
+    """ Última cópia da base (pelo nome, ex: LOJA01, ou pelo DSN). Marca a cópia como usada. """
+    with _indice() as copias:
+        candidatas = [c for c in copias if base in (c["nome_base"], c["dsn"]) and os.path.exists(c["caminho"])]
+        if not candidatas:
+            raise Exception(f"Nenhuma cópia de '{base}' no acervo ({os.path.abspath(PASTA_ACERVO)})")
+        copia = max(candidatas, key=lambda c: c["criado_em"])
+        copia["ultimo_uso"] = datetime.now().isoformat(timespec="seconds")
+    return copia
+
+def conferir_copia(copia):
+    """ Recalcula o SHA-256 da cópia antes de usá-la. """
+    if not copia.get("sha256"):
+        return
+    hash_arquivo = hashlib.sha256()
+    with open(copia["caminho"], "rb") as arq:
+        for bloco in iter(lambda: arq.read(1024 * 1024), b""):
+            hash_arquivo.update(bloco)
+    if hash_arquivo.hexdigest() != copia["sha256"]:
+        raise Exception(f"Cópia do acervo corrompida: {os.path.basename(copia['caminho'])} (SHA-256 não confere)")
@@ -0,0 +1,192 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from emcontrar_caminho import caminho_base, encontrar_banco_base
+from estado_local import TravaExecucao, salvar_estado
+from log_discord import enviar_log_discord, finalizar_notificacoes
+from configuracao import env_float
+from log import configurar_logger
+
+log = configurar_logger()
+
+# =================================================================
+# MODO AGENDADOR (processo residente)
+# =================================================================
+# Em vez de o agendador do Windows abrir o exe a cada horário, o próprio
+# programa fica rodando (backup_restore.py --agendador) e dispara o backup
+# nos horários configurados. O que foi descoberto (GBAK, bases, porta) fica
+# em memória e só é refeito quando algo muda.
+#
+#   AGENDA_HORARIOS=22:00;03:30     -> horários dos disparos (HH:MM)
+#   AGENDA_DIAS=0,1,2,3,4           -> dias da semana (0 = segunda); vazio = todos
+#   AGENDA_REDESCOBRIR_HORAS=24     -> refaz a descoberta mesmo sem mudança
+#
+# O andamento fica em ESTADO_BACKUP_MERCOSISTEM/status.json.
+
+AGENDA_HORARIOS = os.getenv("AGENDA_HORARIOS", "22:00")
+AGENDA_DIAS = os.getenv("AGENDA_DIAS", "")
+REDESCOBRIR_HORAS = env_float("AGENDA_REDESCOBRIR_HORAS", 24)
+ARQUIVO_STATUS = "status"
+INTERVALO_ESPERA = 60  # Acorda periodicamente para acompanhar mudanças no relógio
+
+def ler_horarios(texto=AGENDA_HORARIOS):
+    """ Converte '22:00;03:30' em [(3, 30), (22, 0)]. """
+    horarios = []
+    for item in texto.replace(",", ";").split(";"):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            hora, minuto = (int(parte) for parte in item.split(":"))
+        except ValueError:
+            raise Exception(f"Horário inválido em AGENDA_HORARIOS: '{item}' (use HH:MM)")
+        if not (0 <= hora < 24 and 0 <= minuto < 60):
+            raise Exception(f"Horário inválido em AGENDA_HORARIOS: '{item}'")
+        horarios.append((hora, minuto))
+    if not horarios:
+        raise Exception("AGENDA_HORARIOS está vazio.")
+    return sorted(set(horarios))
+
+def ler_dias(texto=AGENDA_DIAS):
+    """ Dias da semana permitidos (0 = segunda ... 6 = domingo). Vazio = todos. """
+    dias = {int(d) for d in texto.replace(";", ",").split(",") if d.strip()}
+    return dias or set(range(7))
+
+def proxima_execucao(horarios, dias, agora=None):
+    """ Próximo horário agendado a partir de agora. """
+    agora = agora or datetime.now()
+    for deslocamento in range(8):
+        dia = agora.date() + timedelta(days=deslocamento)
+        if dia.weekday() not in dias:
+            continue
+        for hora, minuto in horarios:
+            momento = datetime(dia.year, dia.month, dia.day, hora, minuto)
+            if momento > agora:
+                return momento
+    raise Exception("Nenhum horário válido em AGENDA_HORARIOS/AGENDA_DIAS.")
+
+# --- Status para acompanhamento externo ---
+_status = {}
+_trava_status = threading.Lock()
+
+def atualizar_status(**campos):
+    """ Atualiza o status.json (lido por quem quiser acompanhar o processo). """
+    with _trava_status:
+        _status.update(campos, pid=os.getpid(), atualizado_em=datetime.now().isoformat(timespec="seconds"))
+        salvar_estado(ARQUIVO_STATUS, _status)
+
+def _progresso_no_status(valor_decimal, eta_segundos=None):
+    """ Callback de progresso do modo agendador: grava no status.json a cada 1% (com a previsão de término). """
+    percentual = int(valor_decimal * 100)
+    if percentual != _status.get("progresso"):
+        termino = None if eta_segundos is None else (datetime.now() + timedelta(seconds=eta_segundos)).isoformat(timespec="minutes")
+        atualizar_status(progresso=percentual, termino_previsto=termino)
+
+# --- Estado descoberto mantido em memória ---
+class EstadoQuente:
+    """
+    Guarda o que foi descoberto entre uma execução e outra. A descoberta
+    (registro do GBAK, varredura de pastas, portas, lista de bases) só é refeita se:
+    o GBAK sumiu, o banco base mudou (caminho ou data de modificação),
+    a execução anterior teve falha ou passou AGENDA_REDESCOBRIR_HORAS.
+    """
+
+    def __init__(self, principal):
+        self.principal = principal
+        self.assinatura = None
+        self.atualizado_em = 0
+        self.forcar = True
+
+    def _assinatura(self):
+        fixas = os.getenv("BACKUP_BASES", "")
+        if fixas:
+            return ("BACKUP_BASES", fixas)
+        banco = encontrar_banco_base(caminho_base())  # Usa o cache de descoberta (só confere datas)
+        try:
+            return (banco, os.path.getmtime(banco))
+        except (TypeError, OSError):
+            return (banco, None)
+
+    def _motivo_para_redescobrir(self, assinatura):
+        gbak_path = self.principal.gbak_path
+        if self.forcar or self.principal.bases is None:
+            return "primeira execução" if self.assinatura is None else "falha na execução anterior"
+        if gbak_path and not os.path.isfile(gbak_path):
+            return "GBAK não encontrado no caminho anterior"
+        if assinatura != self.assinatura:
+            return "banco base alterado"
+        if time.time() - self.atualizado_em > REDESCOBRIR_HORAS * 3600:
+            return "descoberta expirada"
+        return None
+
+    def garantir(self):
+        assinatura = self._assinatura()
+        motivo = self._motivo_para_redescobrir(assinatura)
+        if motivo is None:
+            log.info(f"Reaproveitando {len(self.principal.bases)} base(s) já descobertas.")
+            return
+        log.info(f"Refazendo a descoberta ({motivo})...")
+        self.principal.preparar_ambiente()
+        self.assinatura = assinatura
+        self.atualizado_em = time.time()
+        self.forcar = False
+
+# --- Laço principal ---
+def _executar_agendado(principal, estado):
+    """ Um disparo do agendador. Não roda se outro backup (ex: o exe aberto manualmente) estiver em andamento. """
+    with TravaExecucao() as adquirida:
+        if not adquirida:
+            log.warning("Outro backup já está em execução. Disparo ignorado.")
+            atualizar_status(ultima_execucao={"inicio": datetime.now().isoformat(timespec="seconds"), "resultado": "ignorado (outra execução em andamento)"})
+            return
+
+        inicio = datetime.now().isoformat(timespec="seconds")
+        atualizar_status(estado="executando", inicio_execucao=inicio, progresso=0)
+        resultado = {"inicio": inicio}
+        try:
+            estado.garantir()
+            principal.matar_atualizador()
+            falhas = principal.rodar_backup(_progresso_no_status)
+            resultado["resultado"] = "falhas" if falhas else "sucesso"
+            resultado["falhas"] = falhas
+            estado.forcar = bool(falhas)
+        except Exception as e:
+            log.error("Erro na execução agendada", exc_info=True)
+            resultado.update(resultado="erro", erro=str(e))
+            estado.forcar = True
+            enviar_log_discord(status="erro", codigo_empresa="AGENDADOR", mensagem="❌ Falha na execução agendada", detalhes=f"⚠️ **Erro:** {e}")
+        resultado["fim"] = datetime.now().isoformat(timespec="seconds")
+        atualizar_status(estado="aguardando", inicio_execucao=None, ultima_execucao=resultado)
+
+def executar_agendador(principal):
+    """
+    Mantém o processo rodando e dispara o backup nos horários do .env.
+    'principal' é o módulo backup_restore já carregado (quando o exe roda,
+    ele é o __main__; importá-lo de novo duplicaria o estado em memória).
+    """
+    trava_agendador = TravaExecucao("agendador")
+    if not trava_agendador.adquirir():
+        log.warning("O agendador já está rodando em outro processo. Encerrando.")
+        return
+
+    horarios = ler_horarios()
+    dias = ler_dias()
+    estado = EstadoQuente(principal)
+    log.info(f"Agendador iniciado. Horários: {', '.join(f'{h:02d}:{m:02d}' for h, m in horarios)}")
+
+    try:
+        while True:
+            alvo = proxima_execucao(horarios, dias)
+            atualizar_status(estado="aguardando", progresso=None, termino_previsto=None, proxima_execucao=alvo.isoformat(timespec="minutes"))
+            log.info(f"Próximo backup agendado para {alvo.strftime('%d/%m/%Y %H:%M')}")
+            while datetime.now() < alvo:
+                time.sleep(min(INTERVALO_ESPERA, max(0.0, (alvo - datetime.now()).total_seconds())))
+            _executar_agendado(principal, estado)
+    except KeyboardInterrupt:
+        log.info("Agendador interrompido.")
+    finally:
+        atualizar_status(estado="parado", proxima_execucao=None)
+        finalizar_notificacoes()
+        trava_agendador.liberar()
@@ -0,0 +1,139 @@
+import os
+import threading
+from datetime import datetime
+
+from estado_local import ler_estado, salvar_estado
+from metadados import CONSULTAS, CONSULTAS_OPCIONAIS
+from configuracao import env_float, env_int
+from log import configurar_logger
+
+log = configurar_logger()
+
+# =================================================================
+# DETECÇÃO DE BASES SEM ALTERAÇÃO
+# =================================================================
+# Toda transação (inclusive as de leitura) avança o contador de transações
+# do banco. O contador lido em cada execução fica guardado; na execução
+# seguinte, o avanço é comparado com as transações que a própria ferramenta
+# abriu nesse intervalo (as consultas da coleta de metadados e, se houve
+# backup, as do GBAK). Qualquer avanço além disso é alteração de um usuário.
+# A comparação é sempre com a execução anterior, então as execuções puladas
+# não acumulam as próprias transações. Uma base só fica fora do pipeline se
+# nenhuma execução desde o último backup bem-sucedido viu alteração.
+#
+# Uma transação que já estava aberta na leitura do contador e confirma depois
+# do GBAK não gera número novo, e o que ela gravou não está em nenhum backup.
+# Por isso a transação ativa mais antiga (MON$OLDEST_ACTIVE) é guardada junto
+# com o backup: se ela estiver abaixo (ou igual) ao contador lido, havia outra
+# transação aberta durante o backup e a base não é pulada na execução seguinte.
+#
+#   ALTERACOES_PULAR_SEM_MUDANCA=0       -> 1 liga a detecção (desligada: todas as bases fazem backup)
+#   ALTERACOES_TRANSACOES_BACKUP=1       -> transações que o GBAK abre na base durante o backup
+#   ALTERACOES_TOLERANCIA_TRANSACOES=0   -> transações de outros aceitas sem considerar mudança
+#                                           (ex: gatilho ON CONNECT que abre transação própria)
+#   ALTERACOES_DIAS_BACKUP_COMPLETO=7    -> faz o backup mesmo sem mudança após N dias
+#
+# Bases com checkpoint pendente (ex: upload adiado) nunca são puladas.
+
+PULAR_SEM_MUDANCA = os.getenv("ALTERACOES_PULAR_SEM_MUDANCA", "0") == "1"
+TRANSACOES_BACKUP = env_int("ALTERACOES_TRANSACOES_BACKUP", 1)
+TOLERANCIA_TRANSACOES = env_int("ALTERACOES_TOLERANCIA_TRANSACOES", 0)
+DIAS_BACKUP_COMPLETO = env_float("ALTERACOES_DIAS_BACKUP_COMPLETO", 7)
+ARQUIVO_ESTADO = "alteracoes_bases"
+# Cada consulta da coleta roda na própria transação (commit logo depois). Entre duas leituras
+# do contador cabe exatamente uma coleta inteira: as consultas feitas depois da leitura
+# anterior mais as feitas até a leitura atual (incluindo a do próprio contador)
+TRANSACOES_COLETA = len(CONSULTAS) + len(CONSULTAS_OPCIONAIS)
+
+_trava = threading.Lock()
+
+def transacoes_proprias(anterior):
+    """ Transações abertas pela ferramenta entre a leitura registrada e a leitura atual. """
+    # Registros antigos (sem o campo) só eram gravados depois de um backup
+    houve_backup = anterior.get("backup_na_execucao", True)
+    return TRANSACOES_COLETA + (TRANSACOES_BACKUP if houve_backup else 0)
+
+def motivo_para_backup(dsn, transacao_atual, agora=None):
+    """ Diz por que a base precisa de backup. None = sem alteração desde o último backup. """
+    if transacao_atual is None:
+        return "contador de transações indisponível"
+    anterior = ler_estado(ARQUIVO_ESTADO).get(dsn)
+    if not anterior:
+        return "sem backup anterior registrado"
+
+    agora = agora or datetime.now()
+    dias = (agora - datetime.fromisoformat(anterior["ultimo_backup"])).total_seconds() / 86400
+    if dias >= DIAS_BACKUP_COMPLETO:
+        return f"último backup há {dias:.0f} dia(s)"
+
+    ativa = anterior.get("ativa_mais_antiga_backup")
+    if ativa is None:
+        return "transação ativa mais antiga do último backup desconhecida"
+    if ativa <= anterior["transacao_backup"]:
+        return f"transação {ativa} estava aberta durante o último backup (pode ter gravado depois dele)"
+
+    delta = transacao_atual - anterior["transacao_atual"]
+    if delta < 0:
+        return "contador de transações reiniciado (base restaurada ou substituída)"
+    alheias = delta - transacoes_proprias(anterior)
+    if alheias > TOLERANCIA_TRANSACOES:
+        return f"{alheias} transação(ões) de outros desde a execução anterior"
+    return None
+
+def separar_bases(contextos):
+    """
+    Separa as bases que precisam de backup das que não mudaram.
+    Usa ctx['transacao_atual'] (lido na coleta de metadados). Retorna (processar, sem_alteracao).
+    A leitura das bases puladas passa a ser a referência da próxima execução.
+    """
+    if not PULAR_SEM_MUDANCA:
+        return contextos, []
+
+    processar, sem_alteracao = [], []
+    for ctx in contextos:
+        if ctx.get("etapas_puladas"):
+            motivo = "checkpoint pendente de uma execução anterior"
+        else:
+            motivo = motivo_para_backup(ctx["dsn"], ctx.get("transacao_atual"))
+        if motivo is None:
+            registrar_sem_alteracao(ctx["dsn"], ctx["transacao_atual"])
+            sem_alteracao.append(ctx)
+        else:
+            log.info(f"Base {ctx['nome_base']} entra no backup: {motivo}")
+            processar.append(ctx)
+
+    if sem_alteracao:
+        log.info(f"{len(sem_alteracao)} base(s) sem alteração desde o último backup: "
+                 f"{', '.join(ctx['nome_base'] for ctx in sem_alteracao)}")
+    return processar, sem_alteracao
+
+def ultimo_backup(dsn):
+    """ Data (ISO) do último backup bem-sucedido registrado para a base. """
+    return ler_estado(ARQUIVO_ESTADO).get(dsn, {}).get("ultimo_backup")
+
+def registrar_backup(dsn, transacao_atual, ativa_mais_antiga=None):
+    """
+    Guarda o contador e a transação ativa mais antiga lidos no início do backup que acabou
+    de terminar com sucesso (numa base retomada, os lidos na execução que fez o GBAK,
+    que voltam pelo checkpoint).
+    """
+    if transacao_atual is None:
+        return
+    with _trava:
+        estado = ler_estado(ARQUIVO_ESTADO)
+        estado[dsn] = {
+            "transacao_atual": transacao_atual,
+            "ultimo_backup": datetime.now().isoformat(timespec="seconds"),
+            "backup_na_execucao": True,
+            "transacao_backup": transacao_atual,
+            "ativa_mais_antiga_backup": ativa_mais_antiga,
+        }
+        salvar_estado(ARQUIVO_ESTADO, estado)
+
+def registrar_sem_alteracao(dsn, transacao_atual):
+    """ Guarda o contador lido numa execução em que a base foi pulada (o último backup continua o mesmo). """
+    with _trava:
+        estado = ler_estado(ARQUIVO_ESTADO)
+        estado[dsn]["transacao_atual"] = transacao_atual
+        estado[dsn]["backup_na_execucao"] = False
+        salvar_estado(ARQUIVO_ESTADO, estado)
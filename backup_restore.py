@@ -1,5 +1,6 @@
 import subprocess
 import os
+import json
 from datetime import datetime
 import sys
 import time
@@ -22,46 +23,91 @@ if os.path.exists(caminho_env):
 else:
     raise Exception("Erro crítico: Arquivo .env não encontrado.")
 
+from configuracao import env_int
+
 # Captura das credenciais via variáveis de ambiente
 FTP_HOST = os.getenv("FTP_HOST")
 FTP_USER = os.getenv("FTP_USER")
 FTP_PASS_PREFIX = os.getenv("FTP_PASS_PREFIX")
+FTP_PORT = env_int("FTP_PORT", 21)
+# Upload: tamanho do bloco do storbinary e tentativas (com retomada). Sessões = PIPELINE_WORKERS_UPLOAD
+FTP_BLOCO_KB = env_int("FTP_BLOCO_KB", 1024)
+FTP_TENTATIVAS = env_int("FTP_TENTATIVAS", 5)
 FB_USER = os.getenv("FB_USER")
 FB_PASS = os.getenv("FB_PASS")
 
+# Compressão: codec (zip, zstd ou lz4), nível e quantidade de threads
+COMPRESSAO_CODEC = os.getenv("COMPRESSAO_CODEC", "zip").lower()
+COMPRESSAO_NIVEL = env_int("COMPRESSAO_NIVEL", None)
+COMPRESSAO_WORKERS = env_int("COMPRESSAO_WORKERS", None)
+
 # Importações de módulos locais do projeto
-from encontrar_gbak import gbak_path
+# (a interface gráfica e os drivers só são importados quando realmente usados)
+from encontrar_gbak import localizar_gbak
 from emcontrar_caminho import caminho_base, encontrar_banco_base, capturar_portas_firebird, obter_bases
-from log_discord import enviar_log_discord
-import fdb
+from log_discord import enviar_log_discord, finalizar_notificacoes
 import re 
-import shutil
-import ftplib
-from interface import mostrar_loading
-from log import configurar_logger
+from pipeline import executar_pipeline
+from metadados import coletar_metadados, metadados_base, fechar_conexoes, arquivo_do_dsn
+from metricas import medir_etapa, MonitorDisco, iniciar_execucao, finalizar_execucao
+from envio_ftp import PoolFTP, enviar_arquivo, enviar_conteudo
+from banda import UploadAdiado, criar_limite
+from planejamento import planejar, FATOR_FBK
+from alteracoes import separar_bases, registrar_backup, ultimo_backup
+from progresso import Progresso, formatar_eta
+from validacao import escolher_validacao, registrar_validacao, LEVE
+from retomada import carregar_checkpoint, salvar_checkpoint, remover_checkpoint, limpar_orfaos
+from motor_backup import criar_motor
+from compressao import Compactador, compactar_arquivo, descompactar, nome_compactado, resumo_compressao
+from acervo import aplicar_retencao, espaco_reservado, guardar_no_acervo, listar_acervo, copia_mais_recente, conferir_copia
+from log import configurar_logger, contexto_log
 
 log = configurar_logger()
 
+PASTA_RAIZ = "backup_Restore"
+PASTA_BACKUP = os.path.join(PASTA_RAIZ, "backup")
+PASTA_RESTORE = os.path.join(PASTA_RAIZ, "restore")
+
+# Preenchidos por preparar_ambiente() quando o backup vai começar
+bases = None
+gbak_path = None
+motor = None  # Executa o backup/restore (gbak.exe ou Services Manager, ver motor_backup.py)
+
 # --- PREPARAÇÃO DO AMBIENTE ---
-# Define bases e pastas onde os arquivos temporários de backup serão gerados
-base = caminho_base()
-empresa_db = encontrar_banco_base(base)
+def descobrir_bases():
+    """ 
+    Lista as bases que vão passar pelo backup.
+    BACKUP_BASES no .env (separadas por ';') fixa a lista de bases e pula a descoberta.
+    """
+    lista = [b.strip() for b in os.getenv("BACKUP_BASES", "").split(";") if b.strip()]
+    if lista:
+        return lista
 
-if not empresa_db:
-    raise Exception("Nenhum banco base encontrado (EMPRESA.GDB ou GESTAO.FDB)")
+    base = caminho_base()
+    empresa_db = encontrar_banco_base(base)
 
-portas_firebird = capturar_portas_firebird()
+    if not empresa_db:
+        raise Exception("Nenhum banco base encontrado (EMPRESA.GDB ou GESTAO.FDB)")
 
-bases = obter_bases(empresa_db, portas_firebird) if empresa_db.lower().endswith("empresa.gdb") else [empresa_db]
+    portas_firebird = capturar_portas_firebird()
 
-PASTA_RAIZ = "backup_Restore"
-PASTA_BACKUP = os.path.join(PASTA_RAIZ, "backup")
-PASTA_RESTORE = os.path.join(PASTA_RAIZ, "restore")
+    return obter_bases(empresa_db, portas_firebird) if empresa_db.lower().endswith("empresa.gdb") else [empresa_db]
 
-os.makedirs(PASTA_BACKUP, exist_ok=True)
-os.makedirs(PASTA_RESTORE, exist_ok=True)
-log.info(f"Pasta de backup: {PASTA_BACKUP}")
-log.info(f"Pasta de restore: {PASTA_RESTORE}")
+def preparar_ambiente():
+    """ 
+    Localiza o GBAK, escolhe o motor de backup, descobre as bases e cria as pastas onde os arquivos temporários
+    de backup serão gerados. Nada disso roda na importação do módulo.
+    """
+    global bases, gbak_path, motor
+    gbak_path = localizar_gbak()
+    motor = criar_motor(gbak_path)
+    bases = descobrir_bases()
+
+    os.makedirs(PASTA_BACKUP, exist_ok=True)
+    os.makedirs(PASTA_RESTORE, exist_ok=True)
+    log.info(f"Pasta de backup: {PASTA_BACKUP}")
+    log.info(f"Pasta de restore: {PASTA_RESTORE}")
+    return bases
 
 # --- FUNÇÕES AUXILIARES ---
 def matar_atualizador():
@@ -75,130 +121,592 @@ def matar_atualizador():
         log.warning("Não foi possível finalizar atualizador.exe ")
 
 def buscar_cod_empresa(dsn):
-    """ Conecta ao banco Firebird para buscar o número de série da empresa (usado no nome do arquivo). """
-    conn = fdb.connect(dsn=dsn, user=FB_USER, password=FB_PASS)
-    cur = conn.cursor()
-    cur.execute("SELECT FIRST 1 NUMSERIE FROM EMPRESA")
-    row = cur.fetchone()
-    conn.close()
-    log.info(f"Código da empresa encontrado: {row[0] if row and row[0] else 'N/A'}")
-    return re.sub(r"[^0-9\-]", "", str(row[0])) if row and row[0] else None
-
-def compactar_fdb(fdb_file):
-    """ Compacta o banco restaurado em formato ZIP para economizar banda no upload FTP. """
-    zip_name = fdb_file.replace(".FDB", ".zip")
-    shutil.make_archive(zip_name.replace(".zip", ""), "zip", root_dir=os.path.dirname(fdb_file), base_dir=os.path.basename(fdb_file))
-    return zip_name
-
-def enviar_ftp(zip_name, codigo_empresa):
-    """ Realiza o upload do arquivo compactado para o servidor FTP da empresa. """
+    """ Número de série da empresa (usado no nome do arquivo), lido uma única vez por execução na coleta de metadados. """
+    dados = metadados_base(dsn)
+    if "erro" in dados:
+        raise Exception(f"Não foi possível ler o NUMSERIE da base: {dados['erro']}")
+    numserie = dados.get("numserie")
+    log.info(f"Código da empresa encontrado: {numserie if numserie else 'N/A'}")
+    return re.sub(r"[^0-9\-]", "", str(numserie)) if numserie else None
+
+def compactar_fdb(fdb_file, ao_progresso=None):
+    """ Compacta o banco restaurado (codec definido no .env) para economizar banda no upload FTP. """
+    return compactar_arquivo(fdb_file, COMPRESSAO_CODEC, COMPRESSAO_NIVEL, COMPRESSAO_WORKERS, ao_progresso)
+
+def _senha_ftp():
+    """ A senha do FTP muda todo dia: prefixo + data (ddmmaa). """
+    return FTP_PASS_PREFIX + datetime.now().strftime("%d%m%y")
+
+# Sessões FTP reaproveitadas entre as bases (criado no início de cada rodar_backup)
+pool_ftp = None
+# Espaço temporário reservado pelas bases em andamento (criado no planejamento de cada rodar_backup)
+reserva_disco = None
+# Limite de banda compartilhado pelos uploads (None = sem limite; ver banda.py)
+limite_banda = None
+# Progresso por bytes das etapas em andamento (criado em cada rodar_backup)
+progresso = None
+
+def enviar_ftp(zip_name, codigo_empresa, manifesto=None, ao_progresso=None):
+    """ 
+    Realiza o upload do arquivo compactado para o servidor FTP da empresa.
+    Usa as sessões do pool e retoma o envio em caso de queda. Retorna as estatísticas do envio.
+    O manifesto (tamanho e SHA-256) vai logo depois, em '<arquivo>.manifesto.json':
+    ele só aparece no servidor quando o arquivo já chegou inteiro.
+    """
+    pasta = f"/ENTRADAS/{codigo_empresa}"
     try:
-        senha = FTP_PASS_PREFIX + datetime.now().strftime("%d%m%y")
-        ftp = ftplib.FTP(FTP_HOST)
-        ftp.login(FTP_USER, senha)
-        pasta = f"/ENTRADAS/{codigo_empresa}"
-        try: ftp.mkd(pasta) 
-        except: pass  
-        ftp.cwd(pasta)
-        with open(zip_name, "rb") as arq:
-            ftp.storbinary(f"STOR {os.path.basename(zip_name)}", arq)
-        ftp.quit()
-    except Exception as e:
+        stats = enviar_arquivo(pool_ftp, zip_name, pasta, tentativas=FTP_TENTATIVAS, bloco=FTP_BLOCO_KB * 1024,
+                               sha256_esperado=manifesto and manifesto.get("sha256"), limite=limite_banda,
+                               ao_progresso=ao_progresso)
+        if manifesto:
+            conteudo = json.dumps(manifesto, ensure_ascii=False, indent=2).encode("utf-8")
+            enviar_conteudo(pool_ftp, os.path.basename(zip_name) + ".manifesto.json", conteudo, pasta, tentativas=FTP_TENTATIVAS)
+    except UploadAdiado as e:
+        log.warning(f"Upload de {os.path.basename(zip_name)} adiado: {e}")
+        raise
+    except Exception:
         log.error(f"Erro ao enviar FTP (empresa {codigo_empresa})", exc_info=True)
+        raise
+    log.info(f"Upload de {os.path.basename(zip_name)}: {stats['bytes_por_segundo'] / (1024 * 1024):.2f} MB/s")
+    return stats
 
 # --- FLUXO PRINCIPAL ---
+# Quantidade de bases processadas ao mesmo tempo em cada etapa do pipeline
+WORKERS_BACKUP = env_int("PIPELINE_WORKERS_BACKUP", 1)
+WORKERS_RESTORE = env_int("PIPELINE_WORKERS_RESTORE", 1)
+WORKERS_COMPACTAR = env_int("PIPELINE_WORKERS_COMPACTAR", 1)
+WORKERS_UPLOAD = env_int("PIPELINE_WORKERS_UPLOAD", 1)
+# Limite de bases dentro do pipeline ao mesmo tempo (0 = soma dos workers)
+MAX_BASES_EM_ANDAMENTO = env_int("PIPELINE_MAX_BASES_EM_ANDAMENTO", 0)
+# Modo streaming: o GBAK escreve direto no arquivo compactado, sem gerar .fbk/.FDB completos em disco
+MODO_STREAMING = os.getenv("MODO_STREAMING", "0") == "1"
+# No modo streaming, duplica os bytes do backup para um restore de validação em paralelo
+STREAMING_COM_RESTORE = os.getenv("STREAMING_COM_RESTORE", "1") == "1"
+
+# Linhas de andamento do motor (o Services Manager informa tabela a tabela) vão para o log a cada N segundos
+INTERVALO_LOG_MOTOR = env_int("MOTOR_INTERVALO_LOG", 10)
+
+def _progresso_motor(ctx):
+    """ Guarda no contexto a última linha de progresso do motor e a registra no log (no máximo a cada INTERVALO_LOG_MOTOR). """
+    ultimo_log = [0.0]
+    def ao_progresso(linha):
+        ctx["progresso_motor"] = linha
+        agora = time.monotonic()
+        if agora - ultimo_log[0] >= INTERVALO_LOG_MOTOR:
+            ultimo_log[0] = agora
+            log.info(f"Andamento: {linha}")
+    return ao_progresso
+
+def _contar_bytes(ctx):
+    """ Guarda no contexto quantos bytes a etapa já processou (lido pela barra de progresso). """
+    def ao_progresso(processados):
+        ctx["bytes_processados"] = processados
+    return ao_progresso
+
+def _tamanho_atual(caminho):
+    try:
+        return os.path.getsize(caminho)
+    except (OSError, TypeError):
+        return 0
+
+def _medir_progresso(ctx, etapa):
+    """ (bytes feitos, bytes esperados) da etapa em andamento, para a barra de progresso. """
+    banco = ctx.get("tamanho_banco") or 0
+    if etapa == "backup":
+        if MODO_STREAMING:
+            return ctx.get("bytes_processados", 0), banco * FATOR_FBK
+        return _tamanho_atual(ctx.get("fbk")), banco * FATOR_FBK
+    leve = ctx.get("validacao") == LEVE
+    if etapa == "restore":
+        return (0, 0) if leve else (_tamanho_atual(ctx.get("fdb_restore")), banco)
+    if etapa == "compactar":
+        return ctx.get("bytes_processados", 0), _tamanho_atual(ctx.get("fbk") if leve else ctx.get("fdb_restore"))
+    return ctx.get("bytes_processados", 0), _tamanho_atual(ctx.get("arquivo"))
+
+def etapa_backup(ctx):
+    """ Etapa 1: Gera o backup físico (.fbk) da base via GBAK. """
+    ctx["inicio"] = time.time()
+    log.info(f"Iniciando processamento da base: {ctx['dsn']}")
+    ctx["cod_empresa"] = buscar_cod_empresa(ctx["dsn"]) or "SEM_CODIGO"
+    data = datetime.now().strftime("%Y%m%d_%H%M%S")
+    nome_arquivo = f"{ctx['nome_base']}_{ctx['cod_empresa']}_{data}"
+    ctx["fbk"] = os.path.join(PASTA_BACKUP, f"{nome_arquivo}.fbk")
+    ctx["fdb_restore"] = os.path.join(PASTA_RESTORE, f"{nome_arquivo}.FDB")
+
+    if MODO_STREAMING:
+        log.info(f"Executando GBAK Backup em streaming para: {nome_compactado(ctx['fbk'], COMPRESSAO_CODEC)}")
+        backup_streaming(ctx)
+        return
+
+    log.info(f"Executando GBAK Backup para: {ctx['fbk']}")
+    motor.backup(ctx["dsn"], ctx["fbk"], _progresso_motor(ctx))
+    log.info("Backup físico (.fbk) gerado com sucesso.")
+    arquivo_banco = arquivo_do_dsn(ctx["dsn"])
+    ctx["medicao"]["bytes_entrada"] = os.path.getsize(arquivo_banco) if os.path.isfile(arquivo_banco) else None
+    ctx["medicao"]["bytes_saida"] = os.path.getsize(ctx["fbk"])
+
+def backup_streaming(ctx):
+    """
+    Roda o backup com saída em blocos e grava os bytes direto dentro do arquivo compactado.
+    Opcionalmente repassa os mesmos bytes para um restore lendo em paralelo,
+    validando o backup sem nunca gravar o .fbk em disco.
+    """
+    ctx["arquivo"] = nome_compactado(ctx["fbk"], COMPRESSAO_CODEC)
+
+    restore = None
+    if STREAMING_COM_RESTORE:
+        log.info(f"Restore de validação em paralelo para: {ctx['fdb_restore']}")
+        restore = motor.iniciar_restore_stream(ctx["fdb_restore"], somente_metadados=ctx["validacao"] == LEVE)
+
+    try:
+        with Compactador(ctx["arquivo"], os.path.basename(ctx["fbk"]), COMPRESSAO_CODEC, COMPRESSAO_NIVEL, COMPRESSAO_WORKERS) as destino:
+            def escrever(bloco):
+                destino.write(bloco)
+                ctx["bytes_processados"] = destino.bytes_entrada
+                if restore:
+                    restore.write(bloco)
+            motor.backup_para_stream(ctx["dsn"], escrever)
+        ctx["compressao"] = destino.close()
+    except BrokenPipeError:
+        if restore is None:
+            raise
+        # O restore morreu no meio do caminho; o erro real é o dele
+        restore.finalizar()
+        raise
+    except BaseException:
+        if restore:
+            restore.abortar()  # Não deixa o erro do restore incompleto esconder o erro do backup
+        raise
+    if restore:
+        restore.finalizar()
+        log.info("Restore de validação concluído. Banco íntegro.")
+        if os.path.exists(ctx["fdb_restore"]): os.remove(ctx["fdb_restore"])
+
+    ctx["streaming"] = True
+    ctx["sha256"] = ctx["compressao"]["sha256"]
+    ctx["medicao"]["bytes_entrada"] = ctx["compressao"]["bytes_entrada"]
+    ctx["medicao"]["bytes_saida"] = ctx["compressao"]["bytes_saida"]
+    ctx["tamanho_mb"] = os.path.getsize(ctx["arquivo"]) / (1024 * 1024)
+    log.info(f"Backup em streaming finalizado: {ctx['arquivo']}")
+
+def etapa_restore(ctx):
+    """
+    Etapa 2: Restaura o .fbk em um .FDB temporário (validação da integridade do backup).
+    Na validação leve restaura só os metadados e o .fbk segue para a compactação.
+    """
+    if ctx.get("streaming"):
+        return # Restore (se habilitado) já foi feito junto com o backup
+    if ctx["validacao"] == LEVE:
+        log.info(f"Restore só de metadados (validação leve: {ctx['motivo_validacao']})")
+        motor.restore(ctx["fbk"], ctx["fdb_restore"], _progresso_motor(ctx), somente_metadados=True)
+        log.info("Restore de metadados concluído. Estrutura do backup íntegra.")
+        ctx["medicao"]["bytes_entrada"] = os.path.getsize(ctx["fbk"])
+        ctx["medicao"]["bytes_saida"] = os.path.getsize(ctx["fdb_restore"])
+        os.remove(ctx["fdb_restore"])
+        return
+    log.info(f"Iniciando Restore de validação em: {ctx['fdb_restore']}")
+    motor.restore(ctx["fbk"], ctx["fdb_restore"], _progresso_motor(ctx))
+    log.info("Restore de validação concluído. Banco íntegro.")
+    ctx["medicao"]["bytes_entrada"] = os.path.getsize(ctx["fbk"])
+    ctx["medicao"]["bytes_saida"] = os.path.getsize(ctx["fdb_restore"])
+    # O .fbk já foi validado, não precisa mais ocupar espaço até o fim do ciclo
+    if os.path.exists(ctx["fbk"]): os.remove(ctx["fbk"])
+
+def etapa_compactar(ctx):
+    """ Etapa 3: Compacta o banco restaurado (ou o .fbk, na validação leve) e remove o temporário. """
+    if ctx.get("streaming"):
+        return # O arquivo compactado já foi gerado durante o backup
+    origem = ctx["fbk"] if ctx["validacao"] == LEVE else ctx["fdb_restore"]
+    log.info(f"Compactando {'backup (.fbk)' if origem == ctx['fbk'] else 'banco restaurado'} ({COMPRESSAO_CODEC})...")
+    ctx["compressao"] = compactar_fdb(origem, _contar_bytes(ctx))
+    ctx["arquivo"] = ctx["compressao"]["arquivo"]
+    ctx["sha256"] = ctx["compressao"]["sha256"]
+    ctx["medicao"]["bytes_entrada"] = ctx["compressao"]["bytes_entrada"]
+    ctx["medicao"]["bytes_saida"] = ctx["compressao"]["bytes_saida"]
+    os.remove(origem) # Remove o FDB/.fbk temporário para poupar espaço
+    ctx["tamanho_mb"] = os.path.getsize(ctx["arquivo"]) / (1024 * 1024)
+    log.info(f"Compactação finalizada: {ctx['arquivo']} ({resumo_compressao(ctx['compressao'])})")
+
+def _conteudo_arquivo(ctx):
+    """ O que vai dentro do arquivo compactado: o .FDB restaurado ou o próprio .fbk. """
+    return "fbk" if ctx.get("streaming") or ctx["validacao"] == LEVE else "fdb"
+
+def _manifesto_envio(ctx):
+    """ Dados que acompanham o arquivo no FTP para conferência de integridade. """
+    compressao = ctx["compressao"]
+    return {
+        "arquivo": os.path.basename(ctx["arquivo"]),
+        "bytes": os.path.getsize(ctx["arquivo"]),
+        "sha256": compressao.get("sha256"),
+        "codec": compressao["codec"],
+        "conteudo": _conteudo_arquivo(ctx),
+        "validacao": ctx["validacao"],
+        "bytes_originais": compressao["bytes_entrada"],
+        "base": ctx["nome_base"],
+        "cod_empresa": ctx["cod_empresa"],
+        "gerado_em": datetime.now().isoformat(timespec="seconds"),
+    }
+
+def etapa_upload(ctx):
+    """ Etapa 4: Envia o arquivo compactado (e o manifesto com o SHA-256) para o FTP da empresa. """
+    log.info(f"Enviando arquivo para o FTP da empresa {ctx['cod_empresa']}...")
+    manifesto = _manifesto_envio(ctx)
+    ctx["upload"] = enviar_ftp(ctx["arquivo"], ctx["cod_empresa"], manifesto, _contar_bytes(ctx))
+    ctx["medicao"]["bytes_entrada"] = ctx["upload"]["bytes_enviados"]
+    log.info("Upload concluído!")
+    # O arquivo já está no FTP: guardar a cópia local não pode derrubar a base
+    try:
+        guardar_no_acervo(ctx, manifesto)
+    except Exception:
+        log.warning("Não foi possível guardar a cópia no acervo local", exc_info=True)
+    if os.path.exists(ctx["arquivo"]): os.remove(ctx["arquivo"])
+
+def _formatar_duracao(inicio):
+    tempo_total_segundos = time.time() - inicio
+    return int(tempo_total_segundos // 60), int(tempo_total_segundos % 60)
+
+def _resumo_validacao(ctx):
+    """ Texto da validação feita na base, para o relatório. """
+    if ctx["validacao"] is None:
+        return "sem restore (STREAMING_COM_RESTORE=0)"
+    if ctx["validacao"] == LEVE:
+        return f"restore só de metadados, enviado o .fbk ({ctx['motivo_validacao']})"
+    return f"restore completo ({ctx['motivo_validacao']})"
+
+def relatar_base(ctx, erro):
+    """ Envia o relatório da base para o Discord (sucesso ou falha). """
+    minutos, segundos = _formatar_duracao(ctx["inicio"])
+
+    if erro is None:
+        enviar_log_discord(
+            status="sucesso", 
+            codigo_empresa=ctx["cod_empresa"], 
+            mensagem=f"✅ Backup concluído: {ctx['nome_base']}",
+            detalhes=(
+                f"📦 Tamanho: {ctx['tamanho_mb']:.2f} MB\n"
+                f"⏱️ Tempo: {minutos}m {segundos}s\n"
+                f"🗜️ Compressão: {resumo_compressao(ctx['compressao'])}\n"
+                f"📤 Upload: {ctx['upload']['bytes_por_segundo'] / (1024 * 1024):.2f} MB/s efetivos"
+                f"{' (banda limitada)' if ctx['upload']['limitado'] else ''}"
+                f"{' (retomado)' if ctx['upload']['retomado'] else ''}\n"
+                f"🔐 SHA-256: {(ctx['compressao'].get('sha256') or '-')[:16]}"
+                f"{' (conferido no envio)' if ctx['upload']['sha256_conferido'] else ''}\n"
+                f"🧪 Validação: {_resumo_validacao(ctx)}\n"
+                f"🔗 Arquivo: {os.path.basename(ctx['arquivo'])}"
+            )
+        )
+        return
+
+    if isinstance(erro, UploadAdiado):
+        # Não é falha: o arquivo continua pronto (checkpoint) e sobe na próxima execução
+        enviar_log_discord(
+            status="adiado",
+            codigo_empresa=ctx["cod_empresa"],
+            mensagem=f"⏸️ Upload adiado: {ctx['nome_base']}",
+            detalhes=(
+                f"📦 Tamanho: {ctx['tamanho_mb']:.2f} MB\n"
+                f"⏱️ Tempo até aqui: {minutos}m {segundos}s\n"
+                f"🕒 Motivo: {erro}"
+            )
+        )
+        return
+
+    log.error(f" Erro no processamento da base {ctx['dsn']}: {erro}")
+    log.error(f"Erro crítico: {erro}")
+    enviar_log_discord(
+        status="erro", 
+        codigo_empresa=ctx["cod_empresa"], 
+        mensagem=f"❌ Falha no backup: {ctx['nome_base']}",
+        detalhes=f"⏱️ **Tentativa durou:** {minutos}m {segundos}s\n⚠️ **Erro:** {str(erro)}"
+    )
+
+def relatar_sem_alteracao(ctx):
+    """ Aviso curto para a base que ficou fora do backup por não ter mudado. """
+    try:
+        ctx["cod_empresa"] = buscar_cod_empresa(ctx["dsn"]) or "SEM_CODIGO"
+    except Exception:
+        pass
+    data = ultimo_backup(ctx["dsn"])
+    data = datetime.fromisoformat(data).strftime("%d/%m/%Y %H:%M") if data else "-"
+    enviar_log_discord(
+        status="sem alteração",
+        codigo_empresa=ctx["cod_empresa"],
+        mensagem=f"💤 Base sem alterações, backup não necessário: {ctx['nome_base']}",
+        detalhes=f"📅 Último backup enviado: {data}"
+    )
+
+def _instrumentar(nome, funcao):
+    """
+    Envolve a etapa com a medição de tempo/bytes/disco (gravada em metricas_AAAAMMDD.jsonl)
+    e com o checkpoint: etapas já feitas numa execução anterior são puladas e cada
+    etapa concluída fica registrada para uma eventual retomada. As linhas de log da etapa
+    levam 'base=... etapa=...' e a barra de progresso acompanha os bytes da etapa.
+    """
+    def etapa(ctx):
+        if nome in ctx["etapas_puladas"]:
+            return
+        ctx["bytes_processados"] = 0
+        progresso.iniciar_etapa(ctx, nome)
+        segundos = None
+        try:
+            with contexto_log(base=ctx["nome_base"], etapa=nome):
+                with medir_etapa(ctx["nome_base"], nome) as registro:
+                    ctx["medicao"] = registro
+                    try:
+                        funcao(ctx)
+                    finally:
+                        registro["cod_empresa"] = ctx["cod_empresa"]
+                segundos = registro["segundos"]
+                salvar_checkpoint(PASTA_RAIZ, ctx, nome)
+        finally:
+            progresso.encerrar_etapa(ctx, nome, segundos)
+    return etapa
+
+ETAPAS = [
+    ("backup", _instrumentar("backup", etapa_backup), WORKERS_BACKUP),
+    ("restore", _instrumentar("restore", etapa_restore), WORKERS_RESTORE),
+    ("compactar", _instrumentar("compactar", etapa_compactar), WORKERS_COMPACTAR),
+    ("upload", _instrumentar("upload", etapa_upload), WORKERS_UPLOAD),
+]
+
+def _reservar_disco(ctx):
+    """
+    Chamado pelo pipeline antes da base entrar na primeira etapa (inclusive nas retomadas).
+    Só deixa a base entrar quando houver espaço em disco para os temporários dela; a espera
+    acontece na alimentação do pipeline, nunca dentro de um worker de etapa.
+    """
+    reserva_disco.reservar(ctx["dsn"], ctx["espaco_estimado"])
+
 def rodar_backup(callback_progresso):
     """ 
-    Executa o ciclo completo: 
-    1. Backup (.fbk) -> 2. Restore (.fdb) -> 3. Compactação (.zip) -> 4. Upload FTP 
+    Executa o ciclo completo para todas as bases:
+    1. Backup (.fbk) -> 2. Restore (.fdb) -> 3. Compactação (.zip/.zst/.lz4) -> 4. Upload FTP 
+    As etapas rodam em pipeline: enquanto uma base compacta, a próxima já está no GBAK.
+    As bases entram da maior para a menor e só começam se houver espaço em disco (planejamento.py).
     """
-    total_bases = len(bases)
-    for idx, dsn in enumerate(bases):
-        inicio_cronometro = time.time()
-        cod_empresa = buscar_cod_empresa(dsn) or "DESCONHECIDO"
+    global pool_ftp, reserva_disco, limite_banda, progresso
+    if bases is None:
+        preparar_ambiente()
+
+    # Cada etapa de cada base vale a mesma fatia da barra; callback_progresso(valor, eta_segundos)
+    progresso = Progresso(callback_progresso, _medir_progresso, ETAPAS, len(bases) * len(ETAPAS), MODO_STREAMING)
+    avancar = progresso.avancar
+
+    def ao_concluir_etapa(ctx, etapa):
+        ctx["etapas_concluidas"] += 1
+        avancar(1)
+
+    falhas = []
+    adiados = []
+
+    def ao_finalizar_base(ctx, erro):
+        reserva_disco.liberar(ctx["dsn"])
+        if isinstance(erro, UploadAdiado):
+            adiados.append(ctx["nome_base"])
+        elif erro is not None:
+            falhas.append(ctx["nome_base"])
+        else:
+            registrar_backup(ctx["dsn"], ctx["transacao_atual"], ctx["transacao_ativa_mais_antiga"])
+            if ctx["validacao"]:
+                registrar_validacao(ctx["dsn"], ctx["validacao"])
+            remover_checkpoint(PASTA_RAIZ, ctx["dsn"])
+        with contexto_log(base=ctx["nome_base"]):
+            relatar_base(ctx, erro)
+        # Em caso de falha, as etapas que não rodaram contam como concluídas para a barra
+        progresso.finalizar_base(ctx)
+        avancar(len(ETAPAS) - ctx["etapas_concluidas"])
+
+    # Uma conexão por base, uma única vez, antes de começar (NUMSERIE e demais dados).
+    # As conexões são fechadas logo em seguida para não ficarem presas durante o GBAK.
+    log.info("Coletando metadados das bases...")
+    try:
+        metadados = coletar_metadados(bases)
+    finally:
+        fechar_conexoes()
+
+    contextos = []
+    for dsn in bases:
+        contextos.append({
+            "dsn": dsn,
+            "nome_base": os.path.basename(dsn.split(":")[-1]).replace(".FDB", ""),
+            "cod_empresa": "DESCONHECIDO",
+            "inicio": time.time(),
+            "etapas_concluidas": 0,
+            "transacao_atual": metadados.get(dsn, {}).get("transacao_atual"),
+            "transacao_ativa_mais_antiga": metadados.get(dsn, {}).get("transacao_ativa_mais_antiga"),
+            "etapas_puladas": (),
+        })
+
+    # Restore completo ou leve em cada base (validacao.py); uma base retomada mantém a escolha do checkpoint
+    for ctx in contextos:
+        if MODO_STREAMING and not STREAMING_COM_RESTORE:
+            ctx["validacao"], ctx["motivo_validacao"] = None, "STREAMING_COM_RESTORE=0"
+            continue
+        ctx["validacao"], ctx["motivo_validacao"] = escolher_validacao(ctx["dsn"])
+        if ctx["validacao"] == LEVE:
+            log.info(f"Base {ctx['nome_base']} com validação leve: {ctx['motivo_validacao']}")
+
+    # Bases interrompidas na execução anterior continuam da primeira etapa não concluída
+    nomes_etapas = [nome for nome, _, _ in ETAPAS]
+    for ctx in contextos:
+        inicial = carregar_checkpoint(PASTA_RAIZ, ctx, nomes_etapas)
+        ctx["etapas_puladas"] = tuple(nomes_etapas[:inicial])
+    limpar_orfaos(PASTA_RAIZ, [PASTA_BACKUP, PASTA_RESTORE], bases)
+    try:
+        aplicar_retencao()
+    except Exception:
+        log.warning("Falha na retenção do acervo local", exc_info=True)
+
+    # Bases sem transações desde o último backup ficam fora do pipeline
+    contextos, sem_alteracao = separar_bases(contextos)
+    for ctx in sem_alteracao:
+        relatar_sem_alteracao(ctx)
+        avancar(len(ETAPAS))
+
+    # Ordena pelo tamanho e recusa logo as bases que não caberiam no disco
+    # O que o acervo ainda pode ocupar no mesmo disco não está livre para os temporários
+    contextos, recusados, reserva_disco = planejar(contextos, PASTA_RAIZ, MODO_STREAMING, STREAMING_COM_RESTORE,
+                                                   espaco_reservado(PASTA_RAIZ))
+    for ctx, motivo in recusados:
         try:
-            progresso_base = idx / total_bases
-            incremento_etapa = 1.0 / total_bases / 4  # Cada uma das 4 etapas vale 1/4 da fatia da base
-            log.info(f"Iniciando processamento da base: {dsn}")
-            callback_progresso(progresso_base + (incremento_etapa * 0)) # 0% da base atual
-           
-            # Configuração de nomes de arquivos com timestamp
-            nome_base = os.path.basename(dsn.split(":")[-1]).replace(".FDB", "")
-            data = datetime.now().strftime("%Y%m%d_%H%M%S")
-            cod_empresa = buscar_cod_empresa(dsn) or "SEM_CODIGO"
-            nome_arquivo = f"{nome_base}_{cod_empresa}_{data}"
-            fbk = os.path.join(PASTA_BACKUP, f"{nome_arquivo}.fbk")
-            fdb_restore = os.path.join(PASTA_RESTORE, f"{nome_arquivo}.FDB")
-
-            si = subprocess.STARTUPINFO()
-            si.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-            si.wShowWindow = subprocess.SW_HIDE
-
-            
-            # Execução do GBAK para Backup
-            log.info(f"Executando GBAK Backup para: {fbk}")
-            subprocess.run([gbak_path, "-b", "-g", "-ig", "-l", "-user", FB_USER, "-password", FB_PASS, dsn, fbk], check=True, startupinfo=si)
-            callback_progresso(progresso_base + (incremento_etapa * 1))
-            
-            log.info("Backup físico (.fbk) gerado com sucesso.")
-            # Execução do GBAK para Restore (Validação da integridade do backup)
-            log.info(f"Iniciando Restore de validação em: {fdb_restore}")
-            subprocess.run([gbak_path, "-r", "-p", "4096", "-user", FB_USER, "-password", FB_PASS, fbk, fdb_restore], check=True, startupinfo=si)
-            callback_progresso(progresso_base + (incremento_etapa * 2))
-            log.info("Restore de validação concluído. Banco íntegro.")
-
-
-            # Preparação e envio do arquivo 
-            log.info("Compactando banco restaurado para formato ZIP...")
-            zip_fdb = compactar_fdb(fdb_restore)
-            os.remove(fdb_restore) # Remove o FDB temporário para poupar espaço
-            callback_progresso(progresso_base + (incremento_etapa * 3))
-            
-
-            log.info(f"Compactação finalizada: {zip_fdb}")
-            log.info(f"Enviando arquivo para o FTP da empresa {cod_empresa}...")
-            tamanho_mb = os.path.getsize(zip_fdb) / (1024 * 1024)
-            enviar_ftp(zip_fdb, cod_empresa)
-            callback_progresso(progresso_base + (incremento_etapa * 4))
-            log.info("Upload concluído!")
-
-            tempo_total_segundos = time.time() - inicio_cronometro
-            minutos = int(tempo_total_segundos // 60)
-            segundos = int(tempo_total_segundos % 60)
-
-            enviar_log_discord(
-                status="sucesso", 
-                codigo_empresa=cod_empresa, 
-                mensagem=f"✅ Backup concluído: {nome_base}",
-                detalhes=(
-                    f"📦 Tamanho: {tamanho_mb:.2f} MB\n"
-                    f"⏱️ Tempo: {minutos}m {segundos}s\n"
-                    f"🔗 Arquivo: {os.path.basename(zip_fdb)}"
-                )
-            )
-            if os.path.exists(fbk): os.remove(fbk)
-            if os.path.exists(zip_fdb): os.remove(zip_fdb)
-
-        except Exception as e:
-            log.error(f" Erro no processamento da base {dsn}: {e}")
-            log.error(f"Erro crítico: {e}")
-            tempo_total_segundos = time.time() - inicio_cronometro
-            minutos = int(tempo_total_segundos // 60)
-            segundos = int(tempo_total_segundos % 60)
-
-            enviar_log_discord(
-                status="erro", 
-                codigo_empresa=cod_empresa, 
-                mensagem=f"❌ Falha no backup: {nome_base}",
-                detalhes=f"⏱️ **Tentativa durou:** {minutos}m {segundos}s\n⚠️ **Erro:** {str(e)}"
-            )
+            ctx["cod_empresa"] = buscar_cod_empresa(ctx["dsn"]) or "SEM_CODIGO"
+        except Exception:
+            pass
+        ao_finalizar_base(ctx, Exception(motivo))
+
+    pool_ftp = PoolFTP(FTP_HOST, FTP_USER, _senha_ftp, porta=FTP_PORT, tamanho=WORKERS_UPLOAD)
+    limite_banda = criar_limite()
+
+    iniciar_execucao()
+    inicio_execucao = time.time()
+    monitor = MonitorDisco(PASTA_RAIZ).iniciar()
+
+    progresso.adicionar_bases(contextos)
+    progresso.iniciar() # Bases puladas ou recusadas já contam
+    try:
+        executar_pipeline(
+            contextos,
+            ETAPAS,
+            ao_concluir_etapa=ao_concluir_etapa,
+            ao_finalizar_item=ao_finalizar_base,
+            max_em_andamento=MAX_BASES_EM_ANDAMENTO,
+            ao_admitir=_reservar_disco,
+        )
+    finally:
+        progresso.parar()
+        pool_ftp.fechar()
+        monitor.parar()
+        finalizar_execucao({
+            "bases": len(bases),
+            "sem_alteracao": [ctx["nome_base"] for ctx in sem_alteracao],
+            "falhas": falhas,
+            "uploads_adiados": adiados,
+            "validacao": {ctx["nome_base"]: ctx["validacao"] for ctx in contextos},
+            "segundos": round(time.time() - inicio_execucao, 3),
+            "pico_disco_bytes": monitor.pico,
+        })
+    callback_progresso(1.0, 0)
+    return falhas
 
-    callback_progresso(1.0)
+# --- ACERVO LOCAL (reenvio e restore sem novo backup) ---
+def mostrar_acervo():
+    """ Lista as cópias guardadas no acervo local. """
+    copias = listar_acervo()
+    if not copias:
+        print("Acervo vazio.")
+    for copia in copias:
+        print(f"{copia['nome_base']:<20} {copia['criado_em']}  {copia['bytes'] / (1024 * 1024):>10.2f} MB  "
+              f"{copia['conteudo']}/{copia['codec']}  {os.path.basename(copia['caminho'])}")
+
+def reenviar_do_acervo(base):
+    """ Envia de novo para o FTP a última cópia da base guardada no acervo (pedido manual: sem limite de banda). """
+    global pool_ftp
+    copia = copia_mais_recente(base)
+    log.info(f"Reenviando do acervo: {os.path.basename(copia['caminho'])}")
+    pool_ftp = PoolFTP(FTP_HOST, FTP_USER, _senha_ftp, porta=FTP_PORT)
+    try:
+        enviar_ftp(copia["caminho"], copia["cod_empresa"], copia["manifesto"])
+    finally:
+        pool_ftp.fechar()
+    return copia
+
+def restaurar_do_acervo(base, destino):
+    """
+    Restaura a última cópia da base em 'destino' (pasta). Cópias do modo normal já
+    contêm o .FDB validado; as do modo streaming contêm o .fbk e passam pelo motor de restore.
+    """
+    global gbak_path, motor
+    copia = copia_mais_recente(base)
+    conferir_copia(copia)
+    os.makedirs(destino, exist_ok=True)
+    nome = os.path.splitext(os.path.basename(copia["caminho"]))[0]
+    fdb = os.path.join(destino, f"{nome}.FDB")
+    log.info(f"Restaurando do acervo: {os.path.basename(copia['caminho'])} -> {fdb}")
+    if copia["conteudo"] == "fdb":
+        descompactar(copia["caminho"], fdb)
+    else:
+        fbk = descompactar(copia["caminho"], os.path.join(destino, f"{nome}.fbk"))
+        try:
+            if motor is None:
+                gbak_path = localizar_gbak()
+                motor = criar_motor(gbak_path)
+            motor.restore(fbk, fdb)
+        finally:
+            os.remove(fbk)
+    log.info(f"Base restaurada do acervo em: {fdb}")
+    return fdb
+
+def _progresso_no_log(valor_decimal, eta_segundos=None):
+    """ Callback de progresso do modo sem interface: registra no log a cada 10%. """
+    faixa = int(valor_decimal * 10)
+    if faixa != getattr(_progresso_no_log, "ultima_faixa", None):
+        _progresso_no_log.ultima_faixa = faixa
+        restante = formatar_eta(eta_segundos)
+        log.info(f"Progresso: {int(valor_decimal * 100)}%{f' (faltam {restante})' if restante else ''}")
 
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Backup Mercosistem")
+    parser.add_argument("--headless", action="store_true",
+                        help="Roda sem interface gráfica (tarefa agendada / execução automática)")
+    parser.add_argument("--agendador", action="store_true",
+                        help="Fica residente e dispara o backup nos horários de AGENDA_HORARIOS")
+    parser.add_argument("--acervo", action="store_true", help="Lista as cópias guardadas no acervo local")
+    parser.add_argument("--reenviar", metavar="BASE", help="Envia de novo para o FTP a última cópia da base no acervo")
+    parser.add_argument("--restaurar", metavar="BASE", help="Restaura a última cópia da base no acervo (ver --destino)")
+    parser.add_argument("--destino", default="restaurado_acervo", help="Pasta onde o --restaurar grava o .FDB")
+    args = parser.parse_args()
+
+    if args.acervo or args.reenviar or args.restaurar:
+        # Usa só o acervo: não precisa parar o Atualizador nem esperar outro backup terminar
+        if args.acervo:
+            mostrar_acervo()
+        elif args.reenviar:
+            reenviar_do_acervo(args.reenviar)
+        else:
+            print(restaurar_do_acervo(args.restaurar, args.destino))
+        sys.exit(0)
+
+    if args.agendador:
+        from agendador import executar_agendador
+        executar_agendador(sys.modules[__name__])
+        sys.exit(0)
+
+    from estado_local import TravaExecucao
+    trava_execucao = TravaExecucao()
+    if not trava_execucao.adquirir():
+        log.warning("Já existe um backup em execução (agendador ou outra janela). Encerrando.")
+        sys.exit(0)
+
     log.info("Finalizando o Atualizador.exe antes de iniciar o backup...")
     matar_atualizador()
     log.info("Atualizador finalizado.")
     log.info("INICIANDO PROCESSO DE BACKUP")
-    mostrar_loading(rodar_backup) # Chama a interface visual enquanto processa
+    if args.headless:
+        rodar_backup(_progresso_no_log) # Nunca importa o customtkinter
+    else:
+        from interface import mostrar_loading
+        mostrar_loading(rodar_backup) # Chama a interface visual enquanto processa
+    finalizar_notificacoes() # Entrega os relatórios que ainda estão na fila do Discord
+    trava_execucao.liberar()
     log.info("PROCESSO DE BACKUP FINALIZADO")
@@ -0,0 +1,150 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from configuracao import env_float
+from log import configurar_logger
+
+log = configurar_logger()
+
+# =================================================================
+# LIMITE DE BANDA E JANELAS DE UPLOAD
+# =================================================================
+# Em links pequenos o upload sem limite ocupa toda a banda de subida do
+# cliente (ERP, PDV, TEF). Os perfis definem a velocidade por horário:
+#
+#   FTP_PERFIS_BANDA=19:00-07:00=livre;07:00-08:00=512;08:00-19:00=bloqueado
+#   FTP_LIMITE_KBPS=0   -> limite fora dos horários listados (0 = livre)
+#
+# Valores: 'livre', 'bloqueado' ou KB/s. Faixas podem virar a meia-noite.
+# Um upload que não terminaria antes do próximo horário bloqueado nem começa,
+# e um upload em andamento para quando o bloqueio começa: nos dois casos a
+# base fica com o checkpoint de "compactado" e o envio continua na próxima
+# execução (o FTP retoma de onde parou).
+
+PERFIS_BANDA = os.getenv("FTP_PERFIS_BANDA", "")
+LIMITE_PADRAO_KBPS = env_float("FTP_LIMITE_KBPS", 0)
+LIVRE = float("inf")
+BLOQUEADO = 0.0
+LEITURAS_POR_SEGUNDO = 10  # Com limite, lê blocos menores para não mandar rajadas
+DIA = 24 * 60
+
+class UploadAdiado(Exception):
+    """ O upload não cabe na janela permitida e fica para a próxima execução. """
+
+def _minutos(texto):
+    hora, minuto = (int(parte) for parte in texto.strip().split(":"))
+    return hora * 60 + minuto
+
+def _taxa(texto):
+    texto = texto.strip().lower()
+    if texto == "livre":
+        return LIVRE
+    if texto == "bloqueado":
+        return BLOQUEADO
+    kbps = float(texto)
+    return kbps * 1024 if kbps > 0 else LIVRE
+
+def ler_perfis(texto=PERFIS_BANDA):
+    """ Converte a configuração em faixas (inicio, fim, bytes/s) em minutos do dia, sem virar a meia-noite. """
+    faixas = []
+    for item in texto.split(";"):
+        if not item.strip():
+            continue
+        try:
+            horario, valor = item.split("=")
+            inicio, fim = (_minutos(h) for h in horario.split("-"))
+            taxa = _taxa(valor)
+        except ValueError:
+            raise Exception(f"Perfil de banda inválido em FTP_PERFIS_BANDA: '{item}' (use HH:MM-HH:MM=KBps|livre|bloqueado)")
+        if inicio < fim:
+            faixas.append((inicio, fim, taxa))
+        else:
+            faixas.append((inicio, DIA, taxa))
+            faixas.append((0, fim, taxa))
+    return faixas
+
+class LimiteBanda:
+    """ Balde de fichas compartilhado por todos os uploads, com a taxa do perfil do horário atual. """
+
+    def __init__(self, faixas, padrao=LIMITE_PADRAO_KBPS * 1024):
+        self.faixas = faixas
+        self.padrao = padrao if padrao > 0 else LIVRE
+        self._fichas = 0.0
+        self._ultimo = time.monotonic()
+        self._trava = threading.Lock()
+
+    def taxa_em(self, momento):
+        minuto = momento.hour * 60 + momento.minute
+        for inicio, fim, taxa in self.faixas:
+            if inicio <= minuto < fim:
+                return taxa
+        return self.padrao
+
+    def _proxima_mudanca(self, momento):
+        """ Próximo início/fim de faixa depois de 'momento'. """
+        minuto = momento.hour * 60 + momento.minute
+        limites = sorted({m for inicio, fim, _ in self.faixas for m in (inicio, fim)} | {DIA})
+        proximo = next(m for m in limites if m > minuto)
+        meia_noite = momento.replace(hour=0, minute=0, second=0, microsecond=0)
+        return meia_noite + timedelta(minutes=proximo)
+
+    def capacidade_ate_bloqueio(self, agora, necessario):
+        """ Quantos bytes dá para enviar a partir de agora até o próximo horário bloqueado. """
+        total = 0.0
+        momento = agora
+        for _ in range(len(self.faixas) * 7 + 8):  # No máximo uma semana de faixas
+            taxa = self.taxa_em(momento)
+            if taxa == BLOQUEADO:
+                return total
+            if taxa == LIVRE:
+                return LIVRE
+            proxima = self._proxima_mudanca(momento)
+            total += taxa * (proxima - momento).total_seconds()
+            if total >= necessario:
+                return total
+            momento = proxima
+        return total
+
+    def verificar_janela(self, restantes):
+        """ Adia o upload se ele não couber até o próximo bloqueio. """
+        agora = datetime.now()
+        capacidade = self.capacidade_ate_bloqueio(agora, restantes)
+        if capacidade == 0:
+            raise UploadAdiado("Fora da janela de upload (FTP_PERFIS_BANDA)")
+        if capacidade < restantes:
+            raise UploadAdiado(
+                f"{restantes / (1024 * 1024):.1f} MB não terminam antes do próximo horário bloqueado "
+                f"(cabem ~{capacidade / (1024 * 1024):.1f} MB)"
+            )
+
+    def tamanho_leitura(self, pedido):
+        taxa = self.taxa_em(datetime.now())
+        if taxa == LIVRE:
+            return pedido
+        return max(8192, min(pedido, int(taxa / LEITURAS_POR_SEGUNDO)))
+
+    def consumir(self, quantidade):
+        """ Espera o tempo necessário para enviar 'quantidade' bytes dentro do limite. Retorna True se limitou. """
+        with self._trava:
+            taxa = self.taxa_em(datetime.now())
+            if taxa == BLOQUEADO:
+                raise UploadAdiado("A janela de upload fechou durante o envio (FTP_PERFIS_BANDA)")
+            if taxa == LIVRE:
+                return False
+            agora = time.monotonic()
+            self._fichas = min(taxa, self._fichas + (agora - self._ultimo) * taxa)
+            self._ultimo = agora
+            self._fichas -= quantidade
+            espera = -self._fichas / taxa if self._fichas < 0 else 0
+        if espera:
+            time.sleep(espera)
+        return True
+
+def criar_limite():
+    """ Limite configurado no .env, ou None se o upload for sempre livre. """
+    faixas = ler_perfis()
+    if not faixas and LIMITE_PADRAO_KBPS <= 0:
+        return None
+    return LimiteBanda(faixas)
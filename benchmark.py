@@ -0,0 +1,305 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+# =================================================================
+# BENCHMARK DO PIPELINE DE BACKUP (GBAK simulado + FTP local)
+# =================================================================
+# Roda o rodar_backup() de verdade, mas trocando o GBAK pelo gbak_falso.py
+# e o FTP da empresa por um servidor FTP local (pyftpdlib).
+# Cada cenário (quantidade de bases x tamanho) roda em um processo separado,
+# e o resultado de todos vai para benchmark_resultados/benchmark_<data>.json.
+#
+# Uso:
+#   python benchmark.py                              (1, 10 e 40 bases de 5 e 50 MB)
+#   python benchmark.py --bases 1,10 --tamanhos-mb 100
+#   python benchmark.py --comparar benchmark_resultados/benchmark_anterior.json
+#
+# As variáveis do pipeline (COMPRESSAO_CODEC, PIPELINE_WORKERS_*, MODO_STREAMING...)
+# podem ser definidas no ambiente antes de rodar, e ficam registradas no resultado.
+
+PASTA_PROJETO = os.path.dirname(os.path.abspath(__file__))
+PASTA_RESULTADOS = os.path.join(PASTA_PROJETO, "benchmark_resultados")
+VARIAVEIS_REGISTRADAS = ("COMPRESSAO_CODEC", "COMPRESSAO_NIVEL", "COMPRESSAO_WORKERS", "MODO_STREAMING",
+                         "STREAMING_COM_RESTORE", "FTP_BLOCO_KB", "GBAK_FALSO_MBPS", "PLANEJAMENTO_ORDEM",
+                         "MOTOR_BACKUP", "VALIDACAO_COMPLETA_A_CADA")
+LIMITE_REGRESSAO = 0.10  # Queda de throughput ou aumento de pico de disco/memória acima de 10% é sinalizado
+
+# --- PREPARAÇÃO DO CENÁRIO ---
+def gerar_banco_falso(caminho, tamanho_mb):
+    """ Gera um arquivo com conteúdo parcialmente compressível, parecido com um banco real. """
+    bloco_texto = (b"CLIENTE;PRODUTO;0000001;VENDA;2026-01-01;" * 20000)[:700 * 1024]
+    with open(caminho, "wb") as arq:
+        for _ in range(tamanho_mb):
+            arq.write(os.urandom(324 * 1024) + bloco_texto)
+
+def criar_gbak_falso(pasta):
+    """ Cria um executável que chama o gbak_falso.py (o pipeline chama o GBAK como um programa). """
+    script = os.path.join(PASTA_PROJETO, "gbak_falso.py")
+    if os.name == "nt":
+        caminho = os.path.join(pasta, "gbak_falso.cmd")
+        with open(caminho, "w") as arq:
+            arq.write(f'@"{sys.executable}" "{script}" %*\n')
+    else:
+        caminho = os.path.join(pasta, "gbak_falso.sh")
+        with open(caminho, "w") as arq:
+            arq.write(f'#!/bin/sh\nexec "{sys.executable}" "{script}" "$@"\n')
+        os.chmod(caminho, 0o755)
+    return caminho
+
+def _porta_livre():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def iniciar_ftp_local(pasta, usuario, senha):
+    """
+    Sobe um servidor FTP local (pyftpdlib) em outro processo e devolve (processo, porta).
+    Precisa ser outro processo: o pyftpdlib faz os.chdir() a cada CWD, o que mudaria
+    a pasta atual do próprio pipeline (que usa caminhos relativos).
+    """
+    try:
+        import pyftpdlib  # noqa: F401
+    except ImportError:
+        raise Exception("O benchmark requer o pacote 'pyftpdlib' (pip install pyftpdlib)")
+
+    porta = _porta_livre()
+    processo = subprocess.Popen(
+        [sys.executable, "-m", "pyftpdlib", "-i", "127.0.0.1", "-p", str(porta), "-w",
+         "-d", pasta, "-u", usuario, "-P", senha],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    # Espera o servidor começar a aceitar conexões
+    for _ in range(50):
+        try:
+            socket.create_connection(("127.0.0.1", porta), timeout=0.2).close()
+            return processo, porta
+        except OSError:
+            time.sleep(0.1)
+    processo.kill()
+    raise Exception("Servidor FTP local não subiu a tempo")
+
+def _tamanho_pasta(pasta):
+    total = 0
+    for root, _, files in os.walk(pasta):
+        for file in files:
+            try:
+                total += os.path.getsize(os.path.join(root, file))
+            except OSError:
+                pass  # Arquivo removido pelo pipeline durante a varredura
+    return total
+
+def _pico_memoria_mb():
+    """ Pico de memória do processo (o GBAK roda em processo separado e não entra na conta). """
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / (1024 * 1024)
+    except ImportError:
+        pass
+    try:
+        import resource
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return pico / 1024 if sys.platform != "darwin" else pico / (1024 * 1024)
+    except ImportError:
+        return None
+
+# --- EXECUÇÃO DE UM CENÁRIO (processo filho) ---
+def executar_cenario(qtd_bases, tamanho_mb):
+    pasta = tempfile.mkdtemp(prefix="bench_merco_")
+    servidor = None
+    try:
+        pasta_bases = os.path.join(pasta, "bases")
+        pasta_ftp = os.path.join(pasta, "ftp")
+        os.makedirs(pasta_bases)
+        os.makedirs(os.path.join(pasta_ftp, "ENTRADAS"))  # Mesma estrutura do FTP da empresa
+
+        bases = []
+        for i in range(qtd_bases):
+            caminho = os.path.join(pasta_bases, f"BENCH{i:02d}.FDB")
+            gerar_banco_falso(caminho, tamanho_mb)
+            bases.append(caminho)
+
+        prefixo_senha = "bench"
+        servidor, porta = iniciar_ftp_local(pasta_ftp, "bench", prefixo_senha + datetime.now().strftime("%d%m%y"))
+
+        os.environ.update({
+            "BACKUP_BASES": ";".join(bases),
+            "GBAK_PATH": criar_gbak_falso(pasta),
+            "FTP_HOST": "127.0.0.1",
+            "FTP_PORT": str(porta),
+            "FTP_USER": "bench",
+            "FTP_PASS_PREFIX": prefixo_senha,
+            "FB_USER": "SYSDBA",
+            "FB_PASS": "bench",
+            "API_KEY_DISCORD": "",
+        })
+        os.chdir(pasta)
+        open(".env", "w").close()  # O backup_restore exige o .env (as variáveis já estão no ambiente)
+
+        sys.path.insert(0, PASTA_PROJETO)
+        # Estado (histórico de progresso, validação, acervo) e logs do cenário ficam na pasta
+        # temporária: o benchmark não pode mexer nos arquivos que a ferramenta real usa
+        import log
+        log.base_dir = lambda: pasta
+        import backup_restore
+        from gbak_falso import registrar_motor_simulado, registrar_servicos_simulado
+        registrar_motor_simulado()  # Disponível com MOTOR_BACKUP=simulado
+        registrar_servicos_simulado()  # Disponível com MOTOR_BACKUP=servicos_simulado
+
+        # Sem Firebird: o código da empresa é fixo
+        backup_restore.coletar_metadados = lambda lista: {}
+        backup_restore.buscar_cod_empresa = lambda dsn: "BENCH"
+
+        tempos = {nome: [] for nome, _, _ in backup_restore.ETAPAS}
+        falhas = []
+
+        def cronometrar(nome, funcao):
+            def etapa(ctx):
+                inicio = time.perf_counter()
+                try:
+                    return funcao(ctx)
+                except Exception as e:
+                    falhas.append(f"{nome}: {e}")
+                    raise
+                finally:
+                    tempos[nome].append(time.perf_counter() - inicio)
+            return etapa
+
+        for i, (nome, funcao, workers) in enumerate(backup_restore.ETAPAS):
+            backup_restore.ETAPAS[i] = (nome, cronometrar(nome, funcao), workers)
+
+        # Amostragem do espaço temporário ocupado em backup_Restore
+        pico_disco = [0]
+        parar = threading.Event()
+        def monitorar_disco():
+            while not parar.is_set():
+                pico_disco[0] = max(pico_disco[0], _tamanho_pasta(backup_restore.PASTA_RAIZ))
+                parar.wait(0.2)
+        monitor = threading.Thread(target=monitorar_disco, daemon=True)
+        monitor.start()
+
+        inicio = time.perf_counter()
+        bases_com_falha = backup_restore.rodar_backup(lambda valor, eta=None: None)
+        total = time.perf_counter() - inicio
+        parar.set()
+        monitor.join()
+        backup_restore.finalizar_notificacoes(timeout=5)
+
+        enviados = [f for _, _, files in os.walk(pasta_ftp) for f in files]
+        mb_total = qtd_bases * tamanho_mb
+        return {
+            "bases": qtd_bases,
+            "tamanho_mb": tamanho_mb,
+            "tempo_total_s": round(total, 3),
+            "throughput_mb_s": round(mb_total / total, 2),
+            "etapas": {
+                nome: {
+                    "total_s": round(sum(lista), 3),
+                    "media_s": round(sum(lista) / len(lista), 3) if lista else 0,
+                    "max_s": round(max(lista), 3) if lista else 0,
+                }
+                for nome, lista in tempos.items()
+            },
+            "pico_disco_mb": round(pico_disco[0] / (1024 * 1024), 2),
+            "pico_memoria_mb": round(_pico_memoria_mb() or 0, 2),
+            "arquivos_enviados": len(enviados),
+            "falhas": falhas,
+            "bases_com_falha": bases_com_falha,  # Inclui as recusadas no planejamento (sem etapa executada)
+        }
+    finally:
+        if servidor:
+            servidor.kill()
+            servidor.wait()
+        os.chdir(PASTA_PROJETO)
+        shutil.rmtree(pasta, ignore_errors=True)
+
+# --- ORQUESTRAÇÃO (processo principal) ---
+def rodar_em_processo(qtd_bases, tamanho_mb):
+    """ Cada cenário roda num processo novo: o backup_restore lê as bases na importação. """
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--cenario", str(qtd_bases), str(tamanho_mb)],
+        capture_output=True, text=True, cwd=PASTA_PROJETO
+    )
+    linhas = proc.stdout.strip().splitlines()
+    if proc.returncode != 0 or not linhas:
+        raise Exception(f"Cenário {qtd_bases}x{tamanho_mb}MB falhou:\n{proc.stderr[-2000:]}")
+    return json.loads(linhas[-1])
+
+# Métricas comparadas: (campo, unidade, True se maior é melhor)
+METRICAS_COMPARADAS = (
+    ("throughput_mb_s", "MB/s", True),
+    ("pico_disco_mb", "MB de pico em disco", False),
+    ("pico_memoria_mb", "MB de pico de memória", False),
+)
+
+def comparar(atual, anterior):
+    """ Mostra a variação de throughput, pico de disco e pico de memória em relação a um resultado anterior. """
+    antigos = {(c["bases"], c["tamanho_mb"]): c for c in anterior.get("cenarios", [])}
+    regressoes = 0
+    for cenario in atual["cenarios"]:
+        antigo = antigos.get((cenario["bases"], cenario["tamanho_mb"]))
+        if not antigo:
+            continue
+        for campo, unidade, maior_melhor in METRICAS_COMPARADAS:
+            if not antigo.get(campo) or campo not in cenario:
+                continue  # Resultado antigo sem a medida (ex: pico de memória indisponível)
+            variacao = cenario[campo] / antigo[campo] - 1
+            alerta = ""
+            if (-variacao if maior_melhor else variacao) > LIMITE_REGRESSAO:
+                alerta = "  <-- REGRESSÃO"
+                regressoes += 1
+            print(f"{cenario['bases']:>3} bases x {cenario['tamanho_mb']:>5} MB: "
+                  f"{antigo[campo]:.2f} -> {cenario[campo]:.2f} {unidade} ({variacao:+.1%}){alerta}")
+    return regressoes
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do pipeline de backup com GBAK simulado e FTP local.")
+    parser.add_argument("--bases", default="1,10,40", help="Quantidades de bases (ex: 1,10,40)")
+    parser.add_argument("--tamanhos-mb", default="5,50", help="Tamanhos de cada base em MB (ex: 5,50)")
+    parser.add_argument("--comparar", help="Arquivo JSON de um benchmark anterior para comparação")
+    parser.add_argument("--cenario", nargs=2, type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.cenario:
+        print(json.dumps(executar_cenario(*args.cenario)))
+        return 0
+
+    resultado = {
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "configuracao": {nome: os.getenv(nome) for nome in VARIAVEIS_REGISTRADAS if os.getenv(nome)},
+        "cenarios": [],
+    }
+    for qtd_bases in [int(v) for v in args.bases.split(",")]:
+        for tamanho_mb in [int(v) for v in args.tamanhos_mb.split(",")]:
+            print(f"Rodando {qtd_bases} base(s) de {tamanho_mb} MB...", flush=True)
+            cenario = rodar_em_processo(qtd_bases, tamanho_mb)
+            resultado["cenarios"].append(cenario)
+            print(f"  {cenario['tempo_total_s']:.1f}s | {cenario['throughput_mb_s']:.2f} MB/s | "
+                  f"pico disco {cenario['pico_disco_mb']:.0f} MB | falhas: {len(cenario['bases_com_falha'])}")
+
+    os.makedirs(PASTA_RESULTADOS, exist_ok=True)
+    destino = os.path.join(PASTA_RESULTADOS, f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(destino, "w", encoding="utf-8") as arq:
+        json.dump(resultado, arq, ensure_ascii=False, indent=2)
+    print(f"Resultado salvo em: {destino}")
+
+    if args.comparar:
+        with open(args.comparar, "r", encoding="utf-8") as arq:
+            return 1 if comparar(resultado, json.load(arq)) else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,287 @@
+import hashlib
+import os
+import shutil
+import struct
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# =================================================================
+# COMPRESSÃO PARALELA DOS ARQUIVOS DE BACKUP
+# =================================================================
+# Codecs disponíveis:
+#   zip  -> ZIP padrão (deflate), abre em qualquer máquina (Windows Explorer, 7-Zip...)
+#   zstd -> arquivo .zst (requer o pacote 'zstandard'), bem mais rápido e compacto
+#   lz4  -> arquivo .lz4 (requer o pacote 'lz4'), o mais rápido, compressão menor
+#
+# Em todos os codecs o arquivo é dividido em blocos comprimidos em paralelo,
+# mas o resultado final continua sendo um único arquivo no formato padrão.
+
+EXTENSOES = {"zip": ".zip", "zstd": ".zst", "lz4": ".lz4"}
+NIVEIS_PADRAO = {"zip": 6, "zstd": 3, "lz4": 0}
+
+TAMANHO_BLOCO = 4 * 1024 * 1024
+JANELA_DEFLATE = 32 * 1024  # Dicionário herdado do bloco anterior (mantém a taxa de compressão)
+
+def _deflate_bloco(dados, dicionario, nivel, final):
+    """
+    Comprime um bloco em deflate "cru". Blocos intermediários terminam com
+    Z_SYNC_FLUSH (alinhados em byte e sem marcar fim de stream), então podem ser
+    simplesmente concatenados, como faz o pigz.
+    """
+    if dicionario:
+        comp = zlib.compressobj(nivel, zlib.DEFLATED, -15, 9, zlib.Z_DEFAULT_STRATEGY, dicionario)
+    else:
+        comp = zlib.compressobj(nivel, zlib.DEFLATED, -15)
+    return comp.compress(dados) + comp.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+def _data_dos(momento):
+    """ Converte data/hora para o formato MS-DOS usado nos cabeçalhos ZIP. """
+    hora = (momento.hour << 11) | (momento.minute << 5) | (momento.second // 2)
+    data = ((momento.year - 1980) << 9) | (momento.month << 4) | momento.day
+    return hora, data
+
+class _SaidaContada:
+    """
+    Repassa as escritas para o arquivo de destino contando os bytes gravados e
+    calculando o SHA-256 do arquivo final (sem precisar reler do disco depois).
+    """
+
+    def __init__(self, arquivo):
+        self.arquivo = arquivo
+        self.bytes = 0
+        self.hash = hashlib.sha256()
+
+    def write(self, dados):
+        self.arquivo.write(dados)
+        self.bytes += len(dados)
+        self.hash.update(dados)
+        return len(dados)
+
+    def flush(self):
+        self.arquivo.flush()
+
+class Compactador:
+    """
+    Escritor de arquivo compactado: recebe os bytes via write() (de um arquivo
+    em disco ou direto do stdout do GBAK) e grava o arquivo final em 'destino'.
+    close() devolve as estatísticas (bytes de entrada/saída, SHA-256 do arquivo e tempo gasto).
+    """
+
+    def __init__(self, destino, nome_interno, codec="zip", nivel=None, workers=None):
+        codec = (codec or "zip").lower()
+        if codec not in EXTENSOES:
+            raise Exception(f"Codec de compressão desconhecido: {codec} (use zip, zstd ou lz4)")
+
+        self.codec = codec
+        self.nivel = NIVEIS_PADRAO[codec] if nivel is None else nivel
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.destino = destino
+        self.nome_interno = nome_interno
+        self.bytes_entrada = 0
+        self._inicio = time.time()
+        self._buffer = bytearray()
+        self._futuros = deque()
+        self._executor = None
+        self._fechado = False
+
+        self._arquivo = open(destino, "wb")
+        self._saida = _SaidaContada(self._arquivo)
+
+        try:
+            if codec == "zstd":
+                try:
+                    import zstandard
+                except ImportError:
+                    raise Exception("Codec 'zstd' requer o pacote 'zstandard' (pip install zstandard)")
+                cctx = zstandard.ZstdCompressor(level=self.nivel, threads=self.workers)
+                self._zstd = cctx.stream_writer(self._saida, closefd=False)
+            else:
+                if codec == "lz4":
+                    try:
+                        import lz4.frame
+                    except ImportError:
+                        raise Exception("Codec 'lz4' requer o pacote 'lz4' (pip install lz4)")
+                    self._lz4 = lz4.frame
+                    self._frames = 0
+                else:
+                    self._crc = 0
+                    self._anterior = b""
+                    self._escrever_cabecalho_zip()
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="compressao")
+        except Exception:
+            self._arquivo.close()
+            raise
+
+    # --- API pública ---
+    def write(self, dados):
+        self.bytes_entrada += len(dados)
+        if self.codec == "zstd":
+            self._zstd.write(dados)
+            return
+
+        self._buffer += dados
+        # Mantém sempre um resto no buffer: o último bloco só é conhecido no close()
+        while len(self._buffer) > TAMANHO_BLOCO:
+            bloco = bytes(self._buffer[:TAMANHO_BLOCO])
+            del self._buffer[:TAMANHO_BLOCO]
+            self._enviar_bloco(bloco, final=False)
+
+    def close(self):
+        if self._fechado:
+            return self.estatisticas()
+        self._fechado = True
+        try:
+            if self.codec == "zstd":
+                self._zstd.close()
+            else:
+                self._enviar_bloco(bytes(self._buffer), final=True)
+                self._buffer = bytearray()
+                while self._futuros:
+                    self._saida.write(self._futuros.popleft().result())
+                if self.codec == "zip":
+                    self._escrever_final_zip()
+        finally:
+            if self._executor:
+                self._executor.shutdown(wait=True)
+            self._arquivo.close()
+        return self.estatisticas()
+
+    def estatisticas(self):
+        segundos = max(time.time() - self._inicio, 0.001)
+        return {
+            "arquivo": self.destino,
+            "codec": self.codec,
+            "nivel": self.nivel,
+            "bytes_entrada": self.bytes_entrada,
+            "bytes_saida": self._saida.bytes,
+            "sha256": self._saida.hash.hexdigest(),
+            "segundos": segundos,
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, traceback):
+        if tipo is None:
+            self.close()
+        else:
+            # Em caso de erro não finaliza o arquivo, apenas libera os recursos
+            self._fechado = True
+            if self._executor:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+            self._arquivo.close()
+
+    # --- Blocos em paralelo ---
+    def _enviar_bloco(self, bloco, final):
+        if self.codec == "zip":
+            self._crc = zlib.crc32(bloco, self._crc)
+            futuro = self._executor.submit(_deflate_bloco, bloco, self._anterior, self.nivel, final)
+            self._anterior = bloco[-JANELA_DEFLATE:]
+        else:
+            if not bloco and self._frames:
+                return  # Não precisa de frame vazio no final
+            futuro = self._executor.submit(self._lz4.compress, bloco, compression_level=self.nivel)
+            self._frames += 1
+
+        self._futuros.append(futuro)
+        # Limita a quantidade de blocos em memória aguardando gravação (na ordem)
+        while len(self._futuros) > self.workers * 2:
+            self._saida.write(self._futuros.popleft().result())
+
+    # --- Estrutura do ZIP (entrada única, ZIP64, com data descriptor) ---
+    def _escrever_cabecalho_zip(self):
+        self._hora_dos, self._data_dos = _data_dos(datetime.now())
+        self._nome_bytes = self.nome_interno.encode("utf-8")
+        # bit 3: tamanhos/CRC vão no data descriptor | bit 11: nome em UTF-8
+        self._flags = 0x08 | 0x800
+        extra = struct.pack("<HHQQ", 0x0001, 16, 0, 0)
+        self._saida.write(struct.pack(
+            "<4s5H3L2H", b"PK\x03\x04", 45, self._flags, 8, self._hora_dos, self._data_dos,
+            0, 0xFFFFFFFF, 0xFFFFFFFF, len(self._nome_bytes), len(extra)
+        ))
+        self._saida.write(self._nome_bytes)
+        self._saida.write(extra)
+        self._inicio_dados = self._saida.bytes
+
+    def _escrever_final_zip(self):
+        tamanho_comprimido = self._saida.bytes - self._inicio_dados
+        crc = self._crc & 0xFFFFFFFF
+
+        # Data descriptor (formato ZIP64)
+        self._saida.write(struct.pack("<4sLQQ", b"PK\x07\x08", crc, tamanho_comprimido, self.bytes_entrada))
+
+        # Diretório central
+        inicio_central = self._saida.bytes
+        extra = struct.pack("<HHQQQ", 0x0001, 24, self.bytes_entrada, tamanho_comprimido, 0)
+        self._saida.write(struct.pack(
+            "<4s4B4HL2L5H2L", b"PK\x01\x02", 45, 0, 45, 0, self._flags, 8, self._hora_dos, self._data_dos,
+            crc, 0xFFFFFFFF, 0xFFFFFFFF, len(self._nome_bytes), len(extra), 0, 0, 0, 0x20, 0xFFFFFFFF
+        ))
+        self._saida.write(self._nome_bytes)
+        self._saida.write(extra)
+        tamanho_central = self._saida.bytes - inicio_central
+
+        # Registros de fim de arquivo (ZIP64 + tradicional)
+        inicio_fim64 = self._saida.bytes
+        self._saida.write(struct.pack(
+            "<4sQ2H2L4Q", b"PK\x06\x06", 44, 45, 45, 0, 0, 1, 1, tamanho_central, inicio_central
+        ))
+        self._saida.write(struct.pack("<4sLQL", b"PK\x06\x07", 0, inicio_fim64, 1))
+        self._saida.write(struct.pack(
+            "<4s4H2LH", b"PK\x05\x06", 0, 0, 1, 1, 0xFFFFFFFF, 0xFFFFFFFF, 0
+        ))
+
+# =================================================================
+# ATALHOS
+# =================================================================
+
+def nome_compactado(caminho, codec="zip"):
+    """ Troca a extensão do arquivo pela extensão do codec (ex: BASE.FDB -> BASE.zip). """
+    return os.path.splitext(caminho)[0] + EXTENSOES[(codec or "zip").lower()]
+
+def compactar_arquivo(origem, codec="zip", nivel=None, workers=None, ao_progresso=None):
+    """
+    Compacta um arquivo do disco e devolve as estatísticas da compressão.
+    ao_progresso(bytes_lidos) é chamado a cada bloco lido.
+    """
+    destino = nome_compactado(origem, codec)
+    with Compactador(destino, os.path.basename(origem), codec, nivel, workers) as comp:
+        with open(origem, "rb") as arq:
+            while True:
+                bloco = arq.read(TAMANHO_BLOCO)
+                if not bloco:
+                    break
+                comp.write(bloco)
+                if ao_progresso:
+                    ao_progresso(comp.bytes_entrada)
+    return comp.close()
+
+def descompactar(origem, destino):
+    """ Extrai o conteúdo de um arquivo gerado pelo Compactador (codec pela extensão) em 'destino'. """
+    extensao = os.path.splitext(origem)[1].lower()
+    with open(destino, "wb") as saida:
+        if extensao == EXTENSOES["zip"]:
+            import zipfile
+            with zipfile.ZipFile(origem) as arquivo_zip, arquivo_zip.open(arquivo_zip.namelist()[0]) as entrada:
+                shutil.copyfileobj(entrada, saida, TAMANHO_BLOCO)
+        elif extensao == EXTENSOES["zstd"]:
+            import zstandard
+            with open(origem, "rb") as entrada:
+                zstandard.ZstdDecompressor().copy_stream(entrada, saida, write_size=TAMANHO_BLOCO)
+        elif extensao == EXTENSOES["lz4"]:
+            import lz4.frame
+            with lz4.frame.open(origem, "rb") as entrada:  # Lê os frames concatenados em sequência
+                shutil.copyfileobj(entrada, saida, TAMANHO_BLOCO)
+        else:
+            raise Exception(f"Extensão de arquivo compactado desconhecida: {origem}")
+    return destino
+
+def resumo_compressao(stats):
+    """ Texto curto para o relatório: taxa de compressão e velocidade. """
+    mb_entrada = stats["bytes_entrada"] / (1024 * 1024)
+    proporcao = (stats["bytes_saida"] / stats["bytes_entrada"] * 100) if stats["bytes_entrada"] else 0
+    velocidade = mb_entrada / stats["segundos"]
+    return f"{stats['codec']} nível {stats['nivel']} | {proporcao:.1f}% do original | {velocidade:.1f} MB/s"
@@ -0,0 +1,30 @@
+import logging
+import os
+
+# =================================================================
+# LEITURA DE NÚMEROS DO .ENV
+# =================================================================
+# Os módulos leem as configurações na importação. Um valor mal digitado no
+# .env (ex: FTP_LIMITE_KBPS=512k) não pode derrubar o programa antes mesmo de
+# abrir o log: o valor padrão é usado e o problema fica registrado como aviso.
+# Usa o logger pelo nome (sem importar o log.py, que também lê daqui).
+
+log = logging.getLogger("Backup_Mercosistem")
+
+def _ler(nome, padrao, conversor):
+    valor = os.getenv(nome)
+    if valor is None or not valor.strip():
+        return padrao
+    try:
+        return conversor(valor.strip())
+    except ValueError:
+        log.warning(f"Valor inválido em {nome}: '{valor}'. Usando o padrão ({padrao}).")
+        return padrao
+
+def env_int(nome, padrao):
+    """ Lê um inteiro do .env, usando o valor padrão se estiver vazio ou inválido. """
+    return _ler(nome, padrao, int)
+
+def env_float(nome, padrao):
+    """ Lê um número (aceita decimais) do .env, usando o valor padrão se estiver vazio ou inválido. """
+    return _ler(nome, padrao, float)
@@ -1,13 +1,13 @@
 import os
 import sys
-import fdb
-import re
-import subprocess
 from dotenv import load_dotenv
 
 # Carrega as variáveis de ambiente (usuário e senha do banco)
 load_dotenv()
+from configuracao import env_int
 from log import configurar_logger
+from estado_local import ler_estado, salvar_estado
+from sondagem_firebird import sondar_portas, primeira_que_funcionar, porta_em_cache, salvar_porta
 
 log = configurar_logger()
 
@@ -15,6 +15,15 @@ log = configurar_logger()
 FB_USER = os.getenv("FB_USER")
 FB_PASS = os.getenv("FB_PASS")
 
+# Busca do banco base: pastas que nunca contêm o banco e profundidade máxima da varredura
+PASTAS_IGNORADAS = {
+    "backup_restore", "backup_acervo", "logs_backup_mercosistem", "estado_backup_mercosistem",
+    "xml", "xmls", "nfe", "nfce", "cte", "pdf", "imagens", "fotos", "img",
+    "documentos", "temp", "tmp", "__pycache__",
+}
+PASTAS_IGNORADAS.update(p.strip().lower() for p in os.getenv("DESCOBERTA_IGNORAR", "").split(",") if p.strip())
+PROFUNDIDADE_MAXIMA = env_int("DESCOBERTA_PROFUNDIDADE", 4)
+
 # =================================================================
 # LOCALIZAÇÃO DE DIRETÓRIOS E INSTÂNCIAS
 # =================================================================
@@ -38,39 +47,91 @@ def caminho_base():
 
 def capturar_portas_firebird():
     """ 
-    Varre o sistema via comando netstat para encontrar quais portas (3050, 3051...)
-    possuem instâncias do Firebird ativas e escutando conexões.
+    Descobre quais portas (3050, 3051... + FB_PORTAS do .env) possuem instâncias
+    do Firebird escutando conexões, testando todas em paralelo via socket.
     """
-    # Executa comando de rede para filtrar portas 305x (padrão Firebird)
-    cmd = 'netstat -ano | findstr LISTENING | findstr 305'
-    result = subprocess.run(cmd, capture_output=True, text=True, shell=True)
-
-    portas = set()
-    for linha in result.stdout.splitlines():
-        match = re.search(r':(\d+)', linha)
-        if match:
-            portas.add(int(match.group(1)))
+    return sondar_portas()
 
-    return sorted(portas)
+def _pasta_ignorada(nome):
+    nome = nome.lower()
+    return nome in PASTAS_IGNORADAS or nome.startswith(".")
 
-def encontrar_banco_base(base_path):
+def _procurar_bancos(base_path, profundidade_maxima):
     """ 
-    Realiza uma busca recursiva no diretório para encontrar o banco de dados principal.
-    Prioridade: 1º EMPRESA.GDB (Sistemas antigos) | 2º GESTAO.FDB (Sistemas novos).
+    Varre a árvore uma única vez procurando os dois nomes ao mesmo tempo.
+    Pastas sabidamente irrelevantes (XML, imagens, backups...) e níveis
+    abaixo do limite de profundidade não são visitados.
     """
-    # Busca prioritária por EMPRESA.GDB
-    for root, dirs, files in os.walk(base_path):
-        for file in files:
-            if file.lower() == "empresa.gdb":
-                return os.path.join(root, file)
+    nivel_base = os.path.abspath(base_path).rstrip(os.sep).count(os.sep)
+    gestao = None
 
-    # Busca secundária por GESTAO.FDB
     for root, dirs, files in os.walk(base_path):
         for file in files:
-            if file.lower() == "gestao.fdb":
-                return os.path.join(root, file)
+            nome = file.lower()
+            if nome == "empresa.gdb":
+                return os.path.join(root, file)  # Maior prioridade: pode parar na hora
+            if nome == "gestao.fdb" and gestao is None:
+                gestao = os.path.join(root, file)
+
+        if os.path.abspath(root).rstrip(os.sep).count(os.sep) - nivel_base >= profundidade_maxima:
+            dirs[:] = []
+        else:
+            dirs[:] = [d for d in dirs if not _pasta_ignorada(d)]
 
-    return None
+    return gestao
+
+def _assinatura(pasta):
+    """ 
+    Datas das subpastas que a busca visitaria e os bancos candidatos soltos na pasta.
+    As pastas do próprio programa (backup_Restore, logs, estado...) e os demais arquivos
+    ficam de fora: criá-los na primeira execução não pode invalidar o cache.
+    """
+    assinatura = {}
+    with os.scandir(pasta) as entradas:
+        for entrada in entradas:
+            if entrada.is_dir() and not _pasta_ignorada(entrada.name):
+                assinatura[entrada.name] = entrada.stat().st_mtime
+            elif entrada.is_file() and entrada.name.lower() in ("empresa.gdb", "gestao.fdb"):
+                assinatura[entrada.name] = None  # Só a presença (o banco muda de data a todo momento)
+    return assinatura
+
+def _cache_valido(cache, base_path):
+    """ 
+    O cache vale se foi gerado para a mesma pasta, o banco continua lá e nem a pasta
+    dele nem a raiz da aplicação mudaram (ex: instalação nova de outro sistema).
+    """
+    banco = cache.get("banco")
+    if cache.get("base_path") != base_path or not banco or not os.path.isfile(banco):
+        return False
+    try:
+        return (_assinatura(os.path.dirname(banco)) == cache.get("assinatura_pasta")
+                and _assinatura(base_path) == cache.get("assinatura_raiz"))
+    except OSError:
+        return False
+
+def encontrar_banco_base(base_path, usar_cache=True):
+    """ 
+    Encontra o banco de dados principal dentro da pasta da aplicação.
+    Prioridade: 1º EMPRESA.GDB (Sistemas antigos) | 2º GESTAO.FDB (Sistemas novos).
+    O resultado fica salvo em cache: nas próximas execuções basta conferir o caminho e as datas das pastas.
+    """
+    base_path = os.path.abspath(base_path)
+
+    if usar_cache:
+        cache = ler_estado("descoberta_banco")
+        if _cache_valido(cache, base_path):
+            log.info(f"Banco base obtido do cache de descoberta: {cache['banco']}")
+            return cache["banco"]
+
+    banco = _procurar_bancos(base_path, PROFUNDIDADE_MAXIMA)
+    if banco:
+        salvar_estado("descoberta_banco", {
+            "base_path": base_path,
+            "banco": banco,
+            "assinatura_pasta": _assinatura(os.path.dirname(banco)),
+            "assinatura_raiz": _assinatura(base_path),
+        })
+    return banco
 
 # =================================================================
 # CONEXÃO E DESCOBERTA DE BASES DE DADOS
@@ -78,47 +139,57 @@ def encontrar_banco_base(base_path):
 
 def conectar_firebird(host, porta, banco, user, senha):
     """ Atalho para criar uma string DSN e conectar ao banco de dados. """
+    import fdb # Importado só na hora de conectar (deixa a inicialização do programa mais leve)
     banco = os.path.abspath(banco)
     dsn = f"{host}/{porta}:{banco}"
     return fdb.connect(dsn=dsn, user=user, password=senha)
 
 def obter_bases(empresa_db, portas_firebird):
     """
-    Tenta conexão no banco mestre (EMPRESA.GDB) testando todas as portas encontradas.
-    Uma vez conectado, lê a tabela 'EMPRESA' para listar todos os outros bancos ativos
-    que precisam sofrer backup.
+    Tenta conexão no banco mestre (EMPRESA.GDB) em todas as portas encontradas ao mesmo tempo.
+    A primeira que conectar lê a tabela 'EMPRESA' para listar todos os outros bancos ativos
+    que precisam sofrer backup. A porta vencedora fica em cache para a próxima execução.
     """
-    ultimo_erro = None
-
-    for porta in portas_firebird:
+    def ler_bases(porta):
+        log.info(f"Tentando conectar na porta {porta}...")
+        conn = conectar_firebird(
+            host="localhost",
+            porta=porta,
+            banco=empresa_db,
+            user=FB_USER,
+            senha=FB_PASS
+        )
         try:
-            log.info(f"Tentando conectar na porta {porta}...")
-            conn = conectar_firebird(
-                host="localhost",
-                porta=porta,
-                banco=empresa_db,
-                user=FB_USER,
-                senha=FB_PASS
-            )
-
             cur = conn.cursor()
             log.info("Conexão bem-sucedida EMPRESA.GDB. Buscando bases de dados ativas...")
             # Busca o caminho de todas as bases de dados cadastradas e ativas no sistema
             cur.execute("SELECT e.caminho FROM EMPRESA e WHERE e.ATIVO = 1")
-            bases = [row[0] for row in cur.fetchall()]
-
+            return [row[0] for row in cur.fetchall()]
+        finally:
             conn.close()
-            log.info(f"Conectado com sucesso na porta {porta}")
-            return bases
 
+    if not portas_firebird:
+        return []
+
+    # A porta da última execução é tentada sozinha primeiro (caso mais comum)
+    porta_anterior = porta_em_cache()
+    if porta_anterior in portas_firebird:
+        try:
+            bases = ler_bases(porta_anterior)
+            log.info(f"Conectado com sucesso na porta {porta_anterior} (cache)")
+            return bases
         except Exception as e:
-            ultimo_erro = e
-            log.error(f"Falha na porta {porta}: {e}")
+            log.error(f"Falha na porta {porta_anterior} (cache): {e}")
+            portas_firebird = [p for p in portas_firebird if p != porta_anterior]
+            if not portas_firebird:
+                # Era a única porta ativa: propaga o erro real da conexão (senha, caminho do banco...)
+                raise
 
     # Se exaurir todas as portas e não conectar, propaga o erro
-    if ultimo_erro:
-        raise ultimo_erro
-    return []
+    porta, bases = primeira_que_funcionar(portas_firebird, ler_bases)
+    salvar_porta(porta)
+    log.info(f"Conectado com sucesso na porta {porta}")
+    return bases
 
 # =================================================================
 # TESTE ISOLADO
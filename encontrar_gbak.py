@@ -1,4 +1,3 @@
-import winreg
 import os 
 
 possiveis_servicos = [
@@ -7,20 +6,30 @@ possiveis_servicos = [
     r"SYSTEM\CurrentControlSet\Services\FirebirdServer"
 ]
 
-gbak_path = None
+def localizar_gbak():
+    """ 
+    Localiza o gbak.exe pela pasta do serviço do Firebird no registro do Windows.
+    GBAK_PATH no .env tem prioridade sobre o registro (instalações fora do padrão, benchmark).
+    Só é chamado quando o backup vai começar, não na importação.
+    """
+    gbak_path = os.getenv("GBAK_PATH") or None
+    if gbak_path:
+        return gbak_path
 
-for servico in possiveis_servicos:
-    try:
-        with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, servico) as key:
-            image_path, _ = winreg.QueryValueEx(key, "ImagePath")
-            image_path = image_path.strip('"')
+    import winreg
 
-            pasta_firebird = os.path.dirname(image_path)
-            gbak_test = os.path.join(pasta_firebird, "gbak.exe")
+    for servico in possiveis_servicos:
+        try:
+            with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, servico) as key:
+                image_path, _ = winreg.QueryValueEx(key, "ImagePath")
+                image_path = image_path.strip('"')
 
-            if os.path.exists(gbak_test):
-                gbak_path = gbak_test
-                break
-    except FileNotFoundError:
-        continue
+                pasta_firebird = os.path.dirname(image_path)
+                gbak_test = os.path.join(pasta_firebird, "gbak.exe")
 
+                if os.path.exists(gbak_test):
+                    return gbak_test
+        except FileNotFoundError:
+            continue
+
+    return None
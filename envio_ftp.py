@@ -0,0 +1,244 @@
+import ftplib
+import hashlib
+import io
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from banda import UploadAdiado
+from log import configurar_logger
+
+log = configurar_logger()
+
+# =================================================================
+# UPLOAD FTP COM SESSÃO REAPROVEITADA E RETOMADA
+# =================================================================
+
+BLOCO_PADRAO = 1024 * 1024  # O padrão do ftplib (8 KB) limita muito a velocidade em links bons
+
+class PoolFTP:
+    """
+    Mantém um pequeno conjunto de sessões FTP já autenticadas, reaproveitadas
+    durante toda a execução (em vez de conectar e fazer login a cada base).
+    'senha' pode ser uma função, para senhas que mudam com a data.
+    """
+
+    def __init__(self, host, usuario, senha, porta=21, tamanho=1, timeout=60):
+        self.host = host
+        self.usuario = usuario
+        self.senha = senha
+        self.porta = porta
+        self.timeout = timeout
+        self._livres = queue.LifoQueue()
+        self._vagas = threading.BoundedSemaphore(max(1, tamanho))
+        self._todas = []
+        self._trava = threading.Lock()
+
+    def _conectar(self):
+        senha = self.senha() if callable(self.senha) else self.senha
+        ftp = ftplib.FTP(timeout=self.timeout)
+        ftp.connect(self.host, self.porta)
+        ftp.login(self.usuario, senha)
+        ftp.voidcmd("TYPE I")  # Necessário para o SIZE funcionar em modo binário
+        ftp.pastas_criadas = set()
+        with self._trava:
+            self._todas.append(ftp)
+        return ftp
+
+    def _descartar(self, ftp):
+        with self._trava:
+            if ftp in self._todas:
+                self._todas.remove(ftp)
+        try:
+            ftp.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def sessao(self):
+        """ Empresta uma sessão do pool. Sessões que deram erro são descartadas. """
+        self._vagas.acquire()
+        ftp = None
+        try:
+            try:
+                ftp = self._livres.get_nowait()
+                ftp.voidcmd("NOOP")  # Confere se o servidor não derrubou a sessão ociosa
+            except queue.Empty:
+                ftp = self._conectar()
+            except Exception:
+                self._descartar(ftp)
+                ftp = self._conectar()
+
+            yield ftp
+            self._livres.put(ftp)
+        except Exception:
+            if ftp is not None:
+                self._descartar(ftp)
+            raise
+        finally:
+            self._vagas.release()
+
+    def fechar(self):
+        with self._trava:
+            sessoes = list(self._todas)
+            self._todas.clear()
+        for ftp in sessoes:
+            try:
+                ftp.quit()
+            except Exception:
+                try: ftp.close()
+                except Exception: pass
+
+def _entrar_pasta(ftp, pasta):
+    if pasta not in ftp.pastas_criadas:
+        try: ftp.mkd(pasta)
+        except ftplib.error_perm: pass  # Pasta já existe
+        ftp.pastas_criadas.add(pasta)
+    ftp.cwd(pasta)
+
+def _tamanho_remoto(ftp, nome):
+    try:
+        return ftp.size(nome) or 0
+    except ftplib.error_perm:
+        return 0  # Arquivo ainda não existe no servidor
+
+class _LeituraEnvio:
+    """
+    Arquivo lido pelo storbinary: calcula o SHA-256 dos bytes enviados na mesma
+    leitura e, se houver limite de banda, segura o ritmo das leituras.
+    """
+
+    def __init__(self, arquivo, limite=None, calcular_hash=True, ao_progresso=None):
+        self.arquivo = arquivo
+        self.limite = limite
+        self.ao_progresso = ao_progresso
+        self.hash = hashlib.sha256() if calcular_hash else None
+        self.limitado = False
+
+    def read(self, tamanho=-1):
+        if self.limite:
+            tamanho = self.limite.tamanho_leitura(tamanho)
+        dados = self.arquivo.read(tamanho)
+        if self.hash:
+            self.hash.update(dados)
+        if self.limite and dados:
+            self.limitado = self.limite.consumir(len(dados)) or self.limitado
+        if self.ao_progresso:
+            self.ao_progresso(self.arquivo.tell())
+        return dados
+
+def _conferir_tamanho_remoto(ftp, nome, esperado):
+    """ Depois do STOR/APPE, confere se o servidor tem o arquivo inteiro. """
+    remoto = _tamanho_remoto(ftp, nome)
+    if remoto != esperado:
+        raise Exception(f"Tamanho remoto de {nome} não confere: {remoto} bytes no servidor, {esperado} esperados")
+
+def _enviar_uma_vez(ftp, caminho, pasta_remota, bloco, limite=None, ao_progresso=None):
+    """
+    Envia o arquivo continuando de onde parou, caso já exista um pedaço no servidor.
+    Retorna (bytes enviados agora, offset de retomada, SHA-256 lido ou None se foi retomado,
+    se o envio passou pelo limite de banda).
+    """
+    nome = os.path.basename(caminho)
+    tamanho_local = os.path.getsize(caminho)
+    _entrar_pasta(ftp, pasta_remota)
+
+    ja_enviado = _tamanho_remoto(ftp, nome)
+    if ja_enviado > tamanho_local:
+        log.warning(f"Arquivo remoto {nome} maior que o local, reenviando do início.")
+        ftp.delete(nome)
+        ja_enviado = 0
+    if ja_enviado == tamanho_local:
+        return 0, ja_enviado, None, False
+    if limite:
+        limite.verificar_janela(tamanho_local - ja_enviado)
+
+    with open(caminho, "rb") as arq:
+        # Retomando, o começo do arquivo não é lido nesta tentativa: sem SHA-256
+        leitura = _LeituraEnvio(arq, limite, calcular_hash=not ja_enviado, ao_progresso=ao_progresso)
+        if ja_enviado:
+            log.info(f"Retomando upload de {nome} a partir de {ja_enviado / (1024 * 1024):.2f} MB")
+            arq.seek(ja_enviado)
+            ftp.storbinary(f"APPE {nome}", leitura, blocksize=bloco)
+        else:
+            ftp.storbinary(f"STOR {nome}", leitura, blocksize=bloco)
+
+    _conferir_tamanho_remoto(ftp, nome, tamanho_local)
+    sha256 = leitura.hash.hexdigest() if leitura.hash else None
+    return tamanho_local - ja_enviado, ja_enviado, sha256, leitura.limitado
+
+def enviar_arquivo(pool, caminho, pasta_remota, tentativas=5, bloco=BLOCO_PADRAO, espera_inicial=2, sha256_esperado=None, limite=None,
+                   ao_progresso=None):
+    """
+    Envia um arquivo para 'pasta_remota' usando uma sessão do pool.
+    Em caso de falha tenta de novo (com espera crescente), retomando o upload
+    a partir do que já chegou no servidor (SIZE + APPE).
+    Com 'sha256_esperado' (calculado na compressão), confere se o arquivo lido
+    para o envio é o mesmo que foi gerado.
+    'limite' (banda.LimiteBanda) controla a velocidade; fora da janela de upload
+    levanta UploadAdiado, sem novas tentativas.
+    ao_progresso(posicao) recebe quantos bytes do arquivo já foram lidos para o envio.
+    Retorna as estatísticas do envio (bytes, tempo e velocidade).
+    """
+    inicio = time.time()
+    enviados = 0
+    retomado = False
+    sha256 = None
+    limitado = False
+
+    for tentativa in range(1, tentativas + 1):
+        try:
+            with pool.sessao() as ftp:
+                bytes_agora, offset, sha256, limitado_agora = _enviar_uma_vez(ftp, caminho, pasta_remota, bloco, limite, ao_progresso)
+            enviados += bytes_agora
+            retomado = retomado or offset > 0
+            limitado = limitado or limitado_agora
+            break
+        except UploadAdiado:
+            raise
+        except Exception as e:
+            if tentativa == tentativas:
+                raise
+            espera = min(espera_inicial * (2 ** (tentativa - 1)), 60)
+            log.warning(f"Falha no upload de {os.path.basename(caminho)} (tentativa {tentativa}/{tentativas}): {e}. Nova tentativa em {espera}s")
+            time.sleep(espera)
+
+    if sha256 and sha256_esperado and sha256 != sha256_esperado:
+        # O arquivo local mudou depois da compressão: a cópia remota não pode ficar como válida
+        try:
+            with pool.sessao() as ftp:
+                _entrar_pasta(ftp, pasta_remota)
+                ftp.delete(os.path.basename(caminho))
+        except Exception:
+            log.warning(f"Não foi possível apagar a cópia remota de {os.path.basename(caminho)}", exc_info=True)
+        raise Exception(f"SHA-256 de {os.path.basename(caminho)} lido no envio não confere com o gerado na compressão")
+
+    segundos = max(time.time() - inicio, 0.001)
+    return {
+        "arquivo": caminho,
+        "bytes": os.path.getsize(caminho),
+        "bytes_enviados": enviados,
+        "segundos": segundos,
+        "bytes_por_segundo": enviados / segundos,
+        "retomado": retomado,
+        "sha256_conferido": bool(sha256 and sha256_esperado),
+        "limitado": limitado,
+    }
+
+def enviar_conteudo(pool, nome, dados, pasta_remota, tentativas=5, espera_inicial=2):
+    """ Envia um arquivo pequeno gerado em memória (ex: o manifesto que acompanha o backup). """
+    for tentativa in range(1, tentativas + 1):
+        try:
+            with pool.sessao() as ftp:
+                _entrar_pasta(ftp, pasta_remota)
+                ftp.storbinary(f"STOR {nome}", io.BytesIO(dados))
+                _conferir_tamanho_remoto(ftp, nome, len(dados))
+            return
+        except Exception as e:
+            if tentativa == tentativas:
+                raise
+            espera = min(espera_inicial * (2 ** (tentativa - 1)), 60)
+            log.warning(f"Falha no envio de {nome} (tentativa {tentativa}/{tentativas}): {e}. Nova tentativa em {espera}s")
+            time.sleep(espera)
@@ -0,0 +1,90 @@
+import json
+import os
+import threading
+
+from log import base_dir
+
+# =================================================================
+# ESTADO LOCAL ENTRE EXECUÇÕES (caches e controles em JSON)
+# =================================================================
+
+_trava = threading.Lock()
+
+def pasta_estado():
+    """ Pasta onde ficam os arquivos de estado, ao lado do executável (como a pasta de logs). """
+    pasta = os.path.join(base_dir(), "ESTADO_BACKUP_MERCOSISTEM")
+    os.makedirs(pasta, exist_ok=True)
+    return pasta
+
+def _caminho(nome):
+    return os.path.join(pasta_estado(), f"{nome}.json")
+
+def ler_estado(nome, padrao=None):
+    """ Lê um arquivo de estado. Arquivo ausente ou corrompido devolve o valor padrão. """
+    try:
+        with open(_caminho(nome), "r", encoding="utf-8") as arq:
+            return json.load(arq)
+    except (OSError, ValueError):
+        return {} if padrao is None else padrao
+
+def salvar_estado(nome, dados):
+    """ Grava o estado de forma atômica (arquivo temporário + replace), para não corromper se o processo cair. """
+    caminho = _caminho(nome)
+    temporario = caminho + ".tmp"
+    with _trava:
+        with open(temporario, "w", encoding="utf-8") as arq:
+            json.dump(dados, arq, ensure_ascii=False, indent=2)
+        os.replace(temporario, caminho)
+
+# =================================================================
+# TRAVA DE EXECUÇÃO (evita dois backups ao mesmo tempo)
+# =================================================================
+
+class TravaExecucao:
+    """
+    Trava de arquivo entre processos (exe agendado, modo agendador, execução manual).
+    O sistema operacional libera a trava sozinho se o processo morrer, então não
+    sobra arquivo "preso" depois de uma queda.
+    """
+
+    def __init__(self, nome="execucao"):
+        self.caminho = os.path.join(pasta_estado(), f"{nome}.lock")
+        self._arquivo = None
+
+    def adquirir(self):
+        """ Tenta pegar a trava sem esperar. Retorna False se outro processo já estiver rodando. """
+        arquivo = open(self.caminho, "a+")
+        try:
+            if os.name == "nt":
+                import msvcrt
+                arquivo.seek(0)
+                msvcrt.locking(arquivo.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(arquivo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            arquivo.close()
+            return False
+        self._arquivo = arquivo
+        return True
+
+    def liberar(self):
+        if self._arquivo is None:
+            return
+        try:
+            if os.name == "nt":
+                import msvcrt
+                self._arquivo.seek(0)
+                msvcrt.locking(self._arquivo.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self._arquivo.fileno(), fcntl.LOCK_UN)
+        finally:
+            self._arquivo.close()
+            self._arquivo = None
+
+    def __enter__(self):
+        return self.adquirir()
+
+    def __exit__(self, tipo, valor, traceback):
+        self.liberar()
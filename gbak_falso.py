@@ -0,0 +1,181 @@
+import os
+import sys
+import time
+
+# =================================================================
+# GBAK SIMULADO (usado apenas pelo benchmark.py)
+# =================================================================
+# Aceita a mesma linha de comando que o backup_restore.py usa:
+#   gbak -b [opções] -user U -password P <banco> <arquivo.fbk | stdout>
+#   gbak -r [opções] -user U -password P <arquivo.fbk | stdin> <banco.FDB>
+# O "banco" é um arquivo comum gerado pelo benchmark: o backup apenas copia
+# os bytes dele, e o restore copia o .fbk de volta para o .FDB (com -m, o restore
+# só de metadados, lê o .fbk inteiro e grava apenas o começo dele).
+# GBAK_FALSO_MBPS limita a velocidade para simular um servidor mais lento.
+# registrar_motor_simulado() oferece o mesmo comportamento como motor de backup
+# (MOTOR_BACKUP=simulado), para testar o caminho sem subprocesso, e
+# registrar_servicos_simulado() testa o motor do Services Manager (MOTOR_BACKUP=servicos_simulado).
+
+TAMANHO_BLOCO = 1024 * 1024
+TAMANHO_METADADOS = 64 * 1024
+
+def _argumentos_posicionais(args):
+    """ Remove as opções (-b, -g, -p 4096, -user X...) e devolve origem e destino. """
+    com_valor = {"-user", "-password", "-p", "-page_size", "-se"}
+    posicionais = []
+    i = 0
+    while i < len(args):
+        if args[i].lower() in com_valor:
+            i += 2
+            continue
+        if not args[i].startswith("-"):
+            posicionais.append(args[i])
+        i += 1
+    return posicionais[-2], posicionais[-1]
+
+def _abrir(caminho, modo):
+    if caminho.lower() == "stdout":
+        return sys.stdout.buffer
+    if caminho.lower() == "stdin":
+        return sys.stdin.buffer
+    return open(caminho, modo)
+
+def _copiar(entrada, saida, ao_progresso=None):
+    """ Copia os bytes respeitando o GBAK_FALSO_MBPS. 'saida' é uma função que recebe cada bloco. """
+    limite = float(os.getenv("GBAK_FALSO_MBPS", "0")) * 1024 * 1024
+    inicio = time.time()
+    copiados = 0
+    while True:
+        bloco = entrada.read(TAMANHO_BLOCO)
+        if not bloco:
+            break
+        saida(bloco)
+        copiados += len(bloco)
+        if ao_progresso:
+            ao_progresso(f"gbak: {copiados // (1024 * 1024)} MB copiados")
+        if limite:
+            adiantado = copiados / limite - (time.time() - inicio)
+            if adiantado > 0:
+                time.sleep(adiantado)
+
+def _so_metadados(escrever):
+    """ Saída do restore só de metadados: grava apenas os primeiros bytes recebidos. """
+    gravados = [0]
+    def escrever_inicio(bloco):
+        if gravados[0] < TAMANHO_METADADOS:
+            escrever(bloco[:TAMANHO_METADADOS - gravados[0]])
+            gravados[0] += len(bloco)
+    return escrever_inicio
+
+def main(args):
+    origem, destino = _argumentos_posicionais(args)
+    somente_metadados = "-r" in args and "-m" in args
+
+    entrada = _abrir(origem, "rb")
+    saida = _abrir(destino, "wb")
+    try:
+        _copiar(entrada, _so_metadados(saida.write) if somente_metadados else saida.write)
+    finally:
+        if saida is not sys.stdout.buffer:
+            saida.close()
+        if entrada is not sys.stdin.buffer:
+            entrada.close()
+    return 0
+
+# =================================================================
+# MOTOR SIMULADO (MOTOR_BACKUP=simulado, sem processo nem Firebird)
+# =================================================================
+
+class _RestoreSimulado:
+    def __init__(self, destino, somente_metadados=False):
+        self._arquivo = open(destino, "wb")
+        self.write = _so_metadados(self._arquivo.write) if somente_metadados else self._arquivo.write
+
+    def finalizar(self):
+        self._arquivo.close()
+
+    def abortar(self):
+        self._arquivo.close()
+
+def registrar_motor_simulado():
+    """ Registra o motor 'simulado': faz no próprio processo o mesmo que o GBAK simulado. """
+    from motor_backup import registrar_motor
+    from metadados import arquivo_do_dsn
+
+    @registrar_motor("simulado")
+    class MotorSimulado:
+        def __init__(self, gbak_path=None):
+            pass
+
+        def backup(self, dsn, destino, ao_progresso=None):
+            with open(arquivo_do_dsn(dsn), "rb") as entrada, open(destino, "wb") as saida:
+                _copiar(entrada, saida.write, ao_progresso)
+
+        def restore(self, origem, destino, ao_progresso=None, somente_metadados=False):
+            with open(origem, "rb") as entrada, open(destino, "wb") as saida:
+                _copiar(entrada, _so_metadados(saida.write) if somente_metadados else saida.write, ao_progresso)
+
+        def backup_para_stream(self, dsn, escrever):
+            with open(arquivo_do_dsn(dsn), "rb") as entrada:
+                _copiar(entrada, escrever)
+
+        def iniciar_restore_stream(self, destino, somente_metadados=False):
+            return _RestoreSimulado(destino, somente_metadados)
+
+    return MotorSimulado
+
+# =================================================================
+# SERVICES MANAGER SIMULADO (MOTOR_BACKUP=servicos_simulado)
+# =================================================================
+# Roda o MotorServicos de verdade trocando só a conexão do fdb.services por
+# um substituto com a mesma assinatura e o mesmo acesso aos arquivos: o
+# local_restore chama tell()/seek() no stream antes de ler, como o fdb 2.0.x
+# (um pipe ali falha com 'Illegal seek'). Sem gbak.exe de reserva, para o
+# benchmark passar sempre pelo caminho do serviço.
+
+class _ServicoSimulado:
+    def backup(self, source_database, dest_filenames, callback=None, **opcoes):
+        with open(source_database, "rb") as entrada, open(dest_filenames, "wb") as saida:
+            _copiar(entrada, saida.write, callback)
+
+    def restore(self, source_filenames, dest_filenames, metadata_only=0, callback=None, **opcoes):
+        with open(source_filenames, "rb") as entrada, open(dest_filenames, "wb") as saida:
+            _copiar(entrada, _so_metadados(saida.write) if metadata_only else saida.write, callback)
+
+    def local_backup(self, source_database, backup_stream, **opcoes):
+        with open(source_database, "rb") as entrada:
+            _copiar(entrada, backup_stream.write)
+
+    def local_restore(self, backup_stream, dest_filenames, metadata_only=0, **opcoes):
+        posicao = backup_stream.tell()
+        backup_stream.seek(0, 2)
+        disponivel = backup_stream.tell() - posicao
+        backup_stream.seek(posicao)
+        with open(dest_filenames, "wb") as saida:
+            escrever = _so_metadados(saida.write) if metadata_only else saida.write
+            while disponivel > 0:
+                bloco = backup_stream.read(min(disponivel, TAMANHO_BLOCO))
+                if not bloco:
+                    break
+                escrever(bloco)
+                disponivel -= len(bloco)
+
+    def close(self):
+        pass
+
+def registrar_servicos_simulado():
+    """ Registra o motor 'servicos_simulado': MotorServicos com o _ServicoSimulado no lugar do fdb.services. """
+    from motor_backup import registrar_motor, MotorServicos
+
+    @registrar_motor("servicos_simulado")
+    class MotorServicosSimulado(MotorServicos):
+        def __init__(self, gbak_path=None):
+            super().__init__(None)
+
+        def _conectar(self, servidor):
+            return _ServicoSimulado()
+
+    return MotorServicosSimulado
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -3,6 +3,8 @@ import threading
 import os
 import sys
 
+from progresso import formatar_eta
+
 def resource_path(relative_path):
     try:
         base_path = sys._MEIPASS
@@ -24,7 +26,7 @@ def mostrar_loading(funcao_background):
         pass 
     
     root.title("Mercosistem - Backup")
-    root.geometry("400x180")
+    root.geometry("420x180")
     root.resizable(False, False)
 
     # Variável que controla o texto da porcentagem na tela
@@ -61,16 +63,33 @@ def mostrar_loading(funcao_background):
     # =================================================================
     # FUNÇÃO DE ATUALIZAÇÃO (CALLBACK)
     # =================================================================
-    def atualizar_progresso(valor_decimal):
+    # Último valor recebido; só um .after fica agendado por vez (atualizações seguidas se juntam)
+    pendente = {"valor": None, "agendado": False}
+    trava = threading.Lock()
+
+    def aplicar_progresso():
+        with trava:
+            valor_decimal, eta_segundos = pendente["valor"]
+            pendente["agendado"] = False
+        # Converte 0.1 para "10%"
+        texto = f"Progresso: {int(valor_decimal * 100)}%"
+        if eta_segundos is not None and valor_decimal < 1:
+            texto += f" - faltam {formatar_eta(eta_segundos)}"
+        barra.set(valor_decimal)
+        texto_porcentagem.set(texto)
+
+    def atualizar_progresso(valor_decimal, eta_segundos=None):
         """
         valor_decimal: float entre 0.0 e 1.0
+        eta_segundos: previsão de término pelo histórico (None = sem histórico)
         """
-        # Converte 0.1 para "10%"
-        pct = int(valor_decimal * 100)
-        
+        with trava:
+            pendente["valor"] = (valor_decimal, eta_segundos)
+            if pendente["agendado"]:
+                return
+            pendente["agendado"] = True
         # O .after(0, ...) garante que a interface atualize de forma segura
-        root.after(0, lambda: barra.set(valor_decimal))
-        root.after(0, lambda: texto_porcentagem.set(f"Progresso: {pct}%"))
+        root.after(0, aplicar_progresso)
 
     # =================================================================
     # GERENCIAMENTO DE THREADS
@@ -1,14 +1,53 @@
+import atexit
+import contextvars
+import glob
+import gzip
 import logging
+import logging.handlers
 import os
+import queue
+import shutil
 import sys
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 
+from configuracao import env_float
+
 # =================================================================
 # GESTÃO DE LOGS E AUDITORIA
 # =================================================================
+# O log é configurado uma única vez por processo, na primeira chamada de
+# configurar_logger(); as chamadas seguintes (uma por módulo) só devolvem o
+# logger. Quem loga (GBAK, compressão, upload) apenas coloca o registro numa
+# fila; uma thread separada grava no disco, então nenhuma etapa espera I/O de log.
+#
+# Arquivos em LOGS_BACKUP_MERCOSISTEM:
+#   Backup_Mercosistem_AAAAMMDD.log       -> log do dia (em uso)
+#   Backup_Mercosistem_AAAAMMDD.N.log.gz  -> dias anteriores ou partes que passaram do tamanho máximo
+#
+#   LOG_NIVEL=INFO
+#   LOG_TAMANHO_MAX_MB=20   -> ao passar disso o arquivo do dia é compactado e outro começa
+#   LOG_DIAS_RETENCAO=30    -> logs compactados mais antigos que isso são apagados
+#
+# Cada linha leva a base e a etapa em andamento (quando houver), para filtrar
+# uma base com 'findstr "base=LOJA01"' ou 'grep "etapa=upload"'.
+
+LOG_NIVEL = os.getenv("LOG_NIVEL", "INFO").upper()
+TAMANHO_MAX_BYTES = env_float("LOG_TAMANHO_MAX_MB", 20) * 1024 * 1024
+DIAS_RETENCAO = env_float("LOG_DIAS_RETENCAO", 30)
+FORMATO = "%(asctime)s | %(levelname)s | %(contexto)s%(message)s"
+
+# Base/etapa do código em execução (cada thread do pipeline tem o seu valor)
+_base = contextvars.ContextVar("log_base", default=None)
+_etapa = contextvars.ContextVar("log_etapa", default=None)
+
+_trava = threading.Lock()
+_ouvinte = None
 
 def base_dir():
-    """ 
+    """
     Identifica o diretório base para salvar os logs.
     Se o programa for um executável (.exe), usa a pasta do executável.
     Se for um script (.py), usa a pasta onde o script está salvo.
@@ -17,36 +56,131 @@ def base_dir():
         return os.path.dirname(sys.executable)
     return os.path.dirname(os.path.abspath(__file__))
 
+def pasta_logs():
+    """ Pasta 'LOGS_BACKUP_MERCOSISTEM' ao lado do executável (criada se não existir). """
+    pasta = os.path.join(base_dir(), "LOGS_BACKUP_MERCOSISTEM")
+    os.makedirs(pasta, exist_ok=True)
+    return pasta
+
+@contextmanager
+def contexto_log(base=None, etapa=None):
+    """ Marca as linhas de log geradas dentro do bloco com a base e a etapa. """
+    tokens = []
+    if base is not None:
+        tokens.append((_base, _base.set(base)))
+    if etapa is not None:
+        tokens.append((_etapa, _etapa.set(etapa)))
+    try:
+        yield
+    finally:
+        for variavel, token in reversed(tokens):
+            variavel.reset(token)
+
+class _FiltroContexto(logging.Filter):
+    """ Copia base/etapa para o registro na thread que gerou o log (antes de entrar na fila). """
+
+    def filter(self, record):
+        record.base = _base.get()
+        record.etapa = _etapa.get()
+        partes = [f"{campo}={valor}" for campo, valor in (("base", record.base), ("etapa", record.etapa)) if valor]
+        record.contexto = " ".join(partes) + " | " if partes else ""
+        return True
+
+def _compactar(caminho):
+    """ Compacta um log fechado em <nome>.N.log.gz (primeiro N livre) e apaga o original. """
+    raiz = caminho[:-len(".log")]
+    numero = 1
+    while os.path.exists(f"{raiz}.{numero}.log.gz"):
+        numero += 1
+    with open(caminho, "rb") as origem, gzip.open(f"{raiz}.{numero}.log.gz", "wb") as destino:
+        shutil.copyfileobj(origem, destino)
+    try:
+        os.remove(caminho)
+    except OSError:
+        os.remove(f"{raiz}.{numero}.log.gz")  # Ainda em uso por outro processo: fica para a próxima limpeza
+        raise
+
+class _ArquivoDiario(logging.handlers.BaseRotatingHandler):
+    """
+    Um arquivo por dia, trocado também quando passa de TAMANHO_MAX_BYTES.
+    O arquivo fechado é compactado e os antigos são apagados (roda na thread do log).
+    """
+
+    def __init__(self, pasta, nome):
+        self.pasta = pasta
+        self.nome = nome
+        self.dia = datetime.now().strftime("%Y%m%d")
+        super().__init__(self._arquivo_do_dia(), "a", encoding="utf-8", delay=False)
+        self._limpar()
+
+    def _arquivo_do_dia(self):
+        return os.path.join(self.pasta, f"{self.nome}_{self.dia}.log")
+
+    def shouldRollover(self, record):
+        if datetime.now().strftime("%Y%m%d") != self.dia:
+            return True
+        return TAMANHO_MAX_BYTES > 0 and self.stream is not None and self.stream.tell() >= TAMANHO_MAX_BYTES
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        try:
+            _compactar(self.baseFilename)
+        except OSError:
+            pass  # Outro processo com o arquivo aberto: segue gravando no mesmo e tenta na próxima troca
+        self.dia = datetime.now().strftime("%Y%m%d")
+        self.baseFilename = self._arquivo_do_dia()
+        self.stream = self._open()
+        self._limpar()
+
+    def _limpar(self):
+        """ Compacta logs de dias anteriores que ficaram abertos e apaga os que passaram da retenção. """
+        limite = time.time() - DIAS_RETENCAO * 86400
+        for caminho in glob.glob(os.path.join(self.pasta, f"{self.nome}_*.log*")):
+            try:
+                if caminho.endswith(".gz"):
+                    if DIAS_RETENCAO > 0 and os.path.getmtime(caminho) < limite:
+                        os.remove(caminho)
+                elif os.path.abspath(caminho) != os.path.abspath(self.baseFilename):
+                    _compactar(caminho)
+            except OSError:
+                pass
+
+def _encerrar():
+    """ Grava o que ainda está na fila antes do processo terminar. """
+    global _ouvinte
+    with _trava:
+        if _ouvinte is not None:
+            _ouvinte.stop()
+            for handler in _ouvinte.handlers:
+                handler.close()
+            _ouvinte = None
+
 def configurar_logger(nome="Backup_Mercosistem"):
     """
-    Configura o sistema de log da aplicação. 
-    Cria automaticamente uma pasta 'LOGS_BACKUP_MERCOSISTEM' e gera arquivos 
-    diários para facilitar a manutenção e auditoria dos backups.
+    Configura o sistema de log da aplicação (só na primeira chamada do processo)
+    e devolve o logger. Cria a pasta 'LOGS_BACKUP_MERCOSISTEM' com um arquivo
+    por dia, compactado e apagado automaticamente conforme o .env.
     """
-    base = base_dir()
-    pasta_logs = os.path.join(base, "LOGS_BACKUP_MERCOSISTEM")
-    
-    # Garante que a pasta de logs exista antes de tentar criar o arquivo
-    os.makedirs(pasta_logs, exist_ok=True)
-
-    # Define o nome do arquivo com a data atual (ex: Backup_Mercosistem_20260124.log)
-    log_file = os.path.join(
-        pasta_logs,
-        f"{nome}_{datetime.now().strftime('%Y%m%d')}.log"
-    )
-
-    # Configuração do formato do log:
-    # %(asctime)s    -> Horário exato do evento
-    # %(levelname)s  -> Tipo (INFO, WARNING, ERROR, CRITICAL)
-    # %(message)s    -> A descrição do que aconteceu
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s | %(levelname)s | %(message)s",
-        force=True,
-        handlers=[
-            # FileHandler com encoding utf-8 para suportar acentos nas mensagens
-            logging.FileHandler(log_file, encoding="utf-8"),
-        ]
-    )
-
-    return logging.getLogger(nome)
\ No newline at end of file
+    global _ouvinte
+    with _trava:
+        if _ouvinte is None:
+            arquivo = _ArquivoDiario(pasta_logs(), nome)
+            arquivo.setFormatter(logging.Formatter(FORMATO))
+
+            fila = queue.SimpleQueue()
+            entrada = logging.handlers.QueueHandler(fila)
+            entrada.addFilter(_FiltroContexto())
+
+            raiz = logging.getLogger()
+            for handler in raiz.handlers[:]:
+                raiz.removeHandler(handler)
+            raiz.addHandler(entrada)
+            raiz.setLevel(getattr(logging, LOG_NIVEL, logging.INFO))
+
+            _ouvinte = logging.handlers.QueueListener(fila, arquivo)
+            _ouvinte.start()
+            atexit.register(_encerrar)
+
+    return logging.getLogger(nome)
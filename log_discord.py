@@ -1,34 +1,222 @@
 import os
-import requests
+import json
+import queue
+import threading
+import time
 from datetime import datetime
 from dotenv import load_dotenv
 load_dotenv()
 
+from configuracao import env_float
+from log import configurar_logger
+from estado_local import ler_estado, salvar_estado
+
+log = configurar_logger()
+
 API_KEY_DISCORD = os.getenv("API_KEY_DISCORD")
 WEBHOOK_URL = API_KEY_DISCORD
 
+# =================================================================
+# FILA DE NOTIFICAÇÕES (envio em segundo plano)
+# =================================================================
+# O backup nunca espera o Discord: os cards entram numa fila e uma thread
+# envia em lotes (até 10 cards por mensagem, limite do Discord).
+# O que não puder ser entregue (sem internet, webhook fora) fica guardado
+# em disco e é reenviado na próxima execução.
+
+MAX_EMBEDS_POR_MENSAGEM = 10
+MAX_CARACTERES_POR_MENSAGEM = 5500  # O Discord aceita 6000 no total dos embeds
+JANELA_AGRUPAMENTO = env_float("DISCORD_JANELA_AGRUPAMENTO", 2)
+TENTATIVAS_ENVIO = 3
+ESPERAS_RATE_LIMIT = 5  # Respostas 429 seguidas aceitas antes de guardar o lote para a próxima execução
+ARQUIVO_PENDENTES = "notificacoes_pendentes"
+
+_fila = queue.Queue()
+_trava = threading.Lock()
+_worker = None
+_PARAR = object()
+# Cards já tirados da fila e ainda não entregues: se o worker não terminar a tempo
+# no fechamento, vão para o disco (um lote que chegou a ser entregue pode se repetir)
+_em_maos = {"lote": None, "sobra": None}
+_geracao = [0]  # Muda a cada finalizar_notificacoes: um worker antigo que ainda estava enviando não volta à fila
+
+def _tamanho_embed(embed):
+    return len(json.dumps(embed, ensure_ascii=False))
+
+def _guardar_pendentes(embeds):
+    """ Guarda em disco os cards que não foram entregues. """
+    if not embeds:
+        return
+    with _trava:
+        pendentes = ler_estado(ARQUIVO_PENDENTES, [])
+        pendentes.extend(embeds)
+        salvar_estado(ARQUIVO_PENDENTES, pendentes)
+    log.warning(f"{len(embeds)} notificação(ões) do Discord guardadas para reenvio.")
+
+def _retirar_pendentes():
+    pendentes = ler_estado(ARQUIVO_PENDENTES, [])
+    if pendentes:
+        salvar_estado(ARQUIVO_PENDENTES, [])
+    return pendentes
+
+def _enviar_lote(embeds):
+    """
+    Envia um lote de cards. Respeita o HTTP 429 (rate limit) esperando o tempo pedido.
+    Retorna False se não foi possível entregar (o lote vai para o disco).
+    """
+    import requests # Carregado só na thread de envio, fora da inicialização do backup
+
+    tentativa = 0
+    esperas = 0
+    while tentativa < TENTATIVAS_ENVIO:
+        try:
+            resp = requests.post(WEBHOOK_URL, json={"embeds": embeds}, timeout=10)
+        except Exception as e:
+            tentativa += 1
+            log.warning(f"Falha ao enviar log online (tentativa {tentativa}/{TENTATIVAS_ENVIO}): {e}")
+            time.sleep(2 ** tentativa)
+            continue
+
+        if resp.status_code == 429:
+            # Rate limit não conta como tentativa (o Discord diz quanto tempo esperar), mas tem limite próprio
+            esperas += 1
+            if esperas > ESPERAS_RATE_LIMIT:
+                log.warning(f"Discord continua limitando o envio (HTTP 429) após {ESPERAS_RATE_LIMIT} esperas.")
+                return False
+            try:
+                espera = float(resp.json().get("retry_after", 1))
+            except ValueError:
+                espera = float(resp.headers.get("Retry-After", 1))
+            time.sleep(min(espera, 60))
+            continue
+
+        if resp.ok:
+            return True
+        if 400 <= resp.status_code < 500:
+            # Erro do próprio conteúdo/webhook: reenviar depois não resolveria
+            log.error(f"Discord recusou a notificação ({resp.status_code}): {resp.text[:200]}")
+            return True
+
+        tentativa += 1
+        time.sleep(2 ** tentativa)
+
+    return False
+
+def _soltar(lote):
+    """ Tira o lote das mãos do worker. False se o finalizar_notificacoes já o guardou em disco. """
+    with _trava:
+        if _em_maos["lote"] is not lote:
+            return False
+        _em_maos["lote"] = None
+        return True
+
+def _loop_envio(geracao):
+    parar = False
+    while not parar:
+        with _trava:
+            if _geracao[0] != geracao:
+                break
+            sobra, _em_maos["sobra"] = _em_maos["sobra"], None
+        item = sobra if sobra is not None else _fila.get()
+        if item is _PARAR:
+            break
+
+        # Junta os cards que chegarem em seguida numa única mensagem
+        lote = [item]
+        with _trava:
+            _em_maos["lote"] = lote
+        tamanho = _tamanho_embed(item)
+        prazo = time.time() + JANELA_AGRUPAMENTO
+        while len(lote) < MAX_EMBEDS_POR_MENSAGEM:
+            try:
+                proximo = _fila.get(timeout=max(0, prazo - time.time()))
+            except queue.Empty:
+                break
+            if proximo is _PARAR:
+                parar = True
+                break
+            if tamanho + _tamanho_embed(proximo) > MAX_CARACTERES_POR_MENSAGEM:
+                with _trava:
+                    _em_maos["sobra"] = proximo
+                break
+            lote.append(proximo)
+            tamanho += _tamanho_embed(proximo)
+
+        if not WEBHOOK_URL:
+            log.warning("API_KEY_DISCORD não configurada, notificação descartada.")
+            _soltar(lote)
+            continue
+        entregue = _enviar_lote(lote)
+        if _soltar(lote) and not entregue:
+            _guardar_pendentes(lote)
+
+def _garantir_worker():
+    """ Sobe a thread de envio na primeira notificação, colocando antes na fila o que ficou pendente. """
+    global _worker
+    with _trava:
+        if _worker is not None and _worker.is_alive():
+            return
+        for embed in _retirar_pendentes():
+            _fila.put(embed)
+        _worker = threading.Thread(target=_loop_envio, args=(_geracao[0],), name="notificacoes_discord", daemon=True)
+        _worker.start()
+
+def finalizar_notificacoes(timeout=60):
+    """
+    Espera a fila ser entregue antes do programa fechar.
+    O que não der tempo de enviar fica guardado para a próxima execução.
+    """
+    global _worker
+    if _worker is None:
+        return
+    _fila.put(_PARAR)
+    _worker.join(timeout)
+
+    restantes = []
+    if _worker.is_alive():
+        # Tempo esgotado no meio de um envio: o lote em andamento também fica para a próxima execução
+        with _trava:
+            lote, sobra = _em_maos["lote"], _em_maos["sobra"]
+            _em_maos["lote"] = _em_maos["sobra"] = None
+            _geracao[0] += 1
+        restantes.extend(lote or [])
+        if sobra is not None:
+            restantes.append(sobra)
+    while True:
+        try:
+            item = _fila.get_nowait()
+        except queue.Empty:
+            break
+        if item is not _PARAR:
+            restantes.append(item)
+    _guardar_pendentes(restantes)
+    _worker = None
+
+CORES_STATUS = {
+    "sucesso": 65280,        # Verde
+    "erro": 16711680,        # Vermelho
+    "adiado": 16776960,      # Amarelo
+    "sem alteração": 9807270 # Cinza
+}
+
 def enviar_log_discord(status, codigo_empresa, mensagem, detalhes=""):
     """
-    Envia um card colorido para o Discord.
-    status: 'sucesso' ou 'erro'
+    Coloca na fila um card colorido para o Discord (o envio acontece em segundo plano).
+    status: 'sucesso', 'erro', 'adiado' (upload fora da janela) ou 'sem alteração' (base pulada por não ter mudado)
     """
-    cor = 65280 if status == 'sucesso' else 16711680  # Verde ou Vermelho
-    
-    payload = {
-        "embeds": [{
-            "title": f"Relatório de Backup - Cliente {codigo_empresa}",
-            "color": cor,
-            "fields": [
-                {"name": "Status", "value": status.upper(), "inline": True},
-                {"name": "Data/Hora", "value": datetime.now().strftime("%d/%m/%Y %H:%M:%S"), "inline": True},
-                {"name": "Mensagem", "value": mensagem},
-                {"name": "Detalhes Técnicos", "value": detalhes[:1000]} # Limite do Discord
-            ],
-            "footer": {"text": "Sistema de Backup Automatizado"}
-        }]
+    cor = CORES_STATUS.get(status, 16711680)
+
+    embed = {
+        "title": f"Relatório de Backup - Cliente {codigo_empresa}",
+        "color": cor,
+        "fields": [
+            {"name": "Status", "value": status.upper(), "inline": True},
+            {"name": "Data/Hora", "value": datetime.now().strftime("%d/%m/%Y %H:%M:%S"), "inline": True},
+            {"name": "Mensagem", "value": mensagem},
+            {"name": "Detalhes Técnicos", "value": detalhes[:1000] or "-"} # Limite do Discord (não aceita vazio)
+        ],
+        "footer": {"text": "Sistema de Backup Automatizado"}
     }
 
-    try:
-        requests.post(WEBHOOK_URL, json=payload, timeout=10)
-    except Exception as e:
-        print(f"Falha ao enviar log online: {e}")
\ No newline at end of file
+    _garantir_worker()
+    _fila.put(embed)
@@ -0,0 +1,133 @@
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from configuracao import env_int
+from log import configurar_logger
+
+log = configurar_logger()
+
+# =================================================================
+# METADADOS DAS BASES (coletados uma vez por execução)
+# =================================================================
+
+FB_USER = os.getenv("FB_USER")
+FB_PASS = os.getenv("FB_PASS")
+# Quantas bases do mesmo servidor/porta são consultadas ao mesmo tempo (não sobrecarregar o Firebird)
+CONEXOES_POR_SERVIDOR = env_int("FB_CONEXOES_POR_SERVIDOR", 2)
+
+# Fatos coletados de cada base: nome -> consulta (a primeira coluna da primeira linha é o valor)
+CONSULTAS = {
+    "numserie": "SELECT FIRST 1 NUMSERIE FROM EMPRESA",
+}
+# Consultas cuja falha não invalida a base (o valor fica None).
+# CURRENT_TRANSACTION é o número da próxima transação no momento da leitura
+# (mesmo contador do cabeçalho/MON$NEXT_TRANSACTION, mas existe desde o Firebird 1.5).
+# MON$OLDEST_ACTIVE é a transação ativa mais antiga (Firebird 2.1+): abaixo do contador,
+# havia outra transação aberta durante a leitura (ver alteracoes.py).
+CONSULTAS_OPCIONAIS = {
+    "transacao_atual": "SELECT CURRENT_TRANSACTION FROM RDB$DATABASE",
+    "transacao_ativa_mais_antiga": "SELECT MON$OLDEST_ACTIVE FROM MON$DATABASE",
+}
+
+_conexoes = {}
+_metadados = {}
+_trava = threading.Lock()
+
+def servidor_do_dsn(dsn):
+    """
+    Extrai o 'host/porta' de um DSN Firebird (ex: localhost/3051:C:\\DADOS\\BASE.FDB).
+    Caminhos locais sem servidor (C:\\...) são agrupados como 'local'.
+    """
+    if re.match(r"^[A-Za-z]:[\\/]", dsn) or ":" not in dsn:
+        return "local"
+    return dsn.split(":", 1)[0].lower()
+
+def arquivo_do_dsn(dsn):
+    """ Caminho do arquivo do banco dentro do DSN (sem o 'host/porta:'). """
+    if servidor_do_dsn(dsn) == "local":
+        return dsn
+    return dsn.split(":", 1)[1]
+
+def conexao(dsn):
+    """ Devolve a conexão já aberta para a base (abre na primeira vez). """
+    with _trava:
+        conn = _conexoes.get(dsn)
+    if conn is None or conn.closed:
+        import fdb # Importado só na hora de conectar (deixa a inicialização do programa mais leve)
+        conn = fdb.connect(dsn=dsn, user=FB_USER, password=FB_PASS)
+        with _trava:
+            _conexoes[dsn] = conn
+    return conn
+
+def consultar_valor(dsn, sql):
+    """ Executa uma consulta simples reaproveitando a conexão da base. """
+    conn = conexao(dsn)
+    cur = conn.cursor()
+    try:
+        cur.execute(sql)
+        row = cur.fetchone()
+    finally:
+        cur.close()
+        conn.commit()  # Não deixa transação aberta segurando o garbage collection do banco
+    return row[0] if row else None
+
+def _coletar_base(dsn):
+    dados = {"dsn": dsn}
+    try:
+        for nome, sql in CONSULTAS.items():
+            dados[nome] = consultar_valor(dsn, sql)
+    except Exception as e:
+        dados["erro"] = str(e)
+        log.error(f"Falha ao ler metadados da base {dsn}: {e}")
+    else:
+        for nome, sql in CONSULTAS_OPCIONAIS.items():
+            try:
+                dados[nome] = consultar_valor(dsn, sql)
+            except Exception as e:
+                dados[nome] = None
+                log.warning(f"Consulta opcional '{nome}' falhou na base {dsn}: {e}")
+    with _trava:
+        _metadados[dsn] = dados
+    return dados
+
+def coletar_metadados(bases):
+    """
+    Coleta de uma vez os dados de todas as bases (NUMSERIE etc.) antes do pipeline começar.
+    Bases de servidores diferentes são consultadas em paralelo; no mesmo servidor,
+    no máximo FB_CONEXOES_POR_SERVIDOR por vez.
+    """
+    with _trava:
+        _metadados.clear()  # Cada execução começa com dados novos
+
+    por_servidor = {}
+    for dsn in bases:
+        por_servidor.setdefault(servidor_do_dsn(dsn), []).append(dsn)
+
+    def coletar_servidor(lista):
+        with ThreadPoolExecutor(max_workers=max(1, CONEXOES_POR_SERVIDOR)) as executor:
+            list(executor.map(_coletar_base, lista))
+
+    if por_servidor:
+        with ThreadPoolExecutor(max_workers=len(por_servidor), thread_name_prefix="metadados") as executor:
+            list(executor.map(coletar_servidor, por_servidor.values()))
+
+    return {dsn: _metadados.get(dsn, {}) for dsn in bases}
+
+def metadados_base(dsn):
+    """ Metadados da base já coletados nesta execução (coleta na hora se ainda não tiver). """
+    with _trava:
+        dados = _metadados.get(dsn)
+    return dados if dados is not None else _coletar_base(dsn)
+
+def fechar_conexoes():
+    """ Fecha todas as conexões abertas (os metadados coletados continuam em cache). """
+    with _trava:
+        conexoes = list(_conexoes.values())
+        _conexoes.clear()
+    for conn in conexoes:
+        try:
+            conn.close()
+        except Exception:
+            pass
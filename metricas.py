@@ -0,0 +1,163 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from log import configurar_logger, pasta_logs
+
+log = configurar_logger()
+
+# =================================================================
+# MÉTRICAS POR ETAPA (JSON lines ao lado dos logs)
+# =================================================================
+# Cada etapa de cada base gera uma linha em
+# LOGS_BACKUP_MERCOSISTEM/metricas_AAAAMMDD.jsonl com: tempo, bytes de
+# entrada/saída, throughput e pico de espaço temporário durante a etapa.
+#
+# PERFIL no .env liga um perfilador para a execução inteira:
+#   PERFIL=cprofile    -> grava perfil_AAAAMMDD_HHMMSS.prof (abrir com snakeviz/pstats)
+#   PERFIL=tracemalloc -> registra pico de memória e maiores alocações nas métricas
+
+PERFIL = os.getenv("PERFIL", "").lower()
+INTERVALO_AMOSTRAGEM_DISCO = 1.0
+
+_trava = threading.Lock()
+_ativos = []          # Registros das etapas em andamento (recebem o pico de disco)
+_perfis = []          # Perfis cProfile de cada etapa (unidos no final)
+_id_execucao = None
+
+def _arquivo_metricas():
+    return os.path.join(pasta_logs(), f"metricas_{datetime.now().strftime('%Y%m%d')}.jsonl")
+
+def gravar_metrica(registro):
+    """ Acrescenta um registro (dict) no arquivo de métricas do dia. """
+    registro = dict(registro, execucao=_id_execucao, momento=datetime.now().isoformat(timespec="seconds"))
+    with _trava:
+        with open(_arquivo_metricas(), "a", encoding="utf-8") as arq:
+            arq.write(json.dumps(registro, ensure_ascii=False) + "\n")
+
+def _tamanho_pasta(pasta):
+    total = 0
+    for root, _, files in os.walk(pasta):
+        for file in files:
+            try:
+                total += os.path.getsize(os.path.join(root, file))
+            except OSError:
+                pass  # Arquivo removido durante a varredura
+    return total
+
+# --- Monitor do espaço temporário ---
+class MonitorDisco:
+    """ Mede periodicamente o tamanho da pasta temporária e repassa o pico para as etapas em andamento. """
+
+    def __init__(self, pasta, intervalo=INTERVALO_AMOSTRAGEM_DISCO):
+        self.pasta = pasta
+        self.intervalo = intervalo
+        self.pico = 0
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="monitor_disco", daemon=True)
+
+    def _loop(self):
+        while not self._parar.is_set():
+            uso = _tamanho_pasta(self.pasta)
+            self.pico = max(self.pico, uso)
+            with _trava:
+                for registro in _ativos:
+                    registro["pico_disco_bytes"] = max(registro["pico_disco_bytes"], uso)
+            self._parar.wait(self.intervalo)
+
+    def iniciar(self):
+        self._thread.start()
+        return self
+
+    def parar(self):
+        self._parar.set()
+        self._thread.join()
+
+# --- Execução e etapas ---
+def iniciar_execucao():
+    """ Marca o início de uma execução e liga o perfilador, se configurado. """
+    global _id_execucao
+    _id_execucao = datetime.now().strftime("%Y%m%d_%H%M%S")
+    _perfis.clear()
+    if PERFIL == "tracemalloc":
+        import tracemalloc
+        tracemalloc.start(10)
+    return _id_execucao
+
+def finalizar_execucao(resumo=None):
+    """ Grava o resumo da execução e o resultado do perfilador. """
+    if resumo:
+        gravar_metrica(dict(resumo, tipo="execucao"))
+
+    if PERFIL == "cprofile" and _perfis:
+        import pstats
+        estatisticas = pstats.Stats(_perfis[0])
+        for perfil in _perfis[1:]:
+            estatisticas.add(perfil)
+        destino = os.path.join(pasta_logs(), f"perfil_{_id_execucao}.prof")
+        estatisticas.dump_stats(destino)
+        log.info(f"Perfil cProfile salvo em: {destino}")
+
+    if PERFIL == "tracemalloc":
+        import tracemalloc
+        if tracemalloc.is_tracing():
+            _, pico = tracemalloc.get_traced_memory()
+            maiores = tracemalloc.take_snapshot().statistics("lineno")[:10]
+            tracemalloc.stop()
+            gravar_metrica({
+                "tipo": "perfil_memoria",
+                "pico_memoria_bytes": pico,
+                "maiores_alocacoes": [{"local": str(s.traceback), "bytes": s.size} for s in maiores],
+            })
+
+@contextmanager
+def medir_etapa(base, etapa):
+    """
+    Mede uma etapa de uma base. O bloco pode preencher 'bytes_entrada' e
+    'bytes_saida' no registro devolvido; o resto é calculado aqui.
+    """
+    registro = {
+        "tipo": "etapa",
+        "base": base,
+        "etapa": etapa,
+        "bytes_entrada": None,
+        "bytes_saida": None,
+        "pico_disco_bytes": 0,
+    }
+    perfil = None
+    if PERFIL == "cprofile":
+        import cProfile
+        perfil = cProfile.Profile()
+        try:
+            perfil.enable()
+        except ValueError:
+            perfil = None  # Outro perfilador já ativo (Python 3.12+ permite só um por vez)
+
+    with _trava:
+        _ativos.append(registro)
+    inicio = time.perf_counter()
+    try:
+        yield registro
+        registro["status"] = "ok"
+    except Exception as e:
+        registro["status"] = "erro"
+        registro["erro"] = str(e)
+        raise
+    finally:
+        if perfil:
+            perfil.disable()
+            with _trava:
+                _perfis.append(perfil)
+        segundos = time.perf_counter() - inicio
+        with _trava:
+            _ativos.remove(registro)
+        registro["segundos"] = round(segundos, 3)
+        volume = registro["bytes_entrada"] or registro["bytes_saida"]
+        registro["throughput_mb_s"] = round(volume / (1024 * 1024) / segundos, 2) if volume and segundos > 0 else None
+        try:
+            gravar_metrica(registro)
+        except Exception:
+            log.warning("Não foi possível gravar as métricas da etapa", exc_info=True)
@@ -0,0 +1,273 @@
+import os
+import subprocess
+import tempfile
+
+from metadados import servidor_do_dsn, arquivo_do_dsn
+from log import configurar_logger
+
+log = configurar_logger()
+
+# =================================================================
+# MOTORES DE BACKUP/RESTORE
+# =================================================================
+# MOTOR_BACKUP no .env escolhe quem executa o backup e o restore:
+#   gbak     -> gbak.exe em subprocesso (padrão, comportamento original)
+#   servicos -> Services Manager do Firebird (fdb.services): o próprio servidor
+#               lê o banco e grava o .fbk, sem processo extra nem senha na linha
+#               de comando. Se o serviço não responder, cai para o gbak.exe.
+# Outros motores (ex: o simulado do benchmark) entram com @registrar_motor.
+#
+# Todo motor oferece:
+#   backup(dsn, destino, ao_progresso)          -> gera o .fbk
+#   restore(origem, destino, ao_progresso, somente_metadados) -> restaura o .fbk em um .FDB
+#   backup_para_stream(dsn, escrever)                         -> entrega os bytes do backup em blocos
+#   iniciar_restore_stream(destino, somente_metadados)        -> objeto com write()/finalizar()/abortar()
+# somente_metadados=True é o restore leve da política de validação (validacao.py).
+
+MOTOR_BACKUP = os.getenv("MOTOR_BACKUP", "gbak").lower()
+FB_USER = os.getenv("FB_USER")
+FB_PASS = os.getenv("FB_PASS")
+TAMANHO_BLOCO = 1024 * 1024
+PAGE_SIZE_RESTORE = 4096
+
+_MOTORES = {}
+
+def registrar_motor(nome):
+    """ Decorador que disponibiliza uma classe de motor para o MOTOR_BACKUP. """
+    def registrar(classe):
+        _MOTORES[nome] = classe
+        return classe
+    return registrar
+
+def criar_motor(gbak_path=None, nome=None):
+    """ Instancia o motor configurado. O gbak.exe é obrigatório só para o motor 'gbak'. """
+    nome = (nome or MOTOR_BACKUP).lower()
+    classe = _MOTORES.get(nome)
+    if classe is None:
+        raise Exception(f"MOTOR_BACKUP desconhecido: '{nome}' (opções: {', '.join(sorted(_MOTORES))})")
+    if classe is MotorGbak and not gbak_path:
+        raise Exception("gbak.exe não encontrado (verifique a instalação do Firebird ou GBAK_PATH no .env)")
+    log.info(f"Motor de backup: {nome}")
+    return classe(gbak_path)
+
+# --- GBAK em subprocesso ---
+def _startupinfo_oculto():
+    """ Configura o subprocess para rodar o GBAK sem abrir janela de CMD. """
+    if os.name != "nt":
+        return None # STARTUPINFO só existe no Windows (ex: benchmark com GBAK simulado)
+    si = subprocess.STARTUPINFO()
+    si.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    si.wShowWindow = subprocess.SW_HIDE
+    return si
+
+def _ler_saida_erro(arquivo_erro):
+    arquivo_erro.seek(0)
+    return arquivo_erro.read().decode("utf-8", errors="replace").strip()
+
+class _RestoreGbakStream:
+    """ 'gbak -r' lendo de stdin: recebe os mesmos blocos que vão para o arquivo compactado. """
+
+    def __init__(self, comando):
+        self._erro = tempfile.TemporaryFile()
+        self._proc = subprocess.Popen(comando, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                      stderr=self._erro, startupinfo=_startupinfo_oculto())
+
+    def write(self, bloco):
+        self._proc.stdin.write(bloco)
+
+    def finalizar(self):
+        try:
+            self._proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        codigo = self._proc.wait()
+        try:
+            if codigo != 0:
+                raise Exception(f"GBAK restore (streaming) falhou: {_ler_saida_erro(self._erro)}")
+        finally:
+            self._erro.close()
+
+    def abortar(self):
+        self._proc.kill()
+        try:
+            self._proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        self._proc.wait()
+        self._erro.close()
+
+@registrar_motor("gbak")
+class MotorGbak:
+    """ Executa o gbak.exe como processo separado (caminho original, também usado como reserva). """
+
+    def __init__(self, gbak_path):
+        self.gbak_path = gbak_path
+
+    def _executar(self, argumentos, acao):
+        with tempfile.TemporaryFile() as erro:
+            codigo = subprocess.run([self.gbak_path] + argumentos, stdout=subprocess.DEVNULL, stderr=erro,
+                                    startupinfo=_startupinfo_oculto()).returncode
+            if codigo != 0:
+                raise Exception(f"GBAK {acao} falhou (código {codigo}): {_ler_saida_erro(erro)}")
+
+    def backup(self, dsn, destino, ao_progresso=None):
+        self._executar(["-b", "-g", "-ig", "-l", "-user", FB_USER, "-password", FB_PASS, dsn, destino], "backup")
+
+    def restore(self, origem, destino, ao_progresso=None, somente_metadados=False):
+        self._executar(["-r"] + (["-m"] if somente_metadados else []) +
+                       ["-p", str(PAGE_SIZE_RESTORE), "-user", FB_USER, "-password", FB_PASS, origem, destino], "restore")
+
+    def backup_para_stream(self, dsn, escrever):
+        """ 'gbak -b ... stdout': repassa cada bloco lido para 'escrever'. """
+        with tempfile.TemporaryFile() as erro:
+            proc = subprocess.Popen(
+                [self.gbak_path, "-b", "-g", "-ig", "-l", "-user", FB_USER, "-password", FB_PASS, dsn, "stdout"],
+                stdout=subprocess.PIPE, stderr=erro, startupinfo=_startupinfo_oculto()
+            )
+            try:
+                while True:
+                    bloco = proc.stdout.read(TAMANHO_BLOCO)
+                    if not bloco:
+                        break
+                    escrever(bloco)
+            except BaseException:
+                proc.kill()  # Quem recebe os bytes falhou: não adianta continuar lendo o banco
+                raise
+            finally:
+                proc.stdout.close()
+                codigo = proc.wait()
+            if codigo != 0:
+                raise Exception(f"GBAK backup (streaming) falhou: {_ler_saida_erro(erro)}")
+
+    def iniciar_restore_stream(self, destino, somente_metadados=False):
+        return _RestoreGbakStream(
+            [self.gbak_path, "-r"] + (["-m"] if somente_metadados else []) +
+            ["-p", str(PAGE_SIZE_RESTORE), "-user", FB_USER, "-password", FB_PASS, "stdin", destino]
+        )
+
+# --- Services Manager (fdb.services) ---
+class _SaidaServico:
+    """ Recebe as linhas do serviço: repassa o progresso (vai para o log) e guarda as linhas de erro. """
+
+    def __init__(self, ao_progresso=None):
+        self.ao_progresso = ao_progresso
+        self.erros = []
+
+    def __call__(self, linha):
+        linha = linha.strip()
+        if not linha:
+            return
+        if "ERROR" in linha.upper():
+            self.erros.append(linha)
+        if self.ao_progresso:
+            self.ao_progresso(linha)
+        else:
+            log.debug(f"[servico] {linha}")
+
+    def verificar(self, acao):
+        if self.erros:
+            raise Exception(f"Serviço de {acao} falhou: {' | '.join(self.erros)}")
+
+class _RestoreServicoStream:
+    """
+    Restore via serviço no modo streaming, usado só quando não há gbak.exe.
+    O local_restore do fdb mede o tamanho do backup com tell()/seek() antes de
+    começar, o que não funciona num pipe: os blocos vão para um .fbk temporário
+    (ao lado do destino) e o restore roda quando o backup termina.
+    """
+
+    def __init__(self, conectar, destino, somente_metadados=False):
+        self._conectar = conectar
+        self.destino = destino
+        self.somente_metadados = somente_metadados
+        self._arquivo = tempfile.TemporaryFile(dir=os.path.dirname(destino) or None)
+
+    def write(self, bloco):
+        self._arquivo.write(bloco)
+
+    def finalizar(self):
+        try:
+            self._arquivo.seek(0)
+            servico = self._conectar("local")
+            try:
+                servico.local_restore(self._arquivo, self.destino, page_size=PAGE_SIZE_RESTORE,
+                                      metadata_only=int(self.somente_metadados))
+            finally:
+                servico.close()
+        except Exception as e:
+            raise Exception(f"Restore (serviço, streaming) falhou: {e}")
+        finally:
+            self._arquivo.close()
+
+    def abortar(self):
+        self._arquivo.close()
+
+@registrar_motor("servicos")
+class MotorServicos:
+    """
+    Backup/restore pelo Services Manager. O servidor Firebird grava os arquivos
+    diretamente, então a pasta backup_Restore precisa permitir escrita pela conta
+    do serviço do Firebird. Sem conexão com o serviço, usa o gbak.exe (se houver).
+    """
+
+    def __init__(self, gbak_path=None):
+        self.reserva = MotorGbak(gbak_path) if gbak_path else None
+
+    def _conectar(self, servidor):
+        import fdb.services # Carregado só quando o motor é usado
+        host = "" if servidor == "local" else servidor
+        return fdb.services.connect(host=host, user=FB_USER, password=FB_PASS)
+
+    def _servico_ou_reserva(self, servidor):
+        """ Conecta no serviço; se falhar e houver gbak.exe, devolve None para usar a reserva. """
+        try:
+            return self._conectar(servidor)
+        except Exception as e:
+            if self.reserva is None:
+                raise Exception(f"Não foi possível conectar no Services Manager ({servidor}): {e}")
+            log.warning(f"Services Manager indisponível ({servidor}): {e}. Usando gbak.exe.")
+            return None
+
+    def backup(self, dsn, destino, ao_progresso=None):
+        servico = self._servico_ou_reserva(servidor_do_dsn(dsn))
+        if servico is None:
+            return self.reserva.backup(dsn, destino, ao_progresso)
+        saida = _SaidaServico(ao_progresso)
+        try:
+            servico.backup(arquivo_do_dsn(dsn), os.path.abspath(destino), collect_garbage=0,
+                           ignore_checksums=1, ignore_limbo_transactions=1, callback=saida)
+        finally:
+            servico.close()
+        saida.verificar("backup")
+
+    def restore(self, origem, destino, ao_progresso=None, somente_metadados=False):
+        servico = self._servico_ou_reserva("local")
+        if servico is None:
+            return self.reserva.restore(origem, destino, ao_progresso, somente_metadados)
+        saida = _SaidaServico(ao_progresso)
+        try:
+            servico.restore(os.path.abspath(origem), os.path.abspath(destino), page_size=PAGE_SIZE_RESTORE,
+                            metadata_only=int(somente_metadados), callback=saida)
+        finally:
+            servico.close()
+        saida.verificar("restore")
+
+    def backup_para_stream(self, dsn, escrever):
+        servico = self._servico_ou_reserva(servidor_do_dsn(dsn))
+        if servico is None:
+            return self.reserva.backup_para_stream(dsn, escrever)
+
+        class _Destino:
+            write = staticmethod(escrever)
+
+        try:
+            servico.local_backup(arquivo_do_dsn(dsn), _Destino(), collect_garbage=0,
+                                 ignore_checksums=1, ignore_limbo_transactions=1)
+        finally:
+            servico.close()
+
+    def iniciar_restore_stream(self, destino, somente_metadados=False):
+        # Com gbak.exe, o 'gbak -r stdin' restaura enquanto os blocos chegam, sem arquivo temporário
+        if self.reserva is not None:
+            return self.reserva.iniciar_restore_stream(destino, somente_metadados)
+        return _RestoreServicoStream(self._conectar, os.path.abspath(destino), somente_metadados)
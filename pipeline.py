@@ -0,0 +1,93 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from log import configurar_logger
+
+log = configurar_logger()
+
+# =================================================================
+# PIPELINE DE ETAPAS COM POOL DE WORKERS POR ETAPA
+# =================================================================
+
+def executar_pipeline(itens, etapas, ao_concluir_etapa=None, ao_finalizar_item=None, max_em_andamento=None,
+                      ao_admitir=None):
+    """
+    Processa cada item passando por todas as etapas em sequência, mas permite que
+    itens diferentes estejam em etapas diferentes ao mesmo tempo
+    (ex: base N+1 no GBAK enquanto a base N compacta e a base N-1 sobe pro FTP).
+
+    itens: lista de contextos (um dict por base). A ordem da lista é a ordem de entrada.
+    etapas: lista de tuplas (nome, funcao, max_workers). 'funcao' recebe o contexto do item.
+    ao_concluir_etapa(item, nome_etapa): chamado a cada etapa concluída com sucesso.
+    ao_finalizar_item(item, erro): chamado uma única vez por item (erro=None se tudo deu certo).
+    max_em_andamento: limite de itens dentro do pipeline ao mesmo tempo, evitando
+                      acumular arquivos temporários entre etapas lentas.
+    ao_admitir(item): chamado na alimentação, antes do item entrar na primeira etapa.
+                      Pode esperar (ex: espaço em disco) sem prender nenhum worker das etapas;
+                      se levantar exceção, o item é finalizado com esse erro.
+    """
+    if not itens:
+        return
+
+    if not max_em_andamento:
+        max_em_andamento = sum(max(1, workers) for _, _, workers in etapas)
+
+    executores = [
+        ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix=f"etapa_{nome}")
+        for nome, _, workers in etapas
+    ]
+    vagas = threading.BoundedSemaphore(max_em_andamento)
+    pendentes = [len(itens)]
+    terminou = threading.Condition()
+
+    def finalizar(item, erro):
+        try:
+            if ao_finalizar_item:
+                ao_finalizar_item(item, erro)
+        except Exception:
+            log.error("Erro ao finalizar item do pipeline", exc_info=True)
+        finally:
+            vagas.release()
+            with terminou:
+                pendentes[0] -= 1
+                terminou.notify_all()
+
+    def agendar(item, indice):
+        if indice >= len(etapas):
+            finalizar(item, None)
+            return
+        _, funcao, _ = etapas[indice]
+        futuro = executores[indice].submit(funcao, item)
+        futuro.add_done_callback(lambda f: concluir(item, indice, f))
+
+    def concluir(item, indice, futuro):
+        erro = futuro.exception()
+        if erro is not None:
+            finalizar(item, erro)
+            return
+        try:
+            if ao_concluir_etapa:
+                ao_concluir_etapa(item, etapas[indice][0])
+        except Exception:
+            log.error("Erro no callback de etapa do pipeline", exc_info=True)
+        try:
+            agendar(item, indice + 1)
+        except Exception as e:
+            finalizar(item, e)
+
+    try:
+        # Alimenta a primeira etapa respeitando o limite de itens em andamento
+        for item in itens:
+            vagas.acquire()
+            try:
+                if ao_admitir:
+                    ao_admitir(item)
+                agendar(item, 0)
+            except Exception as e:
+                finalizar(item, e)
+
+        with terminou:
+            terminou.wait_for(lambda: pendentes[0] == 0)
+    finally:
+        for executor in executores:
+            executor.shutdown(wait=True)
@@ -0,0 +1,127 @@
+import os
+import shutil
+import threading
+
+from metadados import arquivo_do_dsn
+from configuracao import env_float
+from log import configurar_logger
+
+log = configurar_logger()
+
+# =================================================================
+# PLANEJAMENTO DA EXECUÇÃO (ordem das bases e espaço em disco)
+# =================================================================
+# Antes do pipeline começar, o tamanho de cada banco é lido e o espaço
+# temporário de cada etapa é estimado. Com isso:
+#   - as bases maiores entram primeiro (as pequenas preenchem o fim do pipeline);
+#   - uma base que nunca caberia no disco falha logo, com o motivo, em vez de
+#     quebrar no meio do GBAK depois de horas;
+#   - durante a execução cada base reserva o seu espaço e, se não houver folga,
+#     espera as outras liberarem (fica adiada em vez de encher o disco).
+#
+#   PLANEJAMENTO_ORDEM=maior|menor|original
+#   PLANEJAMENTO_MARGEM_MB=1024           -> espaço que sempre fica livre no disco
+#   PLANEJAMENTO_FATOR_FBK=1.0            -> tamanho do .fbk em relação ao banco
+#   PLANEJAMENTO_FATOR_COMPACTADO=0.5     -> tamanho do arquivo compactado em relação ao banco
+
+ORDEM = os.getenv("PLANEJAMENTO_ORDEM", "maior").lower()
+MARGEM_BYTES = env_float("PLANEJAMENTO_MARGEM_MB", 1024) * 1024 * 1024
+FATOR_FBK = env_float("PLANEJAMENTO_FATOR_FBK", 1.0)
+FATOR_COMPACTADO = env_float("PLANEJAMENTO_FATOR_COMPACTADO", 0.5)
+
+def _gb(valor):
+    return f"{valor / (1024 ** 3):.2f} GB"
+
+def tamanho_base(dsn):
+    """ Tamanho do arquivo do banco em bytes (None se o arquivo não está acessível nesta máquina). """
+    try:
+        return os.path.getsize(arquivo_do_dsn(dsn))
+    except OSError:
+        return None
+
+def espaco_por_etapa(tamanho, streaming=False, com_restore=True, restore_completo=True):
+    """
+    Quanto a base ocupa na pasta temporária durante cada etapa
+    (o que a etapa grava mais o que ainda não foi apagado da etapa anterior).
+    Sem restore completo (validação leve), o .FDB restaurado tem só os metadados
+    e o arquivo compactado é o do .fbk.
+    """
+    fbk = tamanho * FATOR_FBK
+    fdb = tamanho if restore_completo else 0
+    compactado = tamanho * FATOR_COMPACTADO
+    if streaming:
+        return {
+            "backup": compactado + (fdb if com_restore else 0),
+            "upload": compactado,
+        }
+    return {
+        "backup": fbk,
+        "restore": fbk + fdb,
+        "compactar": (fdb if restore_completo else fbk) + compactado,
+        "upload": compactado,
+    }
+
+class ReservaDisco:
+    """ Controla o espaço temporário reservado pelas bases em andamento. """
+
+    def __init__(self, disponivel):
+        self.disponivel = max(0, disponivel)
+        self._reservas = {}
+        self._condicao = threading.Condition()
+
+    def livre(self):
+        return self.disponivel - sum(self._reservas.values())
+
+    def reservar(self, chave, quantidade):
+        """ Espera até haver espaço para a base. Uma base sozinha sempre pode seguir. """
+        with self._condicao:
+            if quantidade > self.livre() and self._reservas:
+                log.info(f"Base {chave} aguardando espaço em disco ({_gb(quantidade)} necessários, {_gb(self.livre())} livres)...")
+            self._condicao.wait_for(lambda: quantidade <= self.livre() or not self._reservas)
+            self._reservas[chave] = quantidade
+
+    def liberar(self, chave):
+        with self._condicao:
+            if self._reservas.pop(chave, None) is not None:
+                self._condicao.notify_all()
+
+def planejar(contextos, pasta, streaming=False, com_restore=True, reservado=0):
+    """
+    Estima o espaço de cada base, ordena e separa as que não cabem no disco.
+    'reservado' sai do espaço livre antes de tudo (crescimento previsto do acervo local).
+    Preenche ctx['tamanho_banco'] e ctx['espaco_estimado'] em cada contexto
+    (ctx['validacao'] == 'leve' conta sem o .FDB restaurado).
+    Retorna (aceitos, recusados, reserva): recusados é uma lista de (ctx, motivo).
+    """
+    uso = shutil.disk_usage(pasta)
+    disponivel = uso.free - MARGEM_BYTES - reservado
+
+    aceitos, recusados = [], []
+    for ctx in contextos:
+        tamanho = tamanho_base(ctx["dsn"])
+        ctx["tamanho_banco"] = tamanho
+        # Base retomada: só contam as etapas que faltam, e o arquivo dela já está ocupando o disco
+        restore_completo = ctx.get("validacao") != "leve"
+        restantes = [espaco for etapa, espaco in espaco_por_etapa(tamanho or 0, streaming, com_restore, restore_completo).items()
+                     if etapa not in ctx.get("etapas_puladas", ())]
+        ctx["espaco_estimado"] = max(0, max(restantes, default=0) - ctx.get("bytes_retomados", 0)) if tamanho else 0
+        if tamanho is None:
+            log.warning(f"Tamanho da base {ctx['nome_base']} desconhecido (banco em outro servidor); sem reserva de espaço.")
+        if ctx["espaco_estimado"] > disponivel:
+            recusados.append((ctx, (
+                f"Espaço insuficiente em disco: a base precisa de ~{_gb(ctx['espaco_estimado'])} "
+                f"temporários e há {_gb(max(0, disponivel))} livres (além da margem de {_gb(MARGEM_BYTES)})."
+            )))
+        else:
+            aceitos.append(ctx)
+
+    if ORDEM in ("maior", "menor"):
+        aceitos.sort(key=lambda c: c["espaco_estimado"], reverse=(ORDEM == "maior"))
+
+    log.info(f"Planejamento: {len(aceitos)} base(s) na ordem '{ORDEM}', {len(recusados)} recusada(s); "
+             f"{_gb(max(0, disponivel))} disponíveis em {os.path.abspath(pasta)}"
+             f"{f' ({_gb(reservado)} reservados para o acervo)' if reservado else ''}")
+    for ctx in aceitos:
+        log.info(f"  {ctx['nome_base']}: banco {_gb(ctx['tamanho_banco'] or 0)}, temporários ~{_gb(ctx['espaco_estimado'])}")
+
+    return aceitos, recusados, ReservaDisco(disponivel)
@@ -0,0 +1,196 @@
+import statistics
+import threading
+import time
+from datetime import datetime, timedelta
+
+from estado_local import ler_estado, salvar_estado
+from log import configurar_logger
+
+log = configurar_logger()
+
+# =================================================================
+# PROGRESSO POR BYTES E PREVISÃO DE TÉRMINO
+# =================================================================
+# Cada etapa de cada base vale a mesma fatia da barra, como antes, mas a
+# etapa em andamento preenche a sua fatia conforme os bytes processados
+# (tamanho do .fbk/.FDB sendo gravado, bytes compactados, bytes enviados).
+# Uma única thread lê esses contadores 10 vezes por segundo e chama o callback
+# só quando algo mudou, então a interface recebe no máximo 10 atualizações/s.
+#
+# A previsão de término usa o histórico das últimas execuções de cada base
+# (ESTADO_BACKUP_MERCOSISTEM/historico_progresso.json): velocidade de cada
+# etapa em bytes do banco por segundo (ou só a duração, se o tamanho do banco
+# não é conhecido). Como as etapas rodam em pipeline, a previsão é o tempo da
+# etapa mais carregada (soma do que falta dividida pelos seus workers). Numa
+# etapa em andamento, depois dos primeiros 5%, vale a velocidade atual dela.
+
+INTERVALO_ATUALIZACAO = 0.1
+AMOSTRAS_HISTORICO = 5
+FRACAO_MINIMA_AO_VIVO = 0.05
+DIAS_HISTORICO = 90  # Bases sem execução há mais tempo saem do histórico
+ARQUIVO_HISTORICO = "historico_progresso"
+
+def formatar_eta(eta_segundos):
+    """ Texto curto da previsão de término (ex: '~1h05min'), ou '' sem histórico. """
+    if eta_segundos is None:
+        return ""
+    minutos = max(1, round(eta_segundos / 60))
+    if minutos < 60:
+        return f"~{minutos} min"
+    return f"~{minutos // 60}h{minutos % 60:02d}min"
+
+class Progresso:
+    """
+    Acompanha as etapas em andamento e repassa (valor, eta_segundos) para o callback.
+    medir(ctx, etapa) devolve (bytes feitos, bytes esperados) da etapa em andamento.
+    """
+
+    def __init__(self, callback, medir, etapas, total_etapas, streaming=False):
+        self.callback = callback
+        self.streaming = streaming
+        self.medir = medir
+        self.workers = {nome: max(1, workers) for nome, _, workers in etapas}
+        self.nomes_etapas = [nome for nome, _, _ in etapas]
+        self.total_etapas = total_etapas
+        self.historico = ler_estado(ARQUIVO_HISTORICO)
+        self._concluidas = 0
+        self._ativas = {}       # (dsn, etapa) -> (ctx, início)
+        self._pendentes = {}    # dsn -> ctx das bases que ainda estão no pipeline
+        self._feitas = {}       # dsn -> etapas já concluídas nesta execução
+        self._ultimo_valor = 0.0
+        self._ultimo_envio = None
+        self._trava = threading.Lock()
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="progresso", daemon=True)
+
+    def _chave(self, ctx, etapa):
+        """ Etapas do modo streaming e da validação leve têm tempos bem diferentes: histórico separado. """
+        chave = f"{etapa}:streaming" if self.streaming or ctx.get("streaming") else etapa
+        return f"{chave}:leve" if ctx.get("validacao") == "leve" else chave
+
+    # --- Registro do andamento (chamado pelas etapas e pelo pipeline) ---
+    def adicionar_bases(self, contextos):
+        with self._trava:
+            for ctx in contextos:
+                self._pendentes[ctx["dsn"]] = ctx
+                self._feitas[ctx["dsn"]] = set(ctx.get("etapas_puladas", ()))
+
+    def avancar(self, passos):
+        with self._trava:
+            self._concluidas += passos
+
+    def iniciar_etapa(self, ctx, etapa):
+        with self._trava:
+            self._ativas[(ctx["dsn"], etapa)] = (ctx, time.monotonic())
+
+    def encerrar_etapa(self, ctx, etapa, segundos=None):
+        """ Tira a etapa do andamento e, se ela terminou bem, guarda a velocidade no histórico. """
+        with self._trava:
+            self._ativas.pop((ctx["dsn"], etapa), None)
+            if segundos is None:
+                return
+            self._feitas.setdefault(ctx["dsn"], set()).add(etapa)
+            tamanho = ctx.get("tamanho_banco")
+            amostras = self.historico.setdefault(ctx["dsn"], {}).setdefault(self._chave(ctx, etapa), [])
+            amostras.append({
+                "segundos": round(segundos, 3),
+                "bytes_por_segundo": round(tamanho / segundos) if tamanho and segundos > 0 else None,
+                "em": datetime.now().isoformat(timespec="seconds"),
+            })
+            del amostras[:-AMOSTRAS_HISTORICO]
+
+    def finalizar_base(self, ctx):
+        with self._trava:
+            self._pendentes.pop(ctx["dsn"], None)
+
+    # --- Cálculo ---
+    def _fracao(self, ctx, etapa):
+        try:
+            feitos, esperados = self.medir(ctx, etapa)
+        except Exception:
+            return 0.0
+        if not esperados:
+            return 0.0
+        return min(0.99, feitos / esperados)  # Só a conclusão da etapa fecha a fatia
+
+    def _duracao_prevista(self, ctx, etapa):
+        """ Segundos que a etapa costuma levar para esta base (None = sem histórico). """
+        chave = self._chave(ctx, etapa)
+        amostras = self.historico.get(ctx["dsn"], {}).get(chave, [])
+        tamanho = ctx.get("tamanho_banco")
+        velocidades = [a["bytes_por_segundo"] for a in amostras if a.get("bytes_por_segundo")]
+        if tamanho and not velocidades:
+            # Base nova: usa a velocidade das outras bases na mesma etapa
+            velocidades = [a["bytes_por_segundo"] for etapas in self.historico.values()
+                           for a in etapas.get(chave, []) if a.get("bytes_por_segundo")]
+        if tamanho and velocidades:
+            return tamanho / statistics.median(velocidades)
+        if amostras:
+            return statistics.median(a["segundos"] for a in amostras)
+        return None
+
+    def _restante(self, ctx, etapa, ativa, agora):
+        """ Segundos que faltam para a etapa da base (None = sem como prever). """
+        if ativa is not None:
+            fracao, inicio = ativa
+            if fracao >= FRACAO_MINIMA_AO_VIVO:
+                return (agora - inicio) * (1 - fracao) / fracao
+        duracao = self._duracao_prevista(ctx, etapa)
+        if duracao is None:
+            return None
+        return duracao * (1 - (ativa[0] if ativa else 0.0))
+
+    def _calcular(self):
+        agora = time.monotonic()
+        with self._trava:
+            ativas = {chave: (self._fracao(ctx, chave[1]), inicio) for chave, (ctx, inicio) in self._ativas.items()}
+            valor = (self._concluidas + sum(f for f, _ in ativas.values())) / self.total_etapas if self.total_etapas else 1.0
+
+            restante = dict.fromkeys(self.nomes_etapas, 0.0)
+            for dsn, ctx in self._pendentes.items():
+                for etapa in self.nomes_etapas:
+                    if etapa in self._feitas.get(dsn, ()):
+                        continue
+                    segundos = self._restante(ctx, etapa, ativas.get((dsn, etapa)), agora)
+                    if segundos is None:
+                        return valor, None
+                    restante[etapa] += segundos
+        eta = max((segundos / self.workers[etapa] for etapa, segundos in restante.items()), default=0.0)
+        return valor, eta
+
+    # --- Envio para o callback ---
+    def _enviar(self, forcar=False):
+        valor, eta = self._calcular()
+        valor = min(1.0, max(valor, self._ultimo_valor))  # A barra nunca volta
+        envio = (round(valor, 3), None if eta is None else int(eta))
+        if envio == self._ultimo_envio and not forcar:
+            return
+        self._ultimo_valor = valor
+        self._ultimo_envio = envio
+        self.callback(valor, envio[1])
+
+    def _loop(self):
+        while not self._parar.wait(INTERVALO_ATUALIZACAO):
+            try:
+                self._enviar()
+            except Exception:
+                log.warning("Erro ao atualizar o progresso", exc_info=True)
+
+    def iniciar(self):
+        self._enviar(forcar=True)
+        self._thread.start()
+        return self
+
+    def parar(self):
+        """ Para as atualizações e grava o histórico de velocidades. """
+        self._parar.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        corte = (datetime.now() - timedelta(days=DIAS_HISTORICO)).isoformat(timespec="seconds")
+        with self._trava:
+            historico = {dsn: etapas for dsn, etapas in self.historico.items()
+                         if any(a["em"] >= corte for amostras in etapas.values() for a in amostras)}
+        try:
+            salvar_estado(ARQUIVO_HISTORICO, historico)
+        except OSError:
+            log.warning("Não foi possível gravar o histórico de progresso", exc_info=True)
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+
+from configuracao import env_float
+from log import configurar_logger
+
+log = configurar_logger()
+
+# =================================================================
+# RETOMADA DE BASES INTERROMPIDAS (checkpoint por etapa)
+# =================================================================
+# Ao fim de cada etapa, a base grava um manifesto em backup_Restore/checkpoints
+# com a etapa concluída e o arquivo gerado (caminho, tamanho, data). Se a
+# execução falhar depois (ex: upload caiu), a próxima execução confere se o
+# arquivo continua íntegro e segue da etapa seguinte, sem refazer GBAK/restore.
+# O arquivo é conferido pelo tamanho e pela data de modificação; o arquivo
+# compactado também pelo SHA-256 calculado na compactação.
+#
+#   RETOMADA_VALIDADE_HORAS=24 -> checkpoints mais antigos são descartados
+#                                 (melhor um backup novo do que enviar um velho),
+#                                 assim como os de bases que saíram da lista
+
+VALIDADE_HORAS = env_float("RETOMADA_VALIDADE_HORAS", 24)
+# Campos do contexto que permitem continuar a partir do checkpoint
+CAMPOS_CONTEXTO = ("cod_empresa", "fbk", "fdb_restore", "arquivo", "streaming", "compressao", "tamanho_mb",
+                   "validacao", "motivo_validacao", "transacao_atual",
+                   "transacao_ativa_mais_antiga")
+
+def _pasta(pasta_raiz):
+    pasta = os.path.join(pasta_raiz, "checkpoints")
+    os.makedirs(pasta, exist_ok=True)
+    return pasta
+
+def _caminho(pasta_raiz, dsn):
+    nome = os.path.basename(dsn.split(":")[-1])
+    return os.path.join(_pasta(pasta_raiz), f"{nome}_{hashlib.sha1(dsn.encode('utf-8')).hexdigest()[:8]}.json")
+
+def _artefato(ctx):
+    """ Arquivo que representa o trabalho feito até aqui (o mais avançado que ainda existe). """
+    for campo in ("arquivo", "fdb_restore", "fbk"):
+        caminho = ctx.get(campo)
+        if caminho and os.path.exists(caminho):
+            return caminho
+    return None
+
+def salvar_checkpoint(pasta_raiz, ctx, etapa):
+    """ Registra que a etapa terminou e qual arquivo ela deixou pronto para a próxima. """
+    artefato = _artefato(ctx)
+    if artefato is None:
+        return
+    stat = os.stat(artefato)
+    manifesto = {
+        "dsn": ctx["dsn"],
+        "etapa": etapa,
+        "artefato": artefato,
+        "bytes": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": ctx.get("sha256"),
+        "gravado_em": datetime.now().isoformat(timespec="seconds"),
+        "contexto": {campo: ctx[campo] for campo in CAMPOS_CONTEXTO if campo in ctx},
+    }
+    caminho = _caminho(pasta_raiz, ctx["dsn"])
+    with open(caminho + ".tmp", "w", encoding="utf-8") as arq:
+        json.dump(manifesto, arq, ensure_ascii=False, indent=2)
+    os.replace(caminho + ".tmp", caminho)
+
+def remover_checkpoint(pasta_raiz, dsn):
+    try:
+        os.remove(_caminho(pasta_raiz, dsn))
+    except FileNotFoundError:
+        pass
+
+def _sha256(caminho):
+    hash_arquivo = hashlib.sha256()
+    with open(caminho, "rb") as arq:
+        for bloco in iter(lambda: arq.read(1024 * 1024), b""):
+            hash_arquivo.update(bloco)
+    return hash_arquivo.hexdigest()
+
+def _expirado(manifesto):
+    idade = (datetime.now() - datetime.fromisoformat(manifesto["gravado_em"])).total_seconds() / 3600
+    if idade > VALIDADE_HORAS:
+        return f"checkpoint com {idade:.0f}h (validade {VALIDADE_HORAS:.0f}h)"
+    return None
+
+def _motivo_invalido(manifesto):
+    """ Por que o checkpoint não pode ser usado (None = pode retomar). """
+    expirado = _expirado(manifesto)
+    if expirado:
+        return expirado
+    try:
+        stat = os.stat(manifesto["artefato"])
+    except OSError:
+        return "arquivo do checkpoint não existe mais"
+    if stat.st_size != manifesto["bytes"] or stat.st_mtime_ns != manifesto["mtime_ns"]:
+        return "arquivo do checkpoint foi alterado"
+    # O SHA-256 guardado é o do arquivo compactado (o .fbk/.FDB fica só com tamanho e data)
+    if manifesto.get("sha256") and manifesto["artefato"] == manifesto["contexto"].get("arquivo"):
+        if _sha256(manifesto["artefato"]) != manifesto["sha256"]:
+            return "SHA-256 do arquivo compactado não confere"
+    return None
+
+def carregar_checkpoint(pasta_raiz, ctx, nomes_etapas):
+    """
+    Se houver checkpoint válido para a base, restaura no contexto os dados das etapas
+    já feitas e devolve o índice da primeira etapa a executar. Sem checkpoint, devolve 0.
+    Checkpoint inválido é descartado junto com o arquivo que ele apontava.
+    """
+    caminho = _caminho(pasta_raiz, ctx["dsn"])
+    try:
+        with open(caminho, "r", encoding="utf-8") as arq:
+            manifesto = json.load(arq)
+    except FileNotFoundError:
+        return 0
+    except (OSError, ValueError):
+        log.warning(f"Checkpoint ilegível para {ctx['nome_base']}, começando do zero.")
+        remover_checkpoint(pasta_raiz, ctx["dsn"])
+        return 0
+
+    motivo = _motivo_invalido(manifesto)
+    if motivo is None and manifesto["etapa"] not in nomes_etapas:
+        motivo = f"etapa desconhecida '{manifesto['etapa']}'"
+    if motivo:
+        log.info(f"Checkpoint de {ctx['nome_base']} descartado: {motivo}")
+        if os.path.exists(manifesto["artefato"]):
+            os.remove(manifesto["artefato"])
+        remover_checkpoint(pasta_raiz, ctx["dsn"])
+        return 0
+
+    ctx.update(manifesto["contexto"])
+    ctx["sha256"] = manifesto.get("sha256")
+    ctx["bytes_retomados"] = manifesto["bytes"]
+    proxima = nomes_etapas.index(manifesto["etapa"]) + 1
+    log.info(f"Retomando {ctx['nome_base']} após a etapa '{manifesto['etapa']}' "
+             f"({os.path.basename(manifesto['artefato'])}, {manifesto['bytes'] / (1024 * 1024):.2f} MB)")
+    return proxima
+
+def artefatos_em_uso(pasta_raiz, dsns=None):
+    """
+    Arquivos apontados por algum checkpoint (não devem ser apagados na limpeza).
+    Checkpoints vencidos ou de bases fora de 'dsns' (as desta execução) são apagados,
+    e os arquivos deles deixam de ser protegidos.
+    """
+    em_uso = set()
+    for nome in os.listdir(_pasta(pasta_raiz)):
+        if not nome.endswith(".json"):
+            continue
+        caminho = os.path.join(_pasta(pasta_raiz), nome)
+        try:
+            with open(caminho, "r", encoding="utf-8") as arq:
+                manifesto = json.load(arq)
+            motivo = _expirado(manifesto)
+            if motivo is None and dsns is not None and manifesto["dsn"] not in dsns:
+                motivo = "base fora da lista desta execução"
+            if motivo:
+                log.info(f"Checkpoint {nome} descartado: {motivo}")
+                os.remove(caminho)
+                continue
+            em_uso.add(os.path.abspath(manifesto["artefato"]))
+        except (OSError, ValueError, KeyError):
+            pass
+    return em_uso
+
+def limpar_orfaos(pasta_raiz, pastas, dsns=None):
+    """
+    Apaga arquivos temporários que nenhum checkpoint válido usa (sobras de etapas que
+    falharam no meio, ou de bases que saíram da lista). Roda antes do pipeline, sob a
+    trava de execução.
+    """
+    em_uso = artefatos_em_uso(pasta_raiz, dsns)
+    liberados = 0
+    for pasta in pastas:
+        if not os.path.isdir(pasta):
+            continue
+        for nome in os.listdir(pasta):
+            caminho = os.path.join(pasta, nome)
+            if os.path.isfile(caminho) and os.path.abspath(caminho) not in em_uso:
+                try:
+                    liberados += os.path.getsize(caminho)
+                    os.remove(caminho)
+                except OSError:
+                    pass
+    if liberados:
+        log.info(f"Temporários de execuções anteriores removidos: {liberados / (1024 * 1024):.2f} MB")
+    return liberados
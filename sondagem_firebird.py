@@ -0,0 +1,75 @@
+import os
+import socket
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from configuracao import env_float
+from log import configurar_logger
+from estado_local import ler_estado, salvar_estado
+
+log = configurar_logger()
+
+# =================================================================
+# SONDAGEM DE INSTÂNCIAS FIREBIRD (sem netstat, em paralelo)
+# =================================================================
+
+PORTAS_PADRAO = list(range(3050, 3060))
+TIMEOUT_TCP = env_float("FB_TIMEOUT_SONDAGEM", 0.5)
+
+def porta_em_cache():
+    """ Porta que funcionou na última execução (ou None). """
+    return ler_estado("porta_firebird").get("porta")
+
+def salvar_porta(porta):
+    salvar_estado("porta_firebird", {"porta": porta})
+
+def portas_candidatas():
+    """
+    Portas 3050-3059 + as configuradas em FB_PORTAS (ex: "3060,3090").
+    A porta que funcionou na última execução vem sempre primeiro.
+    """
+    extras = [int(p) for p in os.getenv("FB_PORTAS", "").replace(";", ",").split(",") if p.strip().isdigit()]
+    portas = []
+    for porta in [porta_em_cache()] + extras + PORTAS_PADRAO:
+        if porta and porta not in portas:
+            portas.append(porta)
+    return portas
+
+def _porta_aberta(host, porta, timeout):
+    try:
+        with socket.create_connection((host, porta), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+def sondar_portas(portas=None, host="localhost", timeout=TIMEOUT_TCP):
+    """ Testa todas as portas ao mesmo tempo com conexão TCP rápida e devolve as que estão escutando. """
+    portas = portas or portas_candidatas()
+    with ThreadPoolExecutor(max_workers=len(portas)) as executor:
+        abertas = list(executor.map(lambda p: _porta_aberta(host, p, timeout), portas))
+    return [porta for porta, aberta in zip(portas, abertas) if aberta]
+
+def primeira_que_funcionar(portas, tentativa):
+    """
+    Executa 'tentativa(porta)' em todas as portas em paralelo e devolve
+    (porta, resultado) da primeira que der certo, sem esperar as outras.
+    Se nenhuma funcionar, propaga o último erro.
+    """
+    if not portas:
+        raise Exception("Nenhuma instância Firebird ativa encontrada.")
+
+    executor = ThreadPoolExecutor(max_workers=len(portas), thread_name_prefix="sondagem_fb")
+    futuros = {executor.submit(tentativa, porta): porta for porta in portas}
+    ultimo_erro = None
+    try:
+        for futuro in as_completed(futuros):
+            porta = futuros[futuro]
+            try:
+                return porta, futuro.result()
+            except Exception as e:
+                ultimo_erro = e
+                log.error(f"Falha na porta {porta}: {e}")
+    finally:
+        # As tentativas que ainda estão em andamento terminam sozinhas em segundo plano
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    raise ultimo_erro
@@ -1,5 +1,6 @@
-from log_discord import enviar_log_discord
+from log_discord import enviar_log_discord, finalizar_notificacoes
 
 print("Tentando enviar teste...")
 enviar_log_discord("sucesso", "999", "Teste de conexão manual")
+finalizar_notificacoes()
 print("Verifique seu Discord!")
\ No newline at end of file
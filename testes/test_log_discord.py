@@ -0,0 +1,116 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# =================================================================
+# NOTIFICAÇÕES DO DISCORD CONTRA UM WEBHOOK LOCAL
+# =================================================================
+# Um http.server faz o papel do webhook: agrupamento dos cards numa única
+# mensagem, limite de esperas no HTTP 429 (o lote vai para o disco) e lote
+# guardado quando o fechamento esgota o tempo, reenviado na execução seguinte.
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import log
+_PASTA = tempfile.mkdtemp(prefix="teste_merco_")
+log.base_dir = lambda: _PASTA  # Estado e logs do teste fora da pasta do programa
+
+import log_discord
+from estado_local import ler_estado, salvar_estado
+
+class _Webhook(BaseHTTPRequestHandler):
+    modo = "ok"           # "ok" (204), "429" (retry_after curto) ou "preso" (segura a resposta)
+    liberar = threading.Event()
+    mensagens = []
+
+    def do_POST(self):
+        corpo = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if _Webhook.modo == "preso":
+            # Simula um envio que não termina a tempo (não conta como mensagem recebida)
+            _Webhook.liberar.wait(10)
+        else:
+            _Webhook.mensagens.append(corpo)
+        if _Webhook.modo == "429":
+            resposta = b'{"retry_after": 0.01}'
+            self.send_response(429)
+        else:
+            resposta = b""
+            self.send_response(204)
+        self.send_header("Content-Length", str(len(resposta)))
+        self.end_headers()
+        self.wfile.write(resposta)
+
+    def log_message(self, *args):
+        pass
+
+class TestNotificacoesDiscord(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.servidor = ThreadingHTTPServer(("127.0.0.1", 0), _Webhook)
+        threading.Thread(target=cls.servidor.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        _Webhook.liberar.set()
+        cls.servidor.shutdown()
+        cls.servidor.server_close()
+
+    def setUp(self):
+        self._originais = (log_discord.WEBHOOK_URL, log_discord.JANELA_AGRUPAMENTO)
+        log_discord.WEBHOOK_URL = f"http://127.0.0.1:{self.servidor.server_port}/"
+        log_discord.JANELA_AGRUPAMENTO = 0.2
+        salvar_estado(log_discord.ARQUIVO_PENDENTES, [])
+        _Webhook.modo = "ok"
+        _Webhook.mensagens = []
+
+    def tearDown(self):
+        _Webhook.liberar.set()
+        log_discord.WEBHOOK_URL, log_discord.JANELA_AGRUPAMENTO = self._originais
+
+    def _pendentes(self):
+        return ler_estado(log_discord.ARQUIVO_PENDENTES, [])
+
+    def _mensagens_enviadas(self):
+        return [campo["value"] for mensagem in _Webhook.mensagens for embed in mensagem["embeds"]
+                for campo in embed["fields"] if campo["name"] == "Mensagem"]
+
+    def test_cards_seguidos_vao_numa_mensagem(self):
+        for i in range(3):
+            log_discord.enviar_log_discord("sucesso", str(i), f"card {i}")
+        log_discord.finalizar_notificacoes(timeout=10)
+
+        self.assertEqual(len(_Webhook.mensagens), 1)
+        self.assertEqual(len(_Webhook.mensagens[0]["embeds"]), 3)
+        self.assertEqual(self._pendentes(), [])
+
+    def test_rate_limit_sem_fim_guarda_o_lote(self):
+        _Webhook.modo = "429"
+        log_discord.enviar_log_discord("erro", "1", "card limitado")
+        log_discord.finalizar_notificacoes(timeout=10)
+
+        # A primeira tentativa mais as esperas permitidas, depois o lote vai para o disco
+        self.assertEqual(len(_Webhook.mensagens), log_discord.ESPERAS_RATE_LIMIT + 1)
+        self.assertEqual(len(self._pendentes()), 1)
+
+    def test_fechamento_sem_tempo_guarda_e_reenvia(self):
+        _Webhook.modo = "preso"
+        _Webhook.liberar.clear()
+        log_discord.enviar_log_discord("sucesso", "1", "card em andamento")
+        log_discord.finalizar_notificacoes(timeout=1)
+
+        self.assertEqual(len(self._pendentes()), 1)
+
+        # Próxima execução: o card guardado sai junto com o novo
+        _Webhook.modo = "ok"
+        log_discord.enviar_log_discord("sucesso", "2", "card novo")
+        log_discord.finalizar_notificacoes(timeout=10)
+
+        self.assertCountEqual(self._mensagens_enviadas(), ["card em andamento", "card novo"])
+        self.assertEqual(self._pendentes(), [])
+
+if __name__ == "__main__":
+    unittest.main()
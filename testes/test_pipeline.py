@@ -0,0 +1,89 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+# =================================================================
+# PIPELINE COM RESERVA DE DISCO (base retomada + base nova)
+# =================================================================
+# Regressão: a reserva feita dentro do worker da primeira etapa executada
+# travava a execução. A base retomada (pula o backup) ocupava o único worker
+# de restore esperando o espaço reservado pela base nova, que por sua vez
+# esperava esse mesmo worker. A reserva agora acontece na alimentação (ao_admitir).
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import log
+_PASTA = tempfile.mkdtemp(prefix="teste_merco_")
+log.base_dir = lambda: _PASTA  # Logs do teste fora da pasta do programa
+
+from pipeline import executar_pipeline
+from planejamento import ReservaDisco
+
+class TestReservaNaAlimentacao(unittest.TestCase):
+
+    def _rodar(self, itens, reserva):
+        def etapa(nome):
+            def executar(item):
+                if nome in item["etapas_puladas"]:
+                    return
+                time.sleep(0.05)
+            return executar
+
+        etapas = [
+            ("backup", etapa("backup"), 2),
+            ("restore", etapa("restore"), 1),
+            ("compactar", etapa("compactar"), 1),
+            ("upload", etapa("upload"), 1),
+        ]
+        finalizados = []
+
+        def ao_finalizar(item, erro):
+            reserva.liberar(item["dsn"])
+            finalizados.append((item["dsn"], erro))
+
+        thread = threading.Thread(target=executar_pipeline, args=(itens, etapas), kwargs={
+            "ao_finalizar_item": ao_finalizar,
+            "ao_admitir": lambda item: reserva.reservar(item["dsn"], item["espaco_estimado"]),
+        }, daemon=True)
+        thread.start()
+        thread.join(10)
+        return thread.is_alive(), finalizados
+
+    def test_base_retomada_e_base_nova_com_pouco_espaco(self):
+        # Espaço para uma base por vez: a segunda espera a primeira liberar
+        reserva = ReservaDisco(10)
+        itens = [
+            {"dsn": "NOVA", "espaco_estimado": 8, "etapas_puladas": ()},
+            {"dsn": "RETOMADA", "espaco_estimado": 8, "etapas_puladas": ("backup",)},
+        ]
+        travado, finalizados = self._rodar(itens, reserva)
+        self.assertFalse(travado, "pipeline travou esperando espaço em disco")
+        self.assertEqual(sorted(finalizados), [("NOVA", None), ("RETOMADA", None)])
+
+    def test_retomada_primeiro(self):
+        reserva = ReservaDisco(10)
+        itens = [
+            {"dsn": "RETOMADA", "espaco_estimado": 8, "etapas_puladas": ("backup",)},
+            {"dsn": "NOVA", "espaco_estimado": 8, "etapas_puladas": ()},
+            {"dsn": "NOVA2", "espaco_estimado": 8, "etapas_puladas": ()},
+        ]
+        travado, finalizados = self._rodar(itens, reserva)
+        self.assertFalse(travado, "pipeline travou esperando espaço em disco")
+        self.assertEqual(len(finalizados), 3)
+        self.assertTrue(all(erro is None for _, erro in finalizados))
+
+    def test_erro_na_admissao_finaliza_a_base(self):
+        reserva = ReservaDisco(10)
+
+        def recusar(item, quantidade):
+            raise Exception("sem espaço")
+
+        reserva.reservar = lambda chave, quantidade: recusar(chave, quantidade)
+        travado, finalizados = self._rodar([{"dsn": "A", "espaco_estimado": 1, "etapas_puladas": ()}], reserva)
+        self.assertFalse(travado)
+        self.assertEqual(str(finalizados[0][1]), "sem espaço")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import threading
+from datetime import datetime
+
+from estado_local import ler_estado, salvar_estado
+from configuracao import env_float, env_int
+from log import configurar_logger
+
+log = configurar_logger()
+
+# =================================================================
+# POLÍTICA DE VALIDAÇÃO (restore completo ou verificação leve)
+# =================================================================
+# O restore completo do .fbk em um .FDB é a única prova de que o backup volta
+# inteiro, mas em bases grandes quase dobra o tempo e a gravação em disco.
+# Com a política, cada base alterna entre:
+#
+#   completa -> restore completo (como sempre foi) e envio do .FDB restaurado compactado
+#   leve     -> restore só dos metadados ('gbak -r -m'): confere que o .fbk abre e
+#               que a estrutura do banco está íntegra, sem regravar os dados;
+#               o arquivo enviado é o próprio .fbk compactado (bem menor)
+#
+#   VALIDACAO_COMPLETA_A_CADA=1   -> restore completo a cada N backups da base (1 = sempre)
+#   VALIDACAO_DIAS_SEMANA=6       -> dias com restore completo obrigatório (0=segunda ... 6=domingo)
+#   VALIDACAO_DIAS_MAXIMO=7       -> restore completo se o último tem mais que isso
+#
+# A primeira execução de cada base e a base que falhou na última validação
+# completa sempre fazem o restore completo.
+
+COMPLETA_A_CADA = max(1, env_int("VALIDACAO_COMPLETA_A_CADA", 1))
+DIAS_SEMANA = {int(dia) for dia in os.getenv("VALIDACAO_DIAS_SEMANA", "").replace(",", ";").split(";") if dia.strip().isdigit()}
+DIAS_MAXIMO = env_float("VALIDACAO_DIAS_MAXIMO", 7)
+ARQUIVO_ESTADO = "validacao_bases"
+COMPLETA = "completa"
+LEVE = "leve"
+
+_trava = threading.Lock()
+
+def escolher_validacao(dsn, agora=None):
+    """ Decide a validação da base nesta execução. Retorna (COMPLETA ou LEVE, motivo). """
+    if COMPLETA_A_CADA == 1:
+        return COMPLETA, "restore completo em todas as execuções"
+    anterior = ler_estado(ARQUIVO_ESTADO).get(dsn)
+    if not anterior or not anterior.get("ultimo_completo"):
+        return COMPLETA, "primeira validação da base"
+
+    agora = agora or datetime.now()
+    if agora.weekday() in DIAS_SEMANA:
+        return COMPLETA, "dia de restore completo (VALIDACAO_DIAS_SEMANA)"
+    dias = (agora - datetime.fromisoformat(anterior["ultimo_completo"])).total_seconds() / 86400
+    if dias >= DIAS_MAXIMO:
+        return COMPLETA, f"último restore completo há {dias:.0f} dia(s)"
+    leves = anterior.get("leves_desde_completo", 0)
+    if leves + 1 >= COMPLETA_A_CADA:
+        return COMPLETA, f"{leves} execução(ões) leve(s) desde o último restore completo"
+    return LEVE, f"restore completo em {COMPLETA_A_CADA - leves - 1} execução(ões) ou em {DIAS_MAXIMO - dias:.0f} dia(s)"
+
+def registrar_validacao(dsn, tipo):
+    """ Guarda o resultado da validação de um backup que terminou com sucesso. """
+    with _trava:
+        estado = ler_estado(ARQUIVO_ESTADO)
+        registro = estado.setdefault(dsn, {})
+        agora = datetime.now().isoformat(timespec="seconds")
+        if tipo == COMPLETA:
+            registro["ultimo_completo"] = agora
+            registro["leves_desde_completo"] = 0
+        else:
+            registro["leves_desde_completo"] = registro.get("leves_desde_completo", 0) + 1
+        registro["ultima_validacao"] = {"tipo": tipo, "em": agora}
+        salvar_estado(ARQUIVO_ESTADO, estado)